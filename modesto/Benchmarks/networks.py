@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Synthetic district heating networks of arbitrary size for the benchmarks
+"""
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from modesto.main import Modesto
+
+start_time = pd.Timestamp('20140101')
+
+SUPPLY = 343.15
+RETURN = 313.15
+
+# Candidate diameters of the pipes when the network is sized
+SIZING_DIAMETERS = [0, 50, 80, 100, 150, 200, 250, 300]
+
+
+def series(base, amplitude=0, period=24 * 3600, days=40):
+    """
+    Time series starting the day before start_time with a daily sine profile, at a 15 minute resolution
+
+    :param base: Mean value
+    :param amplitude: Amplitude of the sine
+    :param period: Period of the sine in seconds
+    :param days: Length of the series in days
+    :return: pd.Series
+    """
+    index = pd.date_range(start_time - pd.Timedelta(days=1), periods=days * 96, freq='900s')
+    seconds = (index - index[0]).total_seconds().values
+    return pd.Series(base + amplitude * np.sin(seconds / period * 2 * np.pi), index=index)
+
+
+def street_graph(n_buildings, buildings_per_street=4, building='BuildingFixed', storage_every=0, length=100):
+    """
+    Graph of a network with one producer, a main line of junctions and one street per junction. Every street has a
+    number of buildings connected to the junction through a service pipe.
+
+    :param n_buildings: Number of buildings
+    :param buildings_per_street: Number of buildings connected to every junction
+    :param building: Component type of the buildings
+    :param storage_every: A storage unit is added at every storage_every-th junction. 0 for no storage units.
+    :param length: Distance between neighbouring junctions in m
+    :return: nx.DiGraph
+    """
+    G = nx.DiGraph()
+    G.add_node('prod', x=0, y=0, z=0, comps={'plant': 'ProducerVariable'})
+
+    n_streets = -(-n_buildings // buildings_per_street)
+    previous = 'prod'
+    building_id = 0
+    for street in range(n_streets):
+        junction = 'j{}'.format(street)
+        comps = {}
+        if storage_every and (street + 1) % storage_every == 0:
+            comps['storage'] = 'StorageVariable'
+        G.add_node(junction, x=(street + 1) * length, y=0, z=0, comps=comps)
+        G.add_edge(previous, junction, name='main{}'.format(street))
+        previous = junction
+
+        for i in range(min(buildings_per_street, n_buildings - building_id)):
+            node = 'b{}'.format(building_id)
+            G.add_node(node, x=(street + 1) * length, y=(i + 1) * length / 4 * (-1) ** i, z=0,
+                       comps={'building': building})
+            G.add_edge(junction, node, name='service{}'.format(building_id))
+            building_id += 1
+
+    return G
+
+
+def build_model(n_buildings, pipe_model='ExtensivePipe', building=None, horizon=24 * 3600, time_step=3600,
+                storage_every=0, sizing=False, buildings_per_street=4, balances='node'):
+    """
+    Build a Modesto model of a street network with all parameters set
+
+    :param n_buildings: Number of buildings
+    :param pipe_model: 'ExtensivePipe' or 'NodeMethod'
+    :param building: Component type of the buildings: 'BuildingFixed' or 'RCmodel' for ExtensivePipe networks. For
+        NodeMethod networks, only 'FixedProfile' is supported. Default: 'BuildingFixed', 'FixedProfile' for NodeMethod.
+    :param horizon: Optimization horizon in seconds
+    :param time_step: Time step in seconds
+    :param storage_every: A storage unit is added at every storage_every-th junction (ExtensivePipe only)
+    :param sizing: If True, the diameters of the pipes are chosen by the optimization (ExtensivePipe only)
+    :param buildings_per_street: Number of buildings connected to every junction
+    :param balances: 'node' or 'network', see Modesto (ExtensivePipe only)
+    :return: Modesto object
+    """
+    if building is None:
+        building = 'FixedProfile' if pipe_model == 'NodeMethod' else 'BuildingFixed'
+    if pipe_model == 'NodeMethod' and (building != 'FixedProfile' or storage_every or sizing):
+        raise ValueError('NodeMethod networks only support FixedProfile buildings, without storage or sizing')
+
+    G = street_graph(n_buildings, buildings_per_street, building, storage_every)
+    optmodel = Modesto(pipe_model=pipe_model, graph=G, balances=balances)
+
+    zeros = series(0)
+    optmodel.change_params({'Te': series(278, 5),
+                            'Tg': series(283),
+                            'Q_sol_E': zeros, 'Q_sol_W': zeros, 'Q_sol_S': zeros, 'Q_sol_N': series(100, 100),
+                            'time_step': time_step,
+                            'horizon': horizon,
+                            'cost_elec': series(0.05, 0.02),
+                            'CO2_elec': series(0.2),
+                            'PEF_elec': series(2.2)})
+
+    buildings = [node for node in G.nodes if node.startswith('b')]
+    if pipe_model == 'NodeMethod':
+        _set_node_method_params(optmodel, G, buildings)
+    else:
+        _set_extensive_params(optmodel, G, buildings, building, sizing)
+
+    return optmodel
+
+
+def _building_mass_flow(i):
+    """
+    Mass flow rate to the i-th building of a temperature driven network (kg/s)
+    """
+    return series(0.5 + 0.1 * (i % 3), 0.2)
+
+
+def _set_extensive_params(optmodel, G, buildings, building, sizing):
+    for i, node in enumerate(buildings):
+        if building == 'RCmodel':
+            optmodel.change_params(_rc_params(), node=node, comp='building')
+        else:
+            optmodel.change_params({'temperature_supply': SUPPLY,
+                                    'temperature_return': RETURN,
+                                    'mult': 1,
+                                    'heat_profile': series(2e4 + 2e3 * (i % 5), 1e4),
+                                    'DHW_demand': series(0)}, node=node, comp='building')
+
+    for node in G.nodes:
+        if 'storage' in G.nodes[node]['comps']:
+            optmodel.change_params({'temperature_supply': SUPPLY,
+                                    'temperature_return': RETURN,
+                                    'mflo_max': 50,
+                                    'mflo_min': -50,
+                                    'volume': 200,
+                                    'heat_stor': 0,
+                                    'stor_type': 1,
+                                    'mflo_use': series(0),
+                                    'cost_inv': 1}, node=node, comp='storage')
+
+    optmodel.change_params({'delta_T': SUPPLY - RETURN,
+                            'efficiency': 0.95,
+                            'CO2': 0.178,
+                            'fuel_cost': series(0.03, 0.01),
+                            'Qmax': 1e5 * len(buildings),
+                            'ramp_cost': 0,
+                            'ramp': 1e5 * len(buildings),
+                            'cost_inv': 1}, node='prod', comp='plant')
+
+    for _, _, pipe in G.edges(data='name'):
+        pipe_params = {'temperature_supply': SUPPLY,
+                       'temperature_return': RETURN}
+        if sizing:
+            pipe_params['diameters'] = SIZING_DIAMETERS
+            pipe_params['investment_factor'] = 1e-3
+        else:
+            pipe_params['diameter'] = 300 if pipe.startswith('main') else 80
+        optmodel.change_params(pipe_params, comp=pipe)
+
+
+def _rc_params():
+    """
+    Parameters of a terraced house (RCmodel) with constant comfort bounds and internal gains
+    """
+    params = {'delta_T': SUPPLY - RETURN,
+              'mult': 1,
+              'model_type': 'SFH_T_5_ins_TAB',
+              'Q_int_D': series(200, 100),
+              'Q_int_N': series(100, 50),
+              'max_heat': 20000}
+    for zone, (low, high) in {'day': (19, 24), 'night': (16, 24), 'bathroom': (20, 26), 'floor': (16, 28)}.items():
+        params['{}_min_temperature'.format(zone)] = series(low + 273.15)
+        params['{}_max_temperature'.format(zone)] = series(high + 273.15)
+    for state in ['TiD0', 'TflD0', 'TwiD0', 'TwD0', 'TfiD0', 'TfiN0', 'TiN0', 'TwiN0', 'TwN0']:
+        params[state] = 20 + 273.15
+    return params
+
+
+def _set_node_method_params(optmodel, G, buildings):
+    flows = {node: _building_mass_flow(i) for i, node in enumerate(buildings)}
+    for node in buildings:
+        optmodel.change_params({'mult': 1,
+                                'heat_profile': flows[node] * 4180 * (SUPPLY - RETURN),
+                                'temperature_return': RETURN,
+                                'temperature_supply': SUPPLY,
+                                'temperature_max': 363.15,
+                                'temperature_min': 283.15,
+                                'mass_flow': -flows[node]}, node=node, comp='building')
+
+    history = pd.Series([1.] * 20, index=list(range(20)))
+    for start, end, pipe in G.edges(data='name'):
+        downstream = nx.descendants(G, end) | {end}
+        mass_flow = sum(flows[node] for node in downstream if node in flows)
+        optmodel.change_params({'diameter': 300 if pipe.startswith('main') else 80,
+                                'mass_flow_history': history,
+                                'temperature_history_return': history * RETURN,
+                                'temperature_history_supply': history * SUPPLY,
+                                'wall_temperature_supply': SUPPLY,
+                                'wall_temperature_return': RETURN,
+                                'temperature_out_supply': SUPPLY,
+                                'temperature_out_return': RETURN,
+                                'mass_flow': mass_flow}, comp=pipe)
+
+    optmodel.change_params({'efficiency': 3.5,
+                            'CO2': 0.178,
+                            'fuel_cost': series(0.03, 0.01),
+                            'Qmax': 1e5 * len(buildings),
+                            'temperature_supply': SUPPLY,
+                            'temperature_return': RETURN,
+                            'temperature_max': 363.15,
+                            'temperature_min': 323.15,
+                            'ramp': 1e5 * len(buildings),
+                            'ramp_cost': 0.01,
+                            'mass_flow': sum(flows.values()),
+                            'cost_inv': 1}, node='prod', comp='plant')
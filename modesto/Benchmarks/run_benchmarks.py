@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the build, compile, recompile and solve times and the memory use of modesto models of increasing size.
+
+Run all benchmarks of a suite and store the results as baseline::
+
+    python -m modesto.Benchmarks.run_benchmarks --suite small --save
+
+Later runs are compared with the stored baseline, a regression being a metric that exceeds the baseline by more than
+the tolerance::
+
+    python -m modesto.Benchmarks.run_benchmarks --suite small --compare
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from itertools import product
+
+import pandas as pd
+
+import modesto
+import modesto.instrumentation as ins
+from modesto.Benchmarks.networks import build_model, series, start_time
+
+logger = logging.getLogger('modesto.benchmarks')
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Metrics that are compared with the baseline with a relative tolerance
+TIMED = ['build_time', 'compile_time', 'update_time', 'recompile_time', 'solve_time', 'memory']
+# Metrics that should not change at all between runs with the same code
+EXACT = ins.STATISTICS
+
+# Networks (keyword arguments of build_model) and (horizon, time step) combinations of every suite
+NETWORKS = {
+    'tiny': [{'n_buildings': 4, 'storage_every': 1},
+             {'n_buildings': 4, 'pipe_model': 'NodeMethod'}],
+    'small': [{'n_buildings': n, 'storage_every': 2} for n in [4, 16, 64]] +
+             [{'n_buildings': n, 'pipe_model': 'NodeMethod'} for n in [4, 16, 64]] +
+             [{'n_buildings': n, 'building': 'RCmodel'} for n in [4, 16]] +
+             [{'n_buildings': n, 'sizing': True} for n in [4, 16]] +
+             [{'n_buildings': n, 'storage_every': 2, 'balances': 'network'} for n in [16, 64]],
+    'large': [{'n_buildings': n, 'storage_every': 4} for n in [64, 256, 1024]] +
+             [{'n_buildings': n, 'pipe_model': 'NodeMethod'} for n in [64, 256]] +
+             [{'n_buildings': n, 'building': 'RCmodel'} for n in [64, 256]] +
+             [{'n_buildings': n, 'sizing': True} for n in [16, 64]] +
+             [{'n_buildings': n, 'storage_every': 4, 'balances': 'network'} for n in [256, 1024]]
+}
+TIME_AXES = {
+    'tiny': [(6 * 3600, 3600)],
+    'small': [(24 * 3600, 3600), (24 * 3600, 900), (7 * 24 * 3600, 3600)],
+    'large': [(24 * 3600, 900), (7 * 24 * 3600, 3600), (7 * 24 * 3600, 900)]
+}
+
+
+def case_name(case):
+    """
+    :param case: dict with the keyword arguments of build_model
+    :return: Unique name of the benchmark case
+    """
+    return '{}-{}-n{}-h{}-dt{}{}{}{}'.format(case.get('pipe_model', 'ExtensivePipe'),
+                                           case.get('building') or 'default',
+                                           case['n_buildings'], case['horizon'], case['time_step'],
+                                           '-stor{}'.format(case['storage_every']) if case.get('storage_every') else '',
+                                           '-sizing' if case.get('sizing') else '',
+                                           '-netbal' if case.get('balances') == 'network' else '')
+
+
+def get_cases(suite='small'):
+    """
+    All cases of a benchmark suite: every network for every horizon and time step
+
+    :param suite: Name of the suite, see NETWORKS
+    :return: OrderedDict with the case names as keys and the keyword arguments of build_model as values
+    """
+    if suite not in NETWORKS:
+        raise KeyError('{} is not a benchmark suite. Choose from {}'.format(suite, sorted(NETWORKS)))
+    cases = OrderedDict()
+    for network, (horizon, time_step) in product(NETWORKS[suite], TIME_AXES[suite]):
+        case = dict(network, horizon=horizon, time_step=time_step)
+        cases[case_name(case)] = case
+    return cases
+
+
+def run_case(case, solver='auto', solve=True, memory=True, objective='cost', **solve_kwargs):
+    """
+    Run one benchmark case: build the model, compile it, update it after a parameter change, recompile it completely
+    and solve it
+
+    :param case: dict with the keyword arguments of build_model
+    :param solver: Solver name, see Modesto.solve. Default: the first available solver.
+    :param solve: If False, the model is not solved
+    :param memory: If True, the peak memory of building and compiling the model is measured in a separate run with
+        tracemalloc, which would slow down the timed run
+    :param objective: Name of the objective
+    :param solve_kwargs: Other arguments of Modesto.solve
+    :return: dict with the timings in seconds, the peak memory in MB, the solver status, the objective value and
+        the model statistics
+    """
+    result = OrderedDict()
+
+    start = time.perf_counter()
+    optmodel = build_model(**case)
+    result['build_time'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    optmodel.compile(start_time)
+    result['compile_time'] = time.perf_counter() - start
+
+    # Changed parameters of one component are only reloaded
+    optmodel.change_param('prod', 'plant', 'fuel_cost', series(0.033, 0.011))
+    start = time.perf_counter()
+    optmodel.compile(start_time)
+    result['update_time'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    optmodel.compile(start_time, recompile=True)
+    result['recompile_time'] = time.perf_counter() - start
+
+    result.update(ins.block_statistics(optmodel.model))
+
+    result['status'] = None
+    result['objective'] = None
+    result['solve_time'] = None
+    if solve:
+        optmodel.set_objective(objective)
+        start = time.perf_counter()
+        result['status'] = optmodel.solve(solver=solver, **solve_kwargs)
+        result['solve_time'] = time.perf_counter() - start
+        if result['status'] >= 0:
+            result['objective'] = optmodel.get_objective()
+
+    result['memory'] = peak_memory(case) if memory else None
+
+    return result
+
+
+def peak_memory(case):
+    """
+    Peak memory allocated by Python while building and compiling the model of a case
+
+    :param case: dict with the keyword arguments of build_model
+    :return: Peak memory in MB
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        optmodel = build_model(**case)
+        optmodel.compile(start_time)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started:
+            tracemalloc.stop()
+    return (peak - base) / 1e6
+
+
+def run_suite(suite='small', cases=None, repeat=1, **kwargs):
+    """
+    Run all cases of a benchmark suite
+
+    :param suite: Name of the suite, see get_cases
+    :param cases: List of names of the cases to run. If None, all cases of the suite are run.
+    :param repeat: Number of runs of every case. The timings are the minimum over all runs.
+    :param kwargs: Other arguments of run_case
+    :return: pd.DataFrame with the case names as index and the results of run_case as columns
+    """
+    all_cases = get_cases(suite)
+    if cases is None:
+        cases = list(all_cases)
+
+    results = OrderedDict()
+    for name in cases:
+        runs = [run_case(all_cases[name], **kwargs) for _ in range(repeat)]
+        result = runs[0]
+        for metric in TIMED:
+            measured = [run[metric] for run in runs if run[metric] is not None]
+            result[metric] = min(measured) if measured else None
+        results[name] = result
+        logger.info('{}: compiled in {:.3f} s, solved in {:.3f} s'.format(name, result['compile_time'],
+                                                                           result['solve_time'] or 0.))
+
+    return pd.DataFrame.from_dict(results, orient='index')
+
+
+def baseline_file(suite, path=None):
+    """
+    :param suite: Name of the suite
+    :param path: Directory of the baselines. Default: the baselines directory next to this file.
+    :return: File name of the baseline of a suite
+    """
+    return os.path.join(path or BASELINE_PATH, '{}.json'.format(suite))
+
+
+def save_baseline(results, suite, path=None):
+    """
+    Store benchmark results as the baseline of a suite, together with a description of the machine
+
+    :param results: pd.DataFrame returned by run_suite
+    :param suite: Name of the suite
+    :param path: Directory of the baselines
+    :return: File name of the baseline
+    """
+    fname = baseline_file(suite, path)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    data = {'machine': machine_info(),
+            'results': json.loads(results.to_json(orient='index'))}
+    with open(fname, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    return fname
+
+
+def load_baseline(suite, path=None):
+    """
+    Load the baseline of a suite
+
+    :param suite: Name of the suite
+    :param path: Directory of the baselines
+    :return: pd.DataFrame with the same layout as the results of run_suite
+    """
+    fname = baseline_file(suite, path)
+    if not os.path.isfile(fname):
+        raise IOError('No baseline stored for suite {} ({})'.format(suite, fname))
+    with open(fname) as f:
+        data = json.load(f)
+    if data['machine'] != machine_info():
+        logger.warning('The baseline of suite {} was recorded on another machine or environment: {}'.format(
+            suite, data['machine']))
+    return pd.DataFrame.from_dict(data['results'], orient='index')
+
+
+def compare(results, baseline, tolerance=0.25, min_time=0.05):
+    """
+    Compare benchmark results with a baseline
+
+    :param results: pd.DataFrame returned by run_suite
+    :param baseline: pd.DataFrame with the baseline results, see load_baseline
+    :param tolerance: Allowed relative increase of the timings and memory use
+    :param min_time: Timings shorter than this in the baseline (in seconds) are compared with this value instead,
+        since they are dominated by noise
+    :return: pd.DataFrame with one row per case and metric with the baseline value, the new value, their ratio and
+        whether it is a regression. Differences in the model statistics are always regressions.
+    """
+    rows = []
+    for name in results.index:
+        if name not in baseline.index:
+            logger.warning('Case {} is not in the baseline'.format(name))
+            continue
+        for metric in TIMED + EXACT:
+            if metric not in baseline.columns:
+                continue
+            old = baseline.loc[name, metric]
+            new = results.loc[name, metric]
+            if old is None or new is None or pd.isnull(old) or pd.isnull(new):
+                continue
+            if metric in EXACT:
+                ratio = new / old if old else float(new == old)
+                regression = new != old
+            else:
+                reference = max(old, min_time) if metric.endswith('time') else old
+                ratio = new / reference if reference else 1.
+                regression = ratio > 1 + tolerance
+            rows.append([name, metric, old, new, ratio, regression])
+
+    return pd.DataFrame(rows, columns=['case', 'metric', 'baseline', 'result', 'ratio', 'regression'])
+
+
+def machine_info():
+    """
+    :return: dict describing the machine and environment the benchmarks run on
+    """
+    import pyomo.version
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(),
+            'pyomo': pyomo.version.version,
+            'modesto': getattr(modesto, '__version__', None)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the modesto benchmarks')
+    parser.add_argument('--suite', default='small', choices=sorted(NETWORKS))
+    parser.add_argument('--cases', nargs='*', help='Names of the cases to run. Default: all cases of the suite.')
+    parser.add_argument('--solver', default='auto')
+    parser.add_argument('--no-solve', action='store_true', help='Only build and compile the models')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure the memory use')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--save', action='store_true', help='Store the results as baseline of the suite')
+    parser.add_argument('--compare', action='store_true', help='Compare the results with the baseline of the suite')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--baselines', default=None, help='Directory of the baselines')
+    parser.add_argument('--output', default=None, help='Write the results to this csv file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)-24s %(levelname)-8s %(message)s')
+    logging.getLogger('modesto').setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    results = run_suite(args.suite, cases=args.cases, repeat=args.repeat, solver=args.solver,
+                        solve=not args.no_solve, memory=not args.no_memory)
+    print(results.to_string())
+
+    if args.output is not None:
+        results.to_csv(args.output)
+    if args.save:
+        logger.info('Baseline written to {}'.format(save_baseline(results, args.suite, args.baselines)))
+    if args.compare:
+        comparison = compare(results, load_baseline(args.suite, args.baselines), tolerance=args.tolerance)
+        regressions = comparison[comparison['regression']]
+        if len(regressions) > 0:
+            print('Regressions:\n{}'.format(regressions.to_string()))
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
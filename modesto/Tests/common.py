@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Small networks shared by several test modules
+"""
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from pkg_resources import resource_filename
+
+import modesto.utils as ut
+from modesto.main import Modesto
+
+time_step = 900
+horizon = 24 * 3600
+start_time = pd.Timestamp('20140101')
+
+
+def series(base, amplitude=0):
+    index = pd.date_range('20131231', '20140105', freq='{}s'.format(time_step))
+    return pd.Series(index=index,
+                     data=base + amplitude * np.sin(np.arange(len(index)) / 100 * 2 * np.pi))
+
+
+def setup_graph():
+    G = nx.DiGraph()
+
+    G.add_node('prod', x=0, y=0, z=0, comps={'prod': 'ProducerVariable'})
+    G.add_node('cons', x=500, y=0, z=0, comps={'cons': 'BuildingFixed'})
+    G.add_node('stor', x=500, y=200, z=0, comps={'stor': 'StorageVariable'})
+
+    G.add_edge('prod', 'cons', name='pipe1')
+    G.add_edge('cons', 'stor', name='pipe2')
+
+    return G
+
+
+def setup_modesto():
+    optmodel = Modesto(pipe_model='ExtensivePipe', graph=setup_graph())
+    set_params(optmodel)
+
+    return optmodel
+
+
+def set_params(optmodel):
+    optmodel.change_params({'Te': series(278, 5),
+                            'Tg': series(283),
+                            'Q_sol_E': series(0),
+                            'Q_sol_W': series(0),
+                            'Q_sol_S': series(0),
+                            'Q_sol_N': series(0),
+                            'time_step': time_step,
+                            'horizon': horizon,
+                            'cost_elec': series(0.05, 0.02),
+                            'CO2_elec': series(0.2),
+                            'PEF_elec': series(2.2)})
+
+    optmodel.change_params({'temperature_supply': 343.15,
+                            'temperature_return': 313.15,
+                            'mult': 2,
+                            'heat_profile': series(2e4, 1e4),
+                            'DHW_demand': series(0)}, node='cons', comp='cons')
+
+    optmodel.change_params({'delta_T': 30,
+                            'efficiency': 0.95,
+                            'CO2': 0.178,
+                            'fuel_cost': series(0.03, 0.01),
+                            'Qmax': 2e5,
+                            'ramp_cost': 0,
+                            'ramp': 2e5,
+                            'cost_inv': 1}, node='prod', comp='prod')
+
+    optmodel.change_params({'temperature_supply': 343.15,
+                            'temperature_return': 313.15,
+                            'mflo_max': 100,
+                            'mflo_min': -100,
+                            'volume': 500,
+                            'heat_stor': 0,
+                            'stor_type': 1,
+                            'mflo_use': series(0),
+                            'cost_inv': 1}, node='stor', comp='stor')
+
+    for pipe in ['pipe1', 'pipe2']:
+        optmodel.change_params({'diameter': 150,
+                                'temperature_supply': 343.15,
+                                'temperature_return': 313.15}, comp=pipe)
+
+
+
+def setup_node_method(time_step=300, n_steps=24):
+    """
+    NodeMethod model of a producer feeding two buildings through a junction. The mass flow rates are set directly,
+    the flow to the second building stops halfway the horizon.
+
+    :param time_step: Time step (s)
+    :param n_steps: Number of time steps of the horizon
+    """
+    G = nx.DiGraph()
+    G.add_node('prod', x=0, y=0, z=0, comps={'plant': 'ProducerVariable'})
+    G.add_node('junction', x=1000, y=0, z=0, comps={})
+    G.add_node('cons1', x=1500, y=500, z=0, comps={'building': 'FixedProfile'})
+    G.add_node('cons2', x=1500, y=-500, z=0, comps={'building': 'FixedProfile'})
+    G.add_edge('prod', 'junction', name='main')
+    G.add_edge('junction', 'cons1', name='branch1')
+    G.add_edge('junction', 'cons2', name='branch2')
+
+    optmodel = Modesto(pipe_model='NodeMethod', graph=G)
+
+    index = pd.date_range(start_time, freq='{}s'.format(time_step), periods=n_steps * 2)
+    mf1 = pd.Series(2., index=index)
+    mf2 = pd.Series([1.] * (n_steps // 2) + [0.] * (len(index) - n_steps // 2), index=index)
+
+    t_amb = ut.read_time_data(path=resource_filename('modesto', 'Data/Weather'), name='extT.csv')
+    c_f = ut.read_time_data(path=resource_filename('modesto', 'Data/ElectricityPrices'),
+                            name='DAM_electricity_prices-2014_BE.csv')
+    elec_data = ut.read_time_data(resource_filename('modesto', 'Data'), name='ElectricityPrices/AvgPEF_CO2.csv')
+    zeros = pd.Series(0., index=t_amb.index)
+
+    optmodel.change_params({'Te': t_amb['Te'],
+                            'Tg': pd.Series(285.15, index=t_amb.index),
+                            'Q_sol_E': zeros, 'Q_sol_W': zeros, 'Q_sol_S': zeros, 'Q_sol_N': zeros,
+                            'time_step': time_step,
+                            'horizon': n_steps * time_step,
+                            'cost_elec': c_f['price_BE'],
+                            'PEF_elec': elec_data['AvgPEF'],
+                            'CO2_elec': elec_data['AvgCO2/kWh']})
+
+    for node, mf in [('cons1', mf1), ('cons2', mf2)]:
+        optmodel.change_params({'mult': 1,
+                                'heat_profile': mf * 4180 * 30,
+                                'temperature_return': 303.15,
+                                'temperature_supply': 333.15,
+                                'temperature_max': 363.15,
+                                'temperature_min': 283.15,
+                                'mass_flow': -mf}, node=node, comp='building')
+
+    history = pd.Series([10.] * 20, index=list(range(20)))
+    for pipe, mf, dn in [('main', mf1 + mf2, 100), ('branch1', mf1, 50), ('branch2', mf2, 50)]:
+        optmodel.change_params({'diameter': dn,
+                                'mass_flow_history': history,
+                                'temperature_history_return': history * 0 + 303.15,
+                                'temperature_history_supply': history * 0 + 333.15,
+                                'wall_temperature_supply': 333.15,
+                                'wall_temperature_return': 303.15,
+                                'temperature_out_supply': 333.15,
+                                'temperature_out_return': 303.15,
+                                'mass_flow': mf}, comp=pipe)
+
+    optmodel.change_params({'efficiency': 3.5,
+                            'CO2': 0.178,
+                            'fuel_cost': c_f['price_BE'],
+                            'Qmax': 2e6,
+                            'temperature_supply': 333.15,
+                            'temperature_return': 303.15,
+                            'temperature_max': 363.15,
+                            'temperature_min': 323.15,
+                            'ramp': 1e6 / 3600,
+                            'ramp_cost': 0.01,
+                            'mass_flow': mf1 + mf2,
+                            'cost_inv': 1}, node='prod', comp='plant')
+
+    return optmodel
@@ -238,8 +238,8 @@ def run(objtype):
     opt_for = setup_modesto(G_for, objtype)
     opt_rev = setup_modesto(G_rev, objtype)
 
-    res1 = opt_for.solve(tee=True, mipgap=0.000001, solver='gurobi')
-    res2 = opt_rev.solve(tee=True, mipgap=0.000001, solver='gurobi')
+    res1 = opt_for.solve(tee=True, mipgap=0.000001)
+    res2 = opt_rev.solve(tee=True, mipgap=0.000001)
 
     return opt_for, opt_rev
 
@@ -272,7 +272,7 @@ def test_heat_var_stor_en():
     gr = setup_graph_stor()
     opt = setup_modesto_with_stor(gr, objtype='energy')
 
-    res1 = opt.solve(tee=True, mipgap=0.01, solver='gurobi')
+    res1 = opt.solve(tee=True, mipgap=0.01)
 
     assert res1 == 0
 
@@ -281,7 +281,7 @@ def test_heat_var_stor_cost():
     gr = setup_graph_stor()
     opt = setup_modesto_with_stor(gr, objtype='cost')
 
-    res1 = opt.solve(tee=True, mipgap=0.01, solver='gurobi')
+    res1 = opt.solve(tee=True, mipgap=0.01)
 
     assert res1 == 0
 
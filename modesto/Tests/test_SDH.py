@@ -12,7 +12,7 @@ def test_case_base():
     model.compile(start_time=start_time)
     model.set_objective('cost')
     model.opt_settings(allow_flow_reversal=True)
-    assert model.solve(tee=True, mipgap=0.03, solver='gurobi', probe=False, timelim=15) == 0
+    assert model.solve(tee=True, mipgap=0.03, probe=False, timelim=15) == 0
 
 def test_case_future():
     from misc.SDH_Conference_TestCases.CaseFuture import setup_opt
@@ -21,7 +21,7 @@ def test_case_future():
     model.compile(start_time=start_time)
     model.set_objective('cost')
     model.opt_settings(allow_flow_reversal=True)
-    assert model.solve(tee=True, mipgap=0.03, solver='gurobi', probe=False, timelim=15) == 0
+    assert model.solve(tee=True, mipgap=0.03, probe=False, timelim=15) == 0
 
 if __name__ == '__main__':
     test_case_future()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Tests for the benchmark suite
+"""
+
+import pytest
+
+import modesto.solver as slv
+from modesto.Benchmarks import run_benchmarks as bm
+from modesto.Benchmarks.networks import street_graph
+
+
+def test_street_graph():
+    G = street_graph(10, buildings_per_street=4, storage_every=2)
+
+    assert len([node for node in G.nodes if node.startswith('b')]) == 10
+    assert [node for node in G.nodes if 'storage' in G.nodes[node]['comps']] == ['j1']
+    assert G.number_of_edges() == 3 + 10
+
+
+def test_cases():
+    cases = bm.get_cases('small')
+    assert len(cases) == len(bm.NETWORKS['small']) * len(bm.TIME_AXES['small'])
+    assert 'ExtensivePipe-default-n16-h86400-dt900-stor2' in cases
+
+    with pytest.raises(KeyError):
+        bm.get_cases('huge')
+
+
+@pytest.mark.skipif(not slv.make_session('auto').available(), reason='No solver available')
+def test_baseline(tmp_path):
+    results = bm.run_suite('tiny')
+    assert (results['status'] == 0).all()
+    assert (results['compile_time'] > 0).all()
+    assert (results['memory'] > 0).all()
+
+    bm.save_baseline(results, 'tiny', path=str(tmp_path))
+    baseline = bm.load_baseline('tiny', path=str(tmp_path))
+
+    comparison = bm.compare(results, baseline)
+    assert not comparison['regression'].any()
+
+    slower = results.copy()
+    slower['compile_time'] = baseline['compile_time'] * 2 + 1
+    slower['variables'] = baseline['variables'] + 1
+    regressions = bm.compare(slower, baseline)
+    regressions = regressions[regressions['regression']]
+    assert set(regressions['metric']) == {'compile_time', 'variables'}
+    assert len(regressions) == 2 * len(results)
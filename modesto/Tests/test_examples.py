@@ -53,7 +53,7 @@ def test_example_RCmodel():
     model = example_RCmodel.construct_model()
     model.compile('20140104')
     model.set_objective('energy')
-    assert model.solve(tee=True, mipgap=0.01, solver='gurobi') == 0
+    assert model.solve(tee=True, mipgap=0.01) == 0
 
 
 def test_recompilation_stor():
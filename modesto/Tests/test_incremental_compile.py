@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Tests for recompilation of only the components with changed parameters
+"""
+
+import pandas as pd
+import pytest
+from pyomo.core.base import value
+
+from modesto.Tests.common import series, setup_modesto, start_time, time_step
+
+
+def test_first_compile_builds_all():
+    optmodel = setup_modesto()
+    report = optmodel.compile(start_time)
+
+    assert report['mode'] == 'build'
+    assert set(report['refreshed']) == {'pipe1', 'pipe2', 'prod.prod', 'cons.cons', 'stor.stor'}
+    assert report['skipped'] == []
+
+
+def test_only_dirty_components_refreshed():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+
+    optmodel.change_param('cons', 'cons', 'mult', 3)
+    report = optmodel.compile(start_time)
+
+    assert report['mode'] == 'update'
+    assert report['refreshed'] == ['cons.cons']
+    assert 'pipe1' in report['skipped']
+
+    block = optmodel.get_component('cons', 'cons').block
+    assert value(block.mult) == 3
+    assert value(block.heat_flow[0]) == pytest.approx(3 * series(2e4, 1e4)[start_time])
+
+
+def test_nothing_changed():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+
+    report = optmodel.compile(start_time)
+    assert report['refreshed'] == []
+
+
+def test_new_start_time_refreshes_all():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+
+    report = optmodel.compile(start_time + pd.Timedelta(days=1))
+    assert len(report['refreshed']) == 5
+
+    block = optmodel.get_component('cons', 'cons').block
+    assert value(block.heat_flow[4]) == pytest.approx(
+        2 * series(2e4, 1e4)[start_time + pd.Timedelta(days=1, seconds=4 * time_step)])
+
+
+def test_shared_general_param():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+
+    optmodel.change_general_param('Te', series(270, 5))
+    report = optmodel.compile(start_time)
+
+    assert set(report['refreshed']) == {'pipe1', 'pipe2', 'stor.stor'}
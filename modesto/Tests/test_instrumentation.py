@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Tests for the phase timings and model statistics
+"""
+
+import logging
+
+from pyomo.core.base import ConcreteModel, Var, Constraint, Binary, Block
+from pyomo.core.base.block import BlockData
+
+from modesto.instrumentation import RunReport, CompileProfiler, block_statistics
+from modesto.Tests.common import setup_modesto, start_time
+
+original_add_component = BlockData.add_component
+
+
+def test_block_statistics():
+    model = ConcreteModel()
+    model.x = Var([0, 1, 2])
+    model.on = Var([0, 1], within=Binary)
+    model.c = Constraint(expr=model.x[0] + 2 * model.x[1] - model.on[0] <= 4)
+    model.sub = Block()
+    model.sub.y = Var()
+    model.sub.d = Constraint(expr=model.sub.y >= model.x[2])
+
+    assert block_statistics(model) == {'variables': 6, 'binaries': 2, 'integers': 0, 'constraints': 2,
+                                       'nonzeros': 5}
+    assert block_statistics(model, descend_into=False)['variables'] == 5
+
+
+def test_report_accumulates():
+    report = RunReport()
+    report.add_phase('solve', 1.)
+    report.add_phase('solve', 2.)
+    report.add_component('pipe1', 0.5)
+
+    assert report.to_dict()['phases'] == {'solve': {'time': 3., 'calls': 2}}
+    assert report.component_table().loc['pipe1', 'compile_time'] == 0.5
+
+    report.reset()
+    assert report.phase_times().empty
+
+
+def test_compile_report(caplog):
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    optmodel.change_param('cons', 'cons', 'mult', 3)
+    optmodel.compile(start_time)
+
+    with caplog.at_level(logging.INFO, logger='modesto.instrumentation'):
+        report = optmodel.get_run_report()
+    assert 'Phase timings' in caplog.text
+
+    phases = report.phase_times()
+    assert list(phases.index) == ['build', 'check_data', 'update_time', 'compile_components', 'objectives']
+    assert phases.loc['compile_components', 'calls'] == 2
+    assert phases.loc['update_time', 'calls'] == 1
+
+    table = report.component_table()
+    assert table.loc['cons.cons', 'compilations'] == 2
+    assert table.loc['pipe1', 'compilations'] == 1
+    assert table.loc['stor', 'compilations'] == 1  # Node balance
+    assert table.loc['pipe1', 'variables'] > 0
+    assert table.loc['model', 'constraints'] == 1
+
+
+def test_compile_profiler(tmpdir):
+    optmodel = setup_modesto()
+    profiler = CompileProfiler(allocations=False)
+    optmodel.compile(start_time, profiler=profiler)
+
+    assert BlockData.add_component is original_add_component
+
+    table = profiler.table().set_index(['class', 'block', 'component'])
+    state_eq = table.loc[('StorageVariable', 'stor.stor', 'state_eq')]
+    assert state_eq['indices'] == 96
+    assert state_eq['time'] > 0
+    assert state_eq['allocated'] == 0
+    assert ('Modesto', 'model', 'OBJ_COST') in table.index
+    assert any(cls == 'Node' and block == 'cons' for cls, block, _ in table.index)
+
+    fname = str(tmpdir.join('compile.folded'))
+    profiler.dump_folded(fname, metric='indices')
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == len(table)
+    assert 'StorageVariable;stor.stor;state_eq 96' in lines
+
+
+def test_compile_profiler_allocations():
+    profiler = CompileProfiler()
+    model = ConcreteModel()
+    with profiler.profile():
+        model.x = Var(range(1000))
+
+    assert profiler.records[('ConcreteModel', 'model', 'x')][2] > 0
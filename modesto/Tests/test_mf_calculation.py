@@ -3,6 +3,7 @@ import networkx as nx
 from modesto.mass_flow_calculation import MfCalculation
 import pandas as pd
 import numpy as np
+import pytest
 
 def make_graph():
     G = nx.DiGraph()
@@ -68,3 +69,42 @@ def test_mass_flow_calculation():
 
     if not flag:
         raise Exception('The mass flow calculation was incorrect')
+
+
+def test_mass_flow_frame():
+    n_steps = 20000
+    test = MfCalculation(make_graph(), horizon=n_steps * 300, time_step=300)
+    test.set_producer_component('plant')
+    test.set_producer_node('ThorPark')
+
+    index = pd.date_range('20140101', freq='300s', periods=n_steps)
+    demand = pd.Series(np.random.RandomState(0).uniform(0, 5, n_steps), index=index)
+    test.add_mf(node='waterscheiGarden', name='buildingD', mf_df=demand, dir='out')
+    test.add_mf(node='zwartbergNE', name='buildingD', mf_df=2 * demand, dir='out')
+
+    result = test.calculate_mf(as_frame=True)
+
+    assert list(result.columns) == ['bbThor', 'spWaterschei', 'spZwartbergNE', 'ThorPark.plant',
+                                    'waterscheiGarden.buildingD', 'zwartbergNE.buildingD']
+    assert (result.index == index).all()
+    np.testing.assert_allclose(result['bbThor'], 3 * demand)
+    np.testing.assert_allclose(result['spWaterschei'], demand)
+    np.testing.assert_allclose(result['spZwartbergNE'], 2 * demand)
+    np.testing.assert_allclose(result['ThorPark.plant'], 3 * demand)
+    np.testing.assert_allclose(test.get_edge_mf('bbThor'), 3 * demand)
+    np.testing.assert_allclose(test.get_comp_mf('ThorPark', 'plant'), 3 * demand)
+
+
+def test_mass_flow_meshed():
+    G = make_graph()
+    G.add_edge('waterscheiGarden', 'zwartbergNE', name='loop')
+    test = MfCalculation(G, horizon=10 * 300, time_step=300)
+    test.set_producer_component('plant')
+    test.set_producer_node('ThorPark')
+
+    demand = pd.Series(1., index=pd.date_range('20140101', freq='300s', periods=10))
+    test.add_mf(node='waterscheiGarden', name='buildingD', mf_df=demand, dir='out')
+    test.add_mf(node='zwartbergNE', name='buildingD', mf_df=demand, dir='out')
+
+    with pytest.raises(ValueError):
+        test.calculate_mf()
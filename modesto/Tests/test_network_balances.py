@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Tests for the balances of all nodes built at once from the incidence matrix of the network
+"""
+
+import networkx as nx
+import pytest
+from pyomo.core.base import value
+
+from modesto.Benchmarks.networks import build_model, series, start_time
+from modesto.main import Modesto
+
+
+def solved(optmodel):
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver='auto') == 0
+    return optmodel
+
+
+def test_incidence_matrix():
+    optmodel = build_model(4, balances='network')
+    incidence = optmodel.incidence_matrix().toarray()
+    nodes = optmodel.get_nodes()
+    edges = list(optmodel.graph.edges)
+
+    assert incidence.shape == (len(nodes), len(edges))
+    assert (incidence.sum(axis=0) == 0).all()
+    start, end = edges[0]
+    assert incidence[nodes.index(start), 0] == -1
+    assert incidence[nodes.index(end), 0] == 1
+    assert (incidence == nx.incidence_matrix(optmodel.graph, nodelist=nodes, edgelist=edges,
+                                             oriented=True).toarray()).all()
+
+
+def test_no_node_blocks():
+    optmodel = build_model(4, storage_every=1, balances='network')
+    optmodel.compile(start_time)
+
+    for node in optmodel.get_nodes():
+        assert optmodel.model.find_component(node) is None
+    assert len(optmodel.model.NODES) == len(optmodel.get_nodes())
+    assert len(optmodel.model.heat_bal) == len(optmodel.get_nodes()) * len(optmodel.components['prod'].TIME)
+
+
+@pytest.mark.parametrize('case', [{'n_buildings': 6, 'storage_every': 1},
+                                  {'n_buildings': 4, 'sizing': True}])
+def test_same_optimum(case):
+    node = solved(build_model(balances='node', **case))
+    network = solved(build_model(balances='network', **case))
+
+    assert network.get_objective() == pytest.approx(node.get_objective(), rel=1e-6)
+    assert list(network.get_result('mass_flow', comp='main0')) == \
+        pytest.approx(list(node.get_result('mass_flow', comp='main0')), abs=1e-5)
+
+
+def test_update_and_recompile():
+    node = solved(build_model(4, storage_every=1))
+    network = solved(build_model(4, storage_every=1, balances='network'))
+
+    for optmodel in [node, network]:
+        optmodel.change_param('b0', 'building', 'heat_profile', series(4e4, 1e4))
+        assert optmodel.compile(start_time)['mode'] == 'update'
+        assert optmodel.solve(solver='auto') == 0
+    assert network.get_objective() == pytest.approx(node.get_objective(), rel=1e-6)
+
+    network.compile(start_time, recompile=True)
+    network.set_objective('cost')
+    assert network.solve(solver='auto') == 0
+    assert network.get_objective() == pytest.approx(node.get_objective(), rel=1e-6)
+
+
+def test_node_results():
+    optmodel = solved(build_model(4, storage_every=1, balances='network'))
+
+    assert optmodel.components['j0'].block is None
+    assert len(optmodel.get_result('heat_stor', node='j0', comp='storage')) > 0
+    with pytest.raises(Exception, match='no optimization block'):
+        optmodel.get_result('ineq_heat_bal', comp='j0')
+
+    # Snapshots skip the nodes
+    optmodel.restore(optmodel.snapshot())
+    assert optmodel.solve(solver='auto') == 0
+
+
+def test_invalid_balances():
+    with pytest.raises(ValueError):
+        build_model(4, pipe_model='NodeMethod', balances='network')
+    with pytest.raises(ValueError):
+        Modesto(pipe_model='ExtensivePipe', graph=build_model(4).graph, balances='edge')
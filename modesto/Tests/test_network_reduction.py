@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Tests for the reduction of network graphs
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import modesto.solver as slv
+from modesto.main import Modesto
+from modesto.network_reduction import NetworkReduction
+from modesto.Tests.common import series, start_time, time_step, horizon
+
+
+# Diameters of the pipes that can be merged, see set_params
+pipe_keys = {'p0': 150, 'p1': 150, 'p2': 150}
+
+
+def setup_graph(diameters=None):
+    """
+    Producer feeding three buildings at the end of a chain of three pipes
+    """
+    G = nx.DiGraph()
+    G.add_node('prod', x=0, y=0, z=0, comps={'prod': 'ProducerVariable'})
+    for i, x in enumerate([100, 250, 400]):
+        G.add_node('n{}'.format(i), x=x, y=0, z=0, comps={})
+    G.add_edge('prod', 'n0', name='p0')
+    G.add_edge('n0', 'n1', name='p1')
+    G.add_edge('n1', 'n2', name='p2')
+    for j in range(3):
+        G.add_node('b{}'.format(j), x=400, y=10 * (j + 1), z=0, comps={'cons': 'BuildingFixed'})
+        G.add_edge('n2', 'b{}'.format(j), name='s{}'.format(j))
+    if diameters is not None:
+        for pipe, dn in diameters.items():
+            nx.set_edge_attributes(G, {edge: dn for edge in G.edges if G.edges[edge]['name'] == pipe}, 'diameter')
+    return G
+
+
+def set_params(change, dhw=0):
+    """
+    :param change: Function with the signature of Modesto.change_params
+    :param dhw: Domestic hot water demand of the last building (l/min)
+    """
+    change({'Te': series(278, 5), 'Tg': series(283), 'Q_sol_E': series(0), 'Q_sol_W': series(0),
+            'Q_sol_S': series(0), 'Q_sol_N': series(0), 'time_step': time_step, 'horizon': horizon,
+            'cost_elec': series(0.05, 0.02), 'CO2_elec': series(0.2), 'PEF_elec': series(2.2)})
+    for j in range(3):
+        change({'temperature_supply': 343.15, 'temperature_return': 313.15, 'mult': j + 1,
+                'heat_profile': series(2e4 + 5e3 * j, 1e4 * j), 'DHW_demand': series(dhw if j == 2 else 0)},
+               node='b{}'.format(j), comp='cons')
+    change({'delta_T': 30, 'efficiency': 0.95, 'CO2': 0.178, 'fuel_cost': series(0.03, 0.01), 'Qmax': 1e6,
+            'ramp_cost': 0, 'ramp': 1e6, 'cost_inv': 1}, node='prod', comp='prod')
+    for pipe in ['p0', 'p1', 'p2', 's0', 's1', 's2']:
+        change({'diameter': 150, 'temperature_supply': 343.15, 'temperature_return': 313.15}, comp=pipe)
+
+
+def test_reduced_graph():
+    reduction = NetworkReduction(setup_graph(), pipe_keys=pipe_keys)
+
+    assert reduction.summary() == {'nodes': (7, 2), 'pipes': (6, 1), 'components': (4, 2)}
+    assert list(reduction.graph.edges(data='length')) == [('prod', 'n2', 400.)]
+    assert reduction.graph.nodes['n2']['comps'] == {'leaves0': 'BuildingFixed'}
+    assert reduction.groups['n2', 'leaves0'] == [('b0', 'cons'), ('b1', 'cons'), ('b2', 'cons')]
+    assert [pipe for pipe, _, _ in reduction.chains['p0']] == ['p0', 'p1', 'p2']
+    assert reduction.node_map['n1'] is None
+    assert reduction.node_map['b1'] == 'n2'
+    assert reduction.reduced_component(None, 'p2') == (None, 'p0')
+    with pytest.raises(KeyError):
+        reduction.reduced_component(None, 's0')
+
+    # The original graph is not changed
+    assert setup_graph().nodes['n2'] == {'x': 400, 'y': 0, 'z': 0, 'comps': {}}
+
+
+def test_different_diameters_not_merged():
+    reduction = NetworkReduction(setup_graph({'p0': 200, 'p1': 200, 'p2': 150}), aggregate_leaves=False)
+    assert sorted(reduction.graph.edges(data='name')) == sorted(
+        [('prod', 'n1', 'p0'), ('n1', 'n2', 'p2')] + [('n2', 'b{}'.format(j), 's{}'.format(j)) for j in range(3)])
+
+    reduction = NetworkReduction(setup_graph(), merge_series=False, keep=['b1'])
+    assert sorted(reduction.graph.nodes) == ['b1', 'n0', 'n1', 'n2', 'prod']
+
+    # Pipes of which the diameter is not known are not merged
+    reduction = NetworkReduction(setup_graph(), pipe_keys={'p0': 150, 'p1': 150})
+    assert sorted(reduction.graph.edges(data='name')) == [('n1', 'n2', 'p2'), ('prod', 'n1', 'p0')]
+    reduction = NetworkReduction(setup_graph())
+    assert reduction.summary()['pipes'] == (6, 3)
+
+
+def test_conflicting_params():
+    reduction = NetworkReduction(setup_graph(), pipe_keys=pipe_keys)
+    optmodel = Modesto(pipe_model='ExtensivePipe', graph=reduction.graph)
+    reduction.change_params(optmodel, {'diameter': 150}, comp='p0')
+    with pytest.raises(ValueError):
+        reduction.change_params(optmodel, {'diameter': 200}, comp='p1')
+
+
+@pytest.mark.skipif(not slv.make_session('auto').available(), reason='No solver available')
+def test_expanded_results():
+    full = Modesto(pipe_model='ExtensivePipe', graph=setup_graph())
+    set_params(full.change_params)
+    full.compile(start_time)
+    full.set_objective('cost')
+    assert full.solve(solver='auto') == 0
+
+    reduction = NetworkReduction(setup_graph(), pipe_keys=pipe_keys)
+    reduced = Modesto(pipe_model='ExtensivePipe', graph=reduction.graph)
+    set_params(lambda dict, node=None, comp=None: reduction.change_params(reduced, dict, node, comp))
+    reduced.compile(start_time)
+    reduced.set_objective('cost')
+    assert reduced.solve(solver='auto') == 0
+
+    # Only the losses of the service pipes are neglected
+    assert reduced.get_objective() == pytest.approx(full.get_objective(), rel=1e-3)
+
+    for j in range(3):
+        result = reduction.get_result(reduced, 'heat_flow', 'b{}'.format(j), 'cons')
+        assert result.name == 'b{}.cons.heat_flow'.format(j)
+        np.testing.assert_allclose(result, full.get_result('heat_flow', 'b{}'.format(j), 'cons'))
+        np.testing.assert_allclose(reduction.get_result(reduced, 'mass_flow', None, 's{}'.format(j)),
+                                   full.get_result('mass_flow', None, 's{}'.format(j)), atol=1e-9)
+
+    for pipe in ['p0', 'p1', 'p2']:
+        for name in ['mass_flow', 'heat_loss_tot']:
+            np.testing.assert_allclose(reduction.get_result(reduced, name, None, pipe),
+                                       full.get_result(name, None, pipe), atol=1e-6)
+    np.testing.assert_allclose(reduction.get_result(reduced, 'heat_flow_out', None, 'p1'),
+                               reduction.get_result(reduced, 'heat_flow_in', None, 'p2'))
+
+
+@pytest.mark.skipif(not slv.make_session('auto').available(), reason='No solver available')
+def test_reduction_in_modesto():
+    full = Modesto(pipe_model='ExtensivePipe', graph=setup_graph())
+    set_params(full.change_params, dhw=10)
+    full.compile(start_time)
+    full.set_objective('cost')
+    assert full.solve(solver='auto') == 0
+
+    # The model is built from the reduced graph, but takes the names of the original network
+    reduced = Modesto(pipe_model='ExtensivePipe', graph=setup_graph(), reduction={'pipe_keys': pipe_keys})
+    assert reduced.reduction.summary() == {'nodes': (7, 2), 'pipes': (6, 1), 'components': (4, 2)}
+    assert sorted(reduced.components) == ['n2', 'n2.leaves0', 'p0', 'prod', 'prod.prod']
+    set_params(reduced.change_params, dhw=10)
+    reduced.compile(start_time)
+    reduced.set_objective('cost')
+    assert reduced.solve(solver='auto') == 0
+    assert reduced.get_objective() == pytest.approx(full.get_objective(), rel=1e-3)
+
+    # The results of the aggregate are split according to space heating and domestic hot water demand
+    for j in range(3):
+        np.testing.assert_allclose(reduced.get_result('heat_flow', 'b{}'.format(j), 'cons'),
+                                   full.get_result('heat_flow', 'b{}'.format(j), 'cons'))
+    np.testing.assert_allclose(reduced.get_result('mass_flow', None, 'p1'), full.get_result('mass_flow', None, 'p1'),
+                               atol=1e-6)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Tests for temperature driven (NodeMethod) models
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modesto.pipe import history_window, plug_flow_indices
+from modesto.Tests.common import setup_node_method
+
+start_time = pd.Timestamp('20140101')
+time_step = 300
+n_steps = 24
+
+
+def test_flow_direction():
+    optmodel = setup_node_method()
+    optmodel.compile(start_time)
+
+    junction = optmodel.components['junction'].get_flow_direction()
+    assert list(junction.columns) == ['main', 'branch1', 'branch2']
+    assert (junction['main'] == 1).all()
+    assert (junction['branch1'] == -1).all()
+    np.testing.assert_array_equal(junction['branch2'], [-1] * (n_steps // 2) + [1] * (n_steps // 2))
+
+    cons2 = optmodel.components['cons2']
+    np.testing.assert_array_equal(cons2.flow_direction, np.where(cons2.flow_mflo >= 0, 1, -1))
+    np.testing.assert_array_equal(cons2.get_flow_direction()['branch2'], [1] * n_steps)
+
+
+def plug_flow_loop(mass_flow, mass_flow_history, time_step, mass):
+    """
+    Reference implementation of the plug flow quantities, summing over the history for every time step
+    """
+    n_steps = len(mass_flow)
+    mf_history = list(mass_flow[::-1]) + list(mass_flow_history)
+    result = {'n': [], 'm': [], 'R': [], 'S': [], 'tk': []}
+
+    def first_exceeding(t, target):
+        sum_m = 0
+        for i in range(len(mf_history) - (n_steps - 1 - t)):
+            sum_m += mf_history[n_steps - 1 - t + i] * time_step
+            if sum_m > target:
+                return i
+        return i
+
+    for t in range(n_steps):
+        start = n_steps - 1 - t
+        n = first_exceeding(t, mass)
+        m = first_exceeding(t, mass + mass_flow[t] * time_step)
+        R = sum(mf_history[i] for i in range(start, start + n + 1)) * time_step
+        if m > n:
+            S = sum(mf_history[i] * time_step for i in range(start, start + m))
+        else:
+            S = R
+        if mass_flow[t] == 0:
+            tk = np.nan
+        else:
+            tk = time_step * ((R - mass) * n
+                              + sum(mf_history[start + i] * time_step * i for i in range(n + 1, m))
+                              + (mass_flow[t] * time_step - S + mass) * m) / mass_flow[t] / time_step
+        for key, val in zip(['n', 'm', 'R', 'S', 'tk'], [n, m, R, S, tk]):
+            result[key].append(val)
+
+    return result
+
+
+def test_plug_flow_indices():
+    rng = np.random.RandomState(0)
+    mass_flow = rng.uniform(0, 5, 200)
+    mass_flow[[3, 50, 51]] = 0
+    history = rng.uniform(0, 5, 300)
+
+    for mass in [10., 2000., 40000.]:
+        expected = plug_flow_loop(mass_flow, history, 300, mass)
+        result = plug_flow_indices(mass_flow, history, 300, mass)
+
+        np.testing.assert_array_equal(result['n'], expected['n'])
+        np.testing.assert_array_equal(result['m'], expected['m'])
+        for key in ['R', 'S', 'tk']:
+            np.testing.assert_allclose(result[key], expected[key], rtol=1e-9)
+
+
+def test_plug_flow_indices_short_history():
+    mass_flow = np.array([1., 2., 0.5])
+    expected = plug_flow_loop(mass_flow, [1.], 60, 1000.)
+    result = plug_flow_indices(mass_flow, [1.], 60, 1000.)
+
+    assert not result['found_n'].any()
+    np.testing.assert_array_equal(result['n'], expected['n'])
+    np.testing.assert_array_equal(result['m'], expected['m'])
+    np.testing.assert_allclose(result['tk'], expected['tk'])
+
+
+def test_history_window():
+    rng = np.random.RandomState(1)
+    mass_flow = rng.uniform(0, 5, 50)
+    history = rng.uniform(0, 5, 1000)
+
+    full = plug_flow_indices(mass_flow, history, 300, 2000.)
+    window = history_window(full, len(mass_flow))
+    assert 1 <= window < len(history)
+
+    truncated = plug_flow_indices(mass_flow, history[:window], 300, 2000.)
+    assert truncated['found_m'].all()
+    for key in ['n', 'm', 'R', 'S', 'tk']:
+        np.testing.assert_array_equal(truncated[key], full[key])
+
+    # A history that is too short is used completely
+    short = plug_flow_indices(mass_flow, history[:3], 300, 2000.)
+    assert history_window(short, len(mass_flow)) == 3
+
+    # With a reverse mass flow rate, n exceeds m
+    reverse = plug_flow_indices(np.array([-1.]), np.ones(50), 1., 10.)
+    assert reverse['n'][0] > reverse['m'][0]
+    assert history_window(reverse, 1) == reverse['n'][0]
+
+    mixed = rng.uniform(-2, 5, 50)
+    full = plug_flow_indices(mixed, history, 300, 2000.)
+    window = history_window(full, len(mixed))
+    assert (np.arange(50)[::-1] + full['n'] < len(mixed) + window).all()
+    truncated = plug_flow_indices(mixed, history[:window], 300, 2000.)
+    for key in ['n', 'm', 'R', 'S', 'tk']:
+        np.testing.assert_array_equal(truncated[key], full[key])
+
+
+def test_long_history_truncated():
+    from modesto.Benchmarks.networks import build_model
+    from modesto.Benchmarks.networks import start_time as benchmark_start
+
+    objectives = []
+    for length in [20, 5000]:
+        optmodel = build_model(4, pipe_model='NodeMethod', horizon=6 * 3600, time_step=900)
+        history = pd.Series([1.] * length, index=list(range(length)))
+        for pipe in optmodel.get_edges():
+            optmodel.change_params({'mass_flow_history': history,
+                                    'temperature_history_return': history * 313.15,
+                                    'temperature_history_supply': history * 343.15}, comp=pipe)
+        optmodel.compile(benchmark_start)
+        optmodel.set_objective('cost')
+        assert optmodel.solve(solver='auto') == 0
+        objectives.append(optmodel.get_objective())
+
+        # Only the part of the history that leaves the pipe within the horizon is modelled
+        for pipe in optmodel.get_edges():
+            pipe_obj = optmodel.components[pipe]
+            block = pipe_obj.block
+            assert pipe_obj.history_length < 20
+            assert len(block.all_time) == pipe_obj.history_length + 24
+            assert len(block.temperatures) == len(block.def_temp_history) == 2 * (pipe_obj.history_length + 24)
+            for name in ['temperature_in', 'temperature_out', 'temperature_out_nhc', 'temperature_out_nhl']:
+                assert len(block.component(name)) == 2 * 24
+
+    assert objectives[1] == pytest.approx(objectives[0], rel=1e-9)
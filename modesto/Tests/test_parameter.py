@@ -2,11 +2,12 @@
 """
 Description
 """
+import numpy as np
 import pandas as pd
 from pkg_resources import resource_filename
 
 from modesto import utils
-from modesto.parameter import SeriesParameter
+from modesto.parameter import SeriesParameter, TimeSeriesParameter
 
 
 def test_extrapolate_down():
@@ -35,6 +36,21 @@ def set_up_series_param():
     return param
 
 
+def test_series_array():
+    param = set_up_series_param()
+    np.testing.assert_allclose(param.v(np.array([-1, 0.5, 1, 1.5])), [-1, 0.5, 1, 1.5])
+
+
+def test_series_change_value():
+    param = set_up_series_param()
+    param.change_value(pd.Series(index=[2, 0, 1], data=[5, 0, 1]))
+
+    assert param.v(0.5) == 0.5
+    assert param.v(1.5) == 3
+    assert param.v(3) == 9
+    assert param.v(-1) == -1
+
+
 ##################
 # TEST WITH DATA #
 ##################
@@ -59,4 +75,70 @@ def test_cost_data_extrap():
 
 def test_fixed_cost():
     param = SeriesParameter('cost', 'cost in function of volume', 'EUR', 'm3', val=10)
-    assert param.v(1000) == 10000
\ No newline at end of file
+    assert param.v(1000) == 10000
+
+#########################
+# TIME SERIES PARAMETER #
+#########################
+
+
+def set_up_time_series_param():
+    index = pd.date_range('20140101', periods=3 * 96, freq='900s')
+    df = pd.Series(index=index, data=range(len(index)), name='heat')
+    param = TimeSeriesParameter('heat', 'heat profile', 'W')
+    param.change_start_time('20140101 06:00:00')
+    param.change_time_step(900)
+    param.change_value(df)
+    param.change_horizon(4 * 3600)
+    return param
+
+
+def test_time_series_array():
+    param = set_up_time_series_param()
+    param.slice_horizon()
+    values = param.v_array()
+    assert values.dtype == np.float64
+    assert len(values) == 16
+    assert values[0] == 24
+    assert param.v(3) == 27
+
+
+def test_time_series_array_matches_pandas():
+    param = set_up_time_series_param()
+    expected = [param.v(t) for t in range(16)]
+    param.slice_horizon()
+    assert [param.v(t) for t in range(16)] == expected
+
+
+def test_time_series_repr_days():
+    param = set_up_time_series_param()
+    param.change_start_time('20140101')
+    param.change_horizon(24 * 3600)
+    param.slice_horizon(repr_days=[0, 2])
+    values = param.v_array()
+    assert values.shape == (2, 96)
+    assert values[1, 4] == 2 * 96 + 4
+    assert param.v(4, 2) == 2 * 96 + 4
+
+
+def test_time_series_change_value():
+    param = set_up_time_series_param()
+    param.slice_horizon()
+    new_val = param.value * 2
+    param.change_value(new_val)
+    assert param.v(3) == 54
+    assert param.v_array()[0] == 48
+
+
+def test_time_series_changed_in_place():
+    param = set_up_time_series_param()
+    param.slice_horizon()
+    value = param.value
+    value.iloc[24] = -1.
+
+    # Changes in place are only seen after passing the value again
+    assert param.v(0) == 24
+    param.change_value(value)
+    param.slice_horizon()
+    assert param.v(0) == -1
+    assert param.v_array()[0] == -1
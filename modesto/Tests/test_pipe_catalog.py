@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Tests for the shared pipe catalog
+"""
+
+import pandas as pd
+import pytest
+
+import modesto.pipe as pipe
+
+
+def test_catalog_shared():
+    catalog = pipe.get_catalog()
+    assert pipe.get_catalog() is catalog
+
+    table = pipe.Pipe.get_pipe_catalog()
+    assert list(table.index) == list(catalog.dn)
+    assert table['Di'].values.tolist() == catalog.di.tolist()
+
+
+def test_catalog_lookup():
+    catalog = pipe.get_catalog()
+    table = catalog.to_frame()
+    spec = catalog.lookup(200)
+
+    assert spec.dn == 200
+    assert spec.di == table.loc[200, 'Di']
+    assert spec.rs == table.loc[200, 'Rs']
+    assert spec.f == table.loc[200, 'Friction factor']
+    assert spec.mflo_max == table.loc[200, 'Max mflow']
+    assert catalog.lookup(200) is spec
+    assert not hasattr(spec, '__dict__')
+
+    with pytest.raises(KeyError):
+        catalog.lookup(201)
+
+
+def test_catalog_register():
+    table = pd.DataFrame({'Di': [0.1, 0.05], 'Do': [0.11, 0.06], 'Rs': [3., 2.],
+                          'Friction factor': [0.02, 0.03], 'Max mflow': [10., 2.]},
+                         index=pd.Index([100, 50], name='DN'))
+    catalog = pipe.register_catalog('custom', table)
+    try:
+        assert pipe.get_catalog('custom') is catalog
+        assert catalog.dn.tolist() == [50, 100]
+        assert catalog.lookup(100).mflo_max == 10.
+        assert pipe.get_catalog() is not catalog
+    finally:
+        pipe.unregister_catalog('custom')
+
+    with pytest.raises(KeyError):
+        pipe.get_catalog('custom')
+    with pytest.raises(ValueError):
+        pipe.register_catalog('broken', table.drop(columns='Rs'))
+    with pytest.raises(KeyError):
+        pipe.get_catalog('unknown')
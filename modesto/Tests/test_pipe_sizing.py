@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Tests for the diameter sizing mode of ExtensivePipe
+"""
+
+import pytest
+
+import modesto.solver as slv
+from modesto.pipe import get_catalog
+from modesto.Tests.common import setup_modesto, start_time
+
+pytestmark = pytest.mark.skipif(not slv.make_session('auto').available(), reason='No MILP solver available')
+
+pipes = ['pipe1', 'pipe2']
+
+
+def solve_sizing(diameters, investment_factor):
+    optmodel = setup_modesto()
+    for pipe in pipes:
+        optmodel.change_params({'diameters': diameters, 'investment_factor': investment_factor}, comp=pipe)
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver='auto') == 0
+    return optmodel
+
+
+def test_same_as_fixed_diameter():
+    """
+    The sized network has the same cost as the network with the selected diameters fixed
+    """
+    sized = solve_sizing([0, 50, 100, 150, 200], 1e-2)
+    selected = {pipe: sized.get_component(pipe).get_diameter() for pipe in pipes}
+    assert all(dn in [0, 50, 100, 150, 200] for dn in selected.values())
+
+    fixed = setup_modesto()
+    for pipe in pipes:
+        fixed.change_param(None, pipe, 'diameter', selected[pipe])
+    fixed.compile(start_time)
+    fixed.set_objective('cost')
+    assert fixed.solve(solver='auto') == 0
+
+    investment = sum(sized.get_component(pipe).get_investment_cost() for pipe in pipes)
+    assert investment == pytest.approx(sum(fixed.get_component(pipe).get_investment_cost() for pipe in pipes))
+    assert sized.get_objective() == pytest.approx(fixed.get_objective() + 1e-2 * investment, rel=1e-6)
+
+
+def test_smallest_sufficient_diameter():
+    """
+    With a high investment cost, the pipe to the building is the smallest one that can carry the peak flow
+    """
+    candidates = [0, 20, 50, 100, 150, 200]
+    sized = solve_sizing(candidates, 1)
+
+    building = sized.get_component('cons', 'cons')
+    peak_flow = max(building.params['heat_profile'].v() * building.params['mult'].v()) / 4186 / 30
+    expected = min(dn for dn in candidates if dn > 0 and get_catalog().lookup(dn).mflo_max >= peak_flow)
+    assert sized.get_component('pipe1').get_diameter() == expected
+
+
+def test_diameter_not_needed():
+    optmodel = setup_modesto()
+    optmodel.change_params({'diameters': [50, 100], 'diameter': None}, comp='pipe1')
+    assert 'diameter' not in optmodel.get_component('pipe1').check_data()[0]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Tests for the piecewise linear pumping power approximation of ExtensivePipe
+"""
+
+import numpy as np
+import pytest
+from pyomo.core.base import value
+
+import modesto.solver as slv
+from modesto.pipe import pumping_breakpoints, _cubic_error
+from modesto.Tests.common import setup_modesto, start_time
+
+
+def test_equal_error_breakpoints():
+    breakpoints = pumping_breakpoints(5, placement='equal_error')
+    assert breakpoints[0] == 0 and breakpoints[-1] == 1
+    errors = [_cubic_error(a, b) for a, b in zip(breakpoints[:-1], breakpoints[1:])]
+    np.testing.assert_allclose(errors, errors[0], rtol=1e-6)
+
+    uniform = np.linspace(0, 1, 6)
+    assert max(errors) < max(_cubic_error(a, b) for a, b in zip(uniform[:-1], uniform[1:]))
+
+
+def test_breakpoints_from_flows():
+    breakpoints = pumping_breakpoints(4, flows=[0.1, 0.3, 0.2], margin=0.1)
+    assert len(breakpoints) == 5
+    assert breakpoints[-2] == pytest.approx(0.33)
+    assert breakpoints[-1] == 1
+
+    np.testing.assert_array_equal(pumping_breakpoints(4, flows=[0.95]), pumping_breakpoints(4))
+    np.testing.assert_array_equal(pumping_breakpoints(4, flows=[0.]), [0, 1])
+
+    np.testing.assert_allclose(pumping_breakpoints(4, flows=[0.3], margin=0.), [0, 0.1, 0.2, 0.3, 1])
+
+    with pytest.raises(ValueError):
+        pumping_breakpoints(0)
+    with pytest.raises(ValueError):
+        pumping_breakpoints(4, placement='random')
+
+
+def test_default_uniform_breakpoints():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    pipe = optmodel.get_component('pipe1')
+    np.testing.assert_allclose(pipe.mfs_ratio, np.linspace(0, 1, 6))
+
+    optmodel.change_param(None, 'pipe1', 'pumping_placement', 'equal_error')
+    optmodel.compile(start_time)
+    np.testing.assert_allclose(pipe.mfs_ratio, pumping_breakpoints(5, placement='equal_error'))
+
+
+def test_single_indexed_constraint():
+    optmodel = setup_modesto()
+    optmodel.change_param(None, 'pipe1', 'pumping_segments', 3)
+    optmodel.compile(start_time)
+
+    block = optmodel.get_component('pipe1').block
+    assert len(block.ineq_pumping) == 3 * len(optmodel.get_component('pipe1').TIME)
+    assert block.find_component('ineq_pumping_0') is None
+
+    # A changed number of segments rebuilds the constraint when only updating the model
+    optmodel.change_param(None, 'pipe1', 'pumping_segments', 2)
+    report = optmodel.compile(start_time)
+    assert report['mode'] == 'update'
+    assert len(block.ineq_pumping) == 2 * len(optmodel.get_component('pipe1').TIME)
+
+
+def test_invalid_breakpoints():
+    optmodel = setup_modesto()
+    optmodel.change_param(None, 'pipe1', 'pumping_breakpoints', [0, 0.6, 0.4, 1])
+    with pytest.raises(ValueError):
+        optmodel.compile(start_time)
+
+
+@pytest.mark.skipif(not slv.make_session('auto').available(), reason='No solver available')
+def test_adapt_breakpoints():
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver='auto') == 0
+
+    pipe = optmodel.get_component('pipe1')
+    flows = np.array([value(v) for v in pipe.block.mass_flow_abs.values()])
+    breakpoints = pipe.adapt_pumping_breakpoints(n_segments=3)
+    assert len(breakpoints) == 4
+    assert breakpoints[-2] == pytest.approx(min(1, flows.max() / pipe.mflo_max * 1.1))
+
+    optmodel.compile(start_time)
+    np.testing.assert_allclose(pipe.mfs_ratio, breakpoints)
+    assert optmodel.solve(solver='auto') == 0
+
+    # The approximation is exact at the breakpoints and above the pumping power curve in between
+    f = pipe.f_mult * pipe.catalog.lookup(150).f
+    di = pipe.catalog.lookup(150).di
+    for t in pipe.TIME:
+        mass_flow = value(pipe.block.mass_flow_abs[t])
+        exact = 2 * f * pipe.length * mass_flow ** 3 * 8 / (di ** 5 * 983 ** 2 * np.pi ** 2)
+        assert value(pipe.block.pumping_power[t]) >= exact - 1e-6
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Tests for the extraction of optimization results
+"""
+
+import numpy as np
+import pytest
+from pyomo.core.base import ConcreteModel, Param
+
+import modesto.solver as slv
+import modesto.utils as ut
+from modesto.submodel import Submodel
+from modesto.Tests.common import setup_modesto, start_time
+
+solver = 'highs'
+
+
+def solved_modesto():
+    if not slv.make_session(solver, persistent=True).persistent:
+        pytest.skip('No persistent interface available for {}'.format(solver))
+
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver=solver, persistent=True) == 0
+    return optmodel
+
+
+def test_get_results():
+    optmodel = solved_modesto()
+    spec = [('prod', 'prod', 'heat_flow'),
+            ('cons', 'cons', 'heat_flow'),
+            ('stor', 'stor', 'heat_stor'),
+            (None, 'pipe1', 'heat_flow_in')]
+    results = optmodel.get_results(spec)
+
+    assert list(results.columns) == ['prod.prod.heat_flow', 'cons.cons.heat_flow', 'stor.stor.heat_stor',
+                                     'pipe1.heat_flow_in']
+    for node, comp, name in spec:
+        single = optmodel.get_result(name, node=node, comp=comp)
+        np.testing.assert_allclose(results[single.name].dropna(), single)
+        assert (results.index[:len(single)] == single.index).all()
+
+    # heat_stor is on the state time axis, one element longer
+    assert results['prod.prod.heat_flow'].isnull().sum() == 1
+    assert results.index is ut.time_index(start_time, 900, len(results))
+
+
+def test_get_all_results():
+    optmodel = solved_modesto()
+    results = optmodel.get_all_results()
+
+    np.testing.assert_allclose(results['cons.cons.heat_flow'].dropna(),
+                               optmodel.get_result('heat_flow', node='cons', comp='cons'))
+    assert 'prod.prod.heat_flow' in results
+    assert 'stor.stor.heat_stor' in results
+
+
+def test_repr_days_result_values():
+    sub = Submodel(name='sub', repr_days={0: 1, 1: 0, 2: 1})
+    sub.TIME = [0, 1]
+    sub.REPR_DAYS = [0, 1]
+    sub.DAYS_OF_YEAR = [0, 1, 2]
+    sub.block = ConcreteModel()
+    sub.block.x = Param(sub.TIME, sub.REPR_DAYS, initialize={(0, 0): 1, (1, 0): 2, (0, 1): 3, (1, 1): 4})
+
+    values, name = sub.get_result_values('x')
+    assert name == 'sub.x'
+    np.testing.assert_array_equal(values, [3, 4, 1, 2, 3, 4])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Tests for the columnar result store
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modesto.results_store import ResultStore
+
+
+def fill_store(path, n_scenarios=7, chunk_size=3):
+    store = ResultStore(path, chunk_size=chunk_size)
+    for i in range(n_scenarios):
+        series = pd.DataFrame({'a.heat_flow': np.arange(4) * i, 'b.soc': np.arange(4) + i})
+        store.append('scen{}'.format(i), series, {'objective': 10. * i, 'status': 0, 'solver': 'highs'})
+    return store
+
+
+def test_store_chunks(tmpdir):
+    store = fill_store(str(tmpdir))
+
+    # Two full chunks on disk, one scenario in memory
+    assert len(store.chunks) == 2
+    assert len(store.scenarios()) == 7
+    assert os.path.isfile(os.path.join(str(tmpdir), 'series_00001.npz'))
+
+    heat_flow = store.load('a.heat_flow')
+    assert list(heat_flow.columns) == ['scen{}'.format(i) for i in range(7)]
+    np.testing.assert_array_equal(heat_flow['scen6'], np.arange(4) * 6)
+
+    scalars = store.load_scalars()
+    assert list(scalars.columns) == ['objective', 'status', 'solver']
+    assert scalars.loc['scen6', 'objective'] == 60
+    assert scalars.loc['scen1', 'solver'] == 'highs'
+
+
+def test_store_reopen(tmpdir):
+    store = fill_store(str(tmpdir))
+    store.close()
+
+    store = ResultStore(str(tmpdir))
+    assert store.scenarios() == ['scen{}'.format(i) for i in range(7)]
+    assert store.variables() == ['a.heat_flow', 'b.soc']
+
+    soc = store.load('b.soc', scenarios=['scen5', 'scen2'])
+    assert list(soc.columns) == ['scen5', 'scen2']
+    np.testing.assert_array_equal(soc['scen2'], np.arange(4) + 2)
+    assert store.load_scalars(['objective'], scenarios=['scen3'])['objective'].tolist() == [30]
+
+    with pytest.raises(ValueError):
+        store.append('scen3')
+
+
+def test_store_missing_values(tmpdir):
+    with ResultStore(str(tmpdir), chunk_size=2) as store:
+        store.append('long', {'x': [1, 2, 3]}, {'objective': 1})
+        store.append('short', {'x': [4], 'y': [5]}, {'cost': 2})
+
+    store = ResultStore(str(tmpdir))
+    x = store.load('x')
+    np.testing.assert_array_equal(x['short'], [4, np.nan, np.nan])
+    assert list(store.load('y').columns) == ['long', 'short']
+    assert np.isnan(store.load_scalars().loc['short', 'objective'])
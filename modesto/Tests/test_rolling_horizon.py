@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Tests for the rolling horizon driver
+"""
+
+import pandas as pd
+import pytest
+from pyomo.core.base import value
+
+import modesto.solver as slv
+from modesto.Tests.common import setup_modesto, start_time, time_step, horizon
+from modesto.rolling_horizon import RollingHorizon
+
+pytestmark = pytest.mark.skipif(not slv.make_session('highs', persistent=True).available(),
+                                reason='No persistent solver available')
+
+
+def test_states_carried_over():
+    optmodel = setup_modesto()
+    rolling = RollingHorizon(optmodel, start_time, n_steps=3, control_horizon=4 * time_step, solver='highs')
+    steps = list(rolling.run())
+
+    assert [step['start_time'] for step in steps] == [start_time + pd.Timedelta(hours=h) for h in [0, 1, 2]]
+    assert [step['mode'] for step in steps] == ['build', 'update', 'update']
+    assert all(step['status'] == 0 for step in steps)
+
+    # The initial state of every step is the state after the applied part of the previous step
+    stor = optmodel.get_component('stor', 'stor')
+    heat_stor = optmodel.get_heat_stor()['stor.stor']
+    assert value(heat_stor[0]) == pytest.approx(stor.params['heat_stor'].v())
+
+    results = rolling.get_results()
+    assert len(results) == 12
+    assert results.index[0] == start_time
+    assert results.index[-1] == start_time + pd.Timedelta(seconds=11 * time_step)
+
+    timings = rolling.get_timings()
+    assert list(timings.index) == [0, 1, 2]
+    assert (timings['solve_time'] > 0).all()
+
+
+def test_same_as_fresh_model():
+    """
+    A step of the rolling horizon should give the same solution as a new model with the same initial state
+    """
+    optmodel = setup_modesto()
+    rolling = RollingHorizon(optmodel, start_time, n_steps=2, control_horizon=8 * time_step, solver='highs')
+    steps = rolling.run()
+    next(steps)
+    init = optmodel.get_component('stor', 'stor').params['heat_stor'].v()
+    second = next(steps)
+
+    fresh = setup_modesto()
+    fresh.change_param('stor', 'stor', 'heat_stor', init)
+    fresh.compile(start_time + pd.Timedelta(seconds=8 * time_step))
+    fresh.set_objective('cost')
+    assert fresh.solve(solver='highs') == 0
+
+    assert second['objective'] == pytest.approx(fresh.get_objective(), rel=1e-6)
+
+
+def test_end_time():
+    optmodel = setup_modesto()
+    rolling = RollingHorizon(optmodel, start_time, end_time=start_time + pd.Timedelta(hours=5),
+                             control_horizon=2 * 3600, solver='highs')
+    assert rolling.n_steps == 3
+
+    with pytest.raises(ValueError):
+        RollingHorizon(optmodel, start_time, n_steps=2, control_horizon=time_step / 2)
+    with pytest.raises(ValueError):
+        RollingHorizon(optmodel, start_time, n_steps=2, control_horizon=horizon + time_step)
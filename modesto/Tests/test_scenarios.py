@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Tests for the scenario runner
+"""
+
+import pytest
+
+import modesto.solver as slv
+from modesto.results_store import ResultStore
+from modesto.scenarios import ScenarioRunner, grid, scenario_name
+from modesto.Tests.common import series, setup_graph, set_params, start_time
+
+solver = 'highs'
+
+
+def skip_unavailable():
+    if not slv.make_session(solver, persistent=True).persistent:
+        pytest.skip('No persistent interface available for {}'.format(solver))
+
+
+def test_grid():
+    scenarios = grid(**{'a': [1, 2], 'b': ['x', 'y', 'z']})
+    assert len(scenarios) == 6
+    assert scenarios[1] == {'a': 1, 'b': 'y'}
+    assert scenario_name({('cons', 'cons', 'mult'): 2, 'horizon': 3600}) == 'cons.cons.mult=2,horizon=3600'
+
+
+def run_scenarios(workers, store=None):
+    scenarios = [{('cons', 'cons', 'mult'): mult} for mult in [1, 2, 3]]
+    runner = ScenarioRunner(setup_graph(), set_params, scenarios, start_time=start_time, workers=workers,
+                            store=store, solver=solver, spec=[('cons', 'cons', 'heat_flow')])
+    return runner
+
+
+def test_scenarios_serial():
+    skip_unavailable()
+    results = run_scenarios(workers=1).run_all()
+
+    assert list(results.index) == ['cons.cons.mult=1', 'cons.cons.mult=2', 'cons.cons.mult=3']
+    assert (results['status'] == 0).all()
+    assert results['objective'].is_monotonic_increasing
+
+
+def test_scenarios_parallel_resume(tmpdir):
+    skip_unavailable()
+    serial = run_scenarios(workers=1).run_all()
+
+    store = ResultStore(str(tmpdir))
+    store.append('cons.cons.mult=2', scalars={'objective': -1})
+    runner = run_scenarios(workers=2, store=store)
+    assert runner.pending() == ['cons.cons.mult=1', 'cons.cons.mult=3']
+
+    names = [result['name'] for result in runner.run()]
+    assert sorted(names) == ['cons.cons.mult=1', 'cons.cons.mult=3']
+
+    scalars = store.load_scalars()
+    for name in names:
+        assert scalars.loc[name, 'objective'] == pytest.approx(serial.loc[name, 'objective'])
+        assert scalars.loc[name, 'cons.cons.mult'] == int(name[-1])
+    assert not store.load('cons.cons.heat_flow', names).isnull().any().any()
+
+
+def test_scenarios_different_params():
+    skip_unavailable()
+    scenarios = {'mult': {('cons', 'cons', 'mult'): 3},
+                 'fuel': {('prod', 'prod', 'fuel_cost'): series(0.06, 0.01)},
+                 'base': {('cons', 'cons', 'mult'): 2}}
+    results = ScenarioRunner(setup_graph(), set_params, scenarios, start_time=start_time, workers=1,
+                             solver=solver).run_all()
+    fuel = ScenarioRunner(setup_graph(), set_params, {'fuel': scenarios['fuel']}, start_time=start_time, workers=1,
+                          solver=solver).run_all()
+
+    # Every scenario starts from the base problem, not from the previous scenario
+    assert results.loc['fuel', 'objective'] == pytest.approx(fuel.loc['fuel', 'objective'])
+    assert results.loc['base', 'objective'] < results.loc['mult', 'objective']
+
+    with pytest.raises(ValueError):
+        ScenarioRunner(setup_graph(), set_params, scenarios, start_time=start_time, workers=1,
+                       apply=lambda optmodel, scenario: None)
+
+
+def test_scenarios_resume_from_disk(tmpdir):
+    skip_unavailable()
+    runner = run_scenarios(workers=1, store=ResultStore(str(tmpdir)))
+    results = runner.run()
+    first = next(results)['name']
+    results.close()  # Interrupted run
+
+    store = ResultStore(str(tmpdir))
+    assert store.scenarios() == [first]
+    runner = run_scenarios(workers=1, store=store)
+    assert len(runner.pending()) == 2
+    runner.run_all()
+
+    scalars = ResultStore(str(tmpdir)).load_scalars()
+    assert sorted(scalars.index) == ['cons.cons.mult=1', 'cons.cons.mult=2', 'cons.cons.mult=3']
+    assert ResultStore(str(tmpdir)).load('cons.cons.heat_flow').shape == (96, 3)
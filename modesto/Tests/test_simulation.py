@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Tests for the simulation of the temperatures of NodeMethod networks
+"""
+
+import numpy as np
+import pytest
+from pyomo.core.base import value
+
+from modesto.Benchmarks.networks import build_model, start_time
+from modesto.simulation import NodeMethodSimulation
+from modesto.Tests.common import setup_node_method, start_time as node_method_start
+
+
+def solved_network():
+    optmodel = build_model(4, pipe_model='NodeMethod', horizon=6 * 3600, time_step=900)
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver='auto') == 0
+    return optmodel
+
+
+def test_same_as_optimization():
+    optmodel = solved_network()
+    supply = optmodel.get_result('temperatures', node='prod', comp='plant', index='supply')
+
+    sim = NodeMethodSimulation(optmodel)
+    sim.run(start_time, {'prod.plant': supply.values})
+
+    for node, comp, names in [(None, 'main0', ['temperature_in', 'temperature_out_nhc', 'temperature_out_nhl',
+                                                'wall_temp', 'temperature_out']),
+                              (None, 'service3', ['temperature_in', 'temperature_out']),
+                              ('b1', 'building', ['temperatures']),
+                              ('prod', 'plant', ['temperatures'])]:
+        for name in names:
+            for line in ['supply', 'return']:
+                expected = optmodel.get_result(name, node=node, comp=comp, index=line)
+                np.testing.assert_allclose(sim.get_result(name, node=node, comp=comp, index=line), expected,
+                                           atol=1e-6, err_msg='{} {} {}'.format(comp, name, line))
+
+    np.testing.assert_allclose(sim.get_result('heat_flow', node='prod', comp='plant'),
+                               optmodel.get_result('heat_flow', node='prod', comp='plant'), rtol=1e-8, atol=1e-3)
+
+
+def test_initialize_variables():
+    optmodel = build_model(4, pipe_model='NodeMethod', horizon=6 * 3600, time_step=900)
+    sim = NodeMethodSimulation(optmodel)
+    sim.run(start_time)
+
+    optmodel.compile(start_time)
+    optmodel.restore(sim.to_snapshot())
+
+    block = optmodel.components['main0'].block
+    assert [value(block.temperature_out['supply', t]) for t in range(sim.n_steps)] == \
+        pytest.approx(list(sim.get_result('temperature_out', comp='main0', index='supply')))
+    mix_temp = optmodel.components['j0'].block.mix_temp
+    expected = sim.get_result('mix_temp', comp='j0', index='return')
+    assert value(mix_temp[3, 'return']) == pytest.approx(expected.iloc[3])
+
+
+def test_zero_mass_flow():
+    optmodel = setup_node_method()
+    sim = NodeMethodSimulation(optmodel)
+    sim.run(node_method_start, {'prod.plant': 343.15})
+
+    results = sim.get_results()
+    temperatures = [col for col in results.columns if 'nhc' not in col and 'nhl' not in col]
+    assert not results[temperatures].isnull().any().any()
+
+    # Without mass flow rate, the water in the branch cools down
+    out = sim.get_result('temperature_out', comp='branch2', index='supply')
+    assert (np.diff(out.values[-10:]) < 0).all()
+    assert sim.check_limits().empty
+
+
+def test_check_limits():
+    optmodel = build_model(4, pipe_model='NodeMethod', horizon=6 * 3600, time_step=900)
+    sim = NodeMethodSimulation(optmodel)
+    sim.run(start_time, {'prod.plant': 373.15})
+
+    violations = sim.check_limits()
+    assert (violations['limit'] == 'temperature_max').all()
+    assert (violations['component'] == 'prod.plant').sum() == sim.n_steps - 1
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        NodeMethodSimulation(build_model(4))
+
+    sim = NodeMethodSimulation(build_model(4, pipe_model='NodeMethod'))
+    with pytest.raises(KeyError):
+        sim.run(start_time, {'b0.building': 343.15})
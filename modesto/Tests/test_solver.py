@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Tests for the solver sessions
+"""
+
+import pytest
+from pyomo.core.base import value
+
+import modesto.solver as slv
+from modesto.Tests.common import setup_modesto, start_time
+
+solver = 'highs'
+
+
+def skip_unavailable():
+    if not slv.make_session(solver, persistent=True).persistent:
+        pytest.skip('No persistent interface available for {}'.format(solver))
+
+
+def test_fallback_session():
+    session = slv.make_session('no_such_solver', persistent=True)
+    assert not session.persistent
+    assert session.solver == 'no_such_solver'
+
+
+def test_register_session():
+    class CustomSession(slv.SolverSession):
+        pass
+
+    slv.register_session('custom_solver', CustomSession)
+    assert isinstance(slv.make_session('custom_solver'), CustomSession)
+    assert isinstance(slv.make_session('custom_solver', persistent=True), CustomSession)
+
+
+def test_persistent_solve():
+    skip_unavailable()
+
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+
+    objectives = []
+    for mult in [1, 2]:
+        optmodel.change_param(node='cons', comp='cons', param='mult', val=mult)
+        optmodel.compile(start_time)
+        assert optmodel.solve(solver=solver, persistent=True) == 0
+        objectives.append(value(optmodel.get_objective()))
+    session = optmodel.solver_session
+    assert session.n_solves == 2
+
+    # Same results as a fresh solver
+    fresh = setup_modesto()
+    fresh.change_param(node='cons', comp='cons', param='mult', val=2)
+    fresh.compile(start_time)
+    fresh.set_objective('cost')
+    assert fresh.solve(solver=slv.PERSISTENT_INTERFACES[solver]) == 0
+    assert value(fresh.get_objective()) == pytest.approx(objectives[-1])
+    assert objectives[1] > objectives[0]
+
+    # Recompiling creates a new model, which is loaded into the same solver
+    optmodel.compile(start_time, recompile=True)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver=solver, persistent=True) == 0
+    assert optmodel.solver_session is session
+    assert value(optmodel.get_objective()) == pytest.approx(objectives[-1])
+
+
+def test_solver_options():
+    options = {'mipgap': 0.01, 'timelim': 10.5, 'threads': 2, 'presolve': False, 'seed': 3}
+
+    assert slv.solver_options('gurobi', **options) == (
+        {'MIPGap': 0.01, 'TimeLimit': 10.5, 'Threads': 2, 'Presolve': 0, 'Seed': 3}, [])
+    assert slv.solver_options('cplex', **options) == (
+        {'mip tolerances mipgap': 0.01, 'timelimit': 10.5, 'threads': 2, 'preprocessing presolve': 0,
+         'randomseed': 3}, [])
+    assert slv.solver_options('cbc', **options) == (
+        {'ratioGap': 0.01, 'sec': 10.5, 'threads': 2, 'presolve': 'off', 'randomSeed': 3}, [])
+    assert slv.solver_options('glpk', **options) == (
+        {'mipgap': 0.01, 'tmlim': 11, 'nopresol': '', 'seed': 3}, ['threads'])
+    assert slv.solver_options('highs', **options) == (
+        {'mip_rel_gap': 0.01, 'time_limit': 10.5, 'threads': 2, 'presolve': 'off', 'random_seed': 3}, [])
+
+    # Options that are not set are not passed to the solver
+    assert slv.solver_options('gurobi', mipgap=None, mipfocus=1) == ({'MIPFocus': 1}, [])
+    assert slv.solver_options('highs', mipfocus=1) == ({}, ['mipfocus'])
+
+
+def test_auto_solve(tmpdir):
+    try:
+        auto = slv.auto_solver()
+    except Exception:
+        pytest.skip('No solver available')
+    assert auto in slv.AUTO_SOLVERS
+
+    optmodel = setup_modesto()
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+
+    logfile = str(tmpdir.join('solver.log'))
+    assert optmodel.solve(solver='auto', mipgap=0.01, timelim=60, threads=1, presolve=True, seed=1,
+                          logfile=logfile) == 0
+    assert tmpdir.join('solver.log').check()
@@ -13,3 +13,89 @@ def test_geothermal_cop():
     assert round(res[1], 4) == 5.6803
     assert round(res[0]) == 11165695
 
+
+
+def setup_time_data():
+    import numpy as np
+    import pandas as pd
+    index = pd.date_range('20140101', periods=96, freq='900s')
+    return pd.DataFrame(index=index, data={'Te': np.arange(96.), 'Tg': np.ones(96)})
+
+
+def test_resample_cache_hit():
+    from modesto import utils
+    utils.clear_resample_cache()
+    df = setup_time_data()
+
+    first = utils.resample(df, new_sample_time=300)
+    second = utils.resample(df.copy(), new_sample_time=300)
+
+    assert second is first
+    assert len(first) == 3 * 95 + 1
+    assert first['Te'].iloc[1] == 1 / 3
+    info = utils.resample_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+
+def test_resample_cache_key():
+    from modesto import utils
+    utils.clear_resample_cache()
+    df = setup_time_data()
+
+    utils.resample(df, new_sample_time=300)
+    utils.resample(df, new_sample_time=3600, method='mean')
+    utils.resample(df * 2, new_sample_time=300)
+
+    assert utils.resample_cache_info().misses == 3
+
+
+def test_resample_cache_eviction():
+    from modesto import utils
+    utils.clear_resample_cache()
+    utils.set_resample_cache_size(2)
+    df = setup_time_data()
+
+    try:
+        for time_step in [300, 450, 1800]:
+            utils.resample(df, new_sample_time=time_step)
+        assert utils.resample_cache_info().currsize == 2
+
+        utils.resample(df, new_sample_time=300)
+        assert utils.resample_cache_info().misses == 4
+    finally:
+        utils.set_resample_cache_size(128)
+
+
+def write_time_data(folder):
+    df = setup_time_data()
+    df.to_csv(str(folder.join('data.csv')), sep=';')
+    return df
+
+
+def test_read_time_data_cache(tmpdir):
+    from modesto import utils
+    df = write_time_data(tmpdir)
+
+    first = utils.read_time_data(str(tmpdir), 'data.csv', cache=True)
+    assert tmpdir.join(utils.CACHE_DIRNAME).check(dir=True)
+
+    cached = utils.read_cached_time_data(str(tmpdir), 'data.csv')
+    assert cached.equals(first)
+    assert (cached.values == df.values).all()
+
+    mapped = utils.read_time_data(str(tmpdir), 'data.csv', cache=True, mmap=True)
+    assert mapped.equals(first)
+
+
+def test_read_time_data_cache_stale(tmpdir):
+    import os
+    from modesto import utils
+    df = write_time_data(tmpdir)
+    utils.read_time_data(str(tmpdir), 'data.csv', cache=True)
+
+    (df * 2).to_csv(str(tmpdir.join('data.csv')), sep=';')
+    stat = os.stat(str(tmpdir.join('data.csv')))
+    os.utime(str(tmpdir.join('data.csv')), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert utils.read_cached_time_data(str(tmpdir), 'data.csv') is None
+    assert utils.read_time_data(str(tmpdir), 'data.csv', cache=True)['Te'].iloc[1] == 2
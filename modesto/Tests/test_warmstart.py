@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Tests for snapshots of variable values and warm starts
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pyomo.core.base import value
+
+import modesto.solver as slv
+from modesto.Tests.common import setup_modesto, start_time, time_step
+from modesto.warmstart import Snapshot
+
+pytestmark = pytest.mark.skipif(not slv.make_session('highs', persistent=True).available(),
+                                reason='No persistent solver available')
+
+
+def solved_model(qmin=0):
+    optmodel = setup_modesto()
+    optmodel.change_param('prod', 'prod', 'Qmin', qmin)
+    optmodel.compile(start_time)
+    optmodel.set_objective('cost')
+    assert optmodel.solve(solver='highs', persistent=True) == 0
+    return optmodel
+
+
+def heat_flow(optmodel):
+    block = optmodel.get_component('prod', 'prod').block
+    return np.array([value(block.heat_flow[t]) for t in block.heat_flow])
+
+
+def test_restore_same_time_axis(tmpdir):
+    optmodel = solved_model()
+    fname = str(tmpdir.join('snapshot.pkl'))
+    optmodel.snapshot().save(fname)
+
+    other = setup_modesto()
+    other.compile(start_time)
+    other.restore(Snapshot.load(fname))
+
+    assert heat_flow(other) == pytest.approx(heat_flow(optmodel))
+    assert value(other.get_heat_stor()['stor.stor'][5]) == pytest.approx(
+        value(optmodel.get_heat_stor()['stor.stor'][5]))
+
+
+def test_restore_shifted():
+    optmodel = solved_model()
+    snapshot = optmodel.snapshot()
+    old = heat_flow(optmodel)
+
+    other = setup_modesto()
+    other.compile(start_time + pd.Timedelta(seconds=4 * time_step))
+    other.restore(snapshot)
+
+    new = heat_flow(other)
+    assert new[:-4] == pytest.approx(old[4:])
+    assert new[-4:] == pytest.approx([old[-1]] * 4)
+
+
+def test_restore_interpolated():
+    optmodel = solved_model(qmin=1e4)
+    snapshot = optmodel.snapshot()
+    old = heat_flow(optmodel)
+
+    # Coarse to fine: values in between time steps are interpolated
+    fine = setup_modesto()
+    fine.change_param('prod', 'prod', 'Qmin', 1e4)
+    fine.change_general_param('time_step', time_step / 3)
+    fine.compile(start_time)
+    fine.restore(snapshot)
+
+    new = heat_flow(fine)
+    assert new[::3] == pytest.approx(old[:len(new[::3])])
+    assert new[1] == pytest.approx(old[0] + (old[1] - old[0]) / 3)
+
+    on = fine.get_component('prod', 'prod').block.on
+    assert all(value(on[t]) in [0, 1] for t in on)
+
+    fine.set_objective('cost')
+    assert fine.solve(solver='highs', persistent=True, warmstart=snapshot) == 0
@@ -4,6 +4,7 @@ from functools import reduce
 from math import pi, log, exp
 
 import modesto.utils as ut
+import numpy as np
 import pandas as pd
 from modesto.parameter import StateParameter, DesignParameter, \
     UserDataParameter, SeriesParameter, WeatherDataParameter
@@ -448,66 +449,20 @@ class FixedProfile(Component):
         """
         Component.compile(self, model, start_time)
 
-        heat_profile = self.params['heat_profile']
-
-        def _heat_flow(b, t, c=None):
-            return b.mult * heat_profile.v(t, c)
+        heat_flow = self.params['mult'].v() * self.params['heat_profile'].v_array()
 
         if not self.temperature_driven:
-            if not self.compiled:
-                def _mass_flow(b, t, c=None):
-                    return b.mult * heat_profile.v(t, c) / self.cp / (
-                            self.params['temperature_supply'].v() - self.params['temperature_return'].v())
-
-                if self.repr_days is None:
-
-                    self.block.mass_flow = Param(self.TIME, rule=_mass_flow,
-                                                 mutable=not self.temperature_driven)
-                    self.block.heat_flow = Param(self.TIME, rule=_heat_flow,
-                                                 mutable=not self.temperature_driven)
-                else:
-                    self.block.mass_flow = Param(self.TIME, self.REPR_DAYS,
-                                                 rule=_mass_flow,
-                                                 mutable=not self.temperature_driven)
-                    self.block.heat_flow = Param(self.TIME, self.REPR_DAYS,
-                                                 rule=_heat_flow,
-                                                 mutable=not self.temperature_driven)
-            else:
-                if self.repr_days is None:
-                    for t in self.TIME:
-                        self.block.mass_flow[t] = self.block.mult * heat_profile.v(
-                            t) / self.cp / self.block.delta_T
-                        self.block.heat_flow[t] = self.block.mult * heat_profile.v(
-                            t)
-                else:
-                    for t in self.TIME:
-                        for c in self.REPR_DAYS:
-                            self.block.mass_flow[
-                                t, c] = self.block.mult * heat_profile.v(
-                                t, c) / self.cp / self.block.delta_T
-                            self.block.heat_flow[
-                                t, c] = self.block.mult * heat_profile.v(t, c)
+            delta_T = self.params['temperature_supply'].v() - self.params['temperature_return'].v()
+            self.set_time_param('mass_flow', heat_flow / self.cp / delta_T)
+            self.set_time_param('heat_flow', heat_flow)
 
         else:
             lines = self.params['lines'].v()
             self.block.temperatures = Var(lines, self.TIME)
 
-            def _mass_flow(b, t, c=None):
-                return abs(self.params['mass_flow'].v(t, c))
-
-            if self.repr_days is None:
-                self.block.mass_flow = Param(self.TIME,
-                                             rule=_mass_flow,
-                                             mutable=not self.temperature_driven)
-                self.block.heat_flow = Param(self.TIME, rule=_heat_flow,
-                                             mutable=not self.temperature_driven)
-            else:
-                self.block.mass_flow = Param(self.TIME, self.REPR_DAYS,
-                                             rule=_mass_flow,
-                                             mutable=not self.temperature_driven)
-                self.block.heat_flow = Param(self.TIME, self.REPR_DAYS,
-                                             rule=_heat_flow,
-                                             mutable=not self.temperature_driven)
+            self.set_time_param('mass_flow', np.abs(self.params['mass_flow'].v_array()),
+                                mutable=False)
+            self.set_time_param('heat_flow', heat_flow, mutable=False)
 
             def _decl_temperatures(b, t):
                 if t == 0:
@@ -622,8 +577,8 @@ class BuildingFixed(FixedProfile):
         """
         Component.compile(self, model, start_time)
 
-        heat_profile = self.params['heat_profile']
-        DHW_profile = self.params['DHW_demand']
+        heat_profile = self.params['heat_profile'].v_array()
+        DHW_profile = self.params['DHW_demand'].v_array()
 
         if self.params['temperature_return'].v() <= 45 + 273.15:
             self.COP = 0.4 * (55 + 273.15) / (55 + 273.15 - self.params['temperature_return'].v())
@@ -633,53 +588,14 @@ class BuildingFixed(FixedProfile):
             self.COP = None
         t_supply = self.params['temperature_supply'].v()
         t_return = self.params['temperature_return'].v()
-        if not self.compiled:
-            def _mass_flow(b, t, c=None):
-                return b.mult * (
-                        heat_profile.v(t, c) / self.cp + DHW_profile.v(t, c) / 60 * (
-                        min(t_supply, 55 + 273.15) - 283.15)) / (
-                               t_supply - t_return)
+        mult = self.params['mult'].v()
 
-            def _heat_flow(b, t, c=None):
-                return b.mult * (
-                        heat_profile.v(t, c) + DHW_profile.v(t, c) / 60 * (
-                        min(t_supply, 55 + 273.15) - 283.15) * self.cp)
-
-            if self.repr_days is None:
-
-                self.block.mass_flow = Param(self.TIME, rule=_mass_flow,
-                                             mutable=not self.temperature_driven)
-                self.block.heat_flow = Param(self.TIME, rule=_heat_flow,
-                                             mutable=not self.temperature_driven)
-            else:
-                self.block.mass_flow = Param(self.TIME, self.REPR_DAYS,
-                                             rule=_mass_flow,
-                                             mutable=not self.temperature_driven)
-                self.block.heat_flow = Param(self.TIME, self.REPR_DAYS,
-                                             rule=_heat_flow,
-                                             mutable=not self.temperature_driven)
-        else:
-            if self.repr_days is None:
-                for t in self.TIME:
-                    self.block.mass_flow[t] = self.block.mult * (
-                            heat_profile.v(t) / self.cp + DHW_profile.v(t) / 60 * (
-                            min(self.params['temperature_supply'].v(), 55 + 273.15) - 283.15)) / (
-                                                      self.params['temperature_supply'].v() - self.params[
-                                                  'temperature_return'].v())
-                    self.block.heat_flow[t] = self.block.mult * (
-                            heat_profile.v(t) + DHW_profile.v(t) / 60 * (
-                            min(self.params['temperature_supply'].v(), 55 + 273.15) - 283.15) * self.cp)
-            else:
-                for t in self.TIME:
-                    for c in self.REPR_DAYS:
-                        self.block.mass_flow[t, c] = self.block.mult * (
-                                heat_profile.v(t, c) / self.cp + DHW_profile.v(t, c) / 60 * (
-                                min(self.params['temperature_supply'].v(), 55 + 273.15) - 283.15)) / (
-                                                             self.params['temperature_supply'].v() - self.params[
-                                                         'temperature_return'].v())
-                        self.block.heat_flow[t, c] = self.block.mult * (
-                                heat_profile.v(t, c) + DHW_profile.v(t, c) / 60 * (
-                                min(self.params['temperature_supply'].v(), 55 + 273.15) - 283.15) * self.cp)
+        dhw_heat = DHW_profile / 60 * (min(t_supply, 55 + 273.15) - 283.15)
+        self.set_time_param('mass_flow',
+                            mult * (heat_profile / self.cp + dhw_heat) / (t_supply - t_return),
+                            mutable=not self.temperature_driven)
+        self.set_time_param('heat_flow', mult * (heat_profile + dhw_heat * self.cp),
+                            mutable=not self.temperature_driven)
 
         self.logger.info('Optimization model {} {} compiled'.
                          format(self.__class__, self.name))
@@ -953,10 +869,8 @@ class ProducerVariable(VariableComponent):
             self.block.ramping_cost = Var(self.TIME)
             lines = self.params['lines'].v()
 
-            def _mass_flow(b, t):
-                return self.params['mass_flow'].v(t)
-
-            self.block.mass_flow = Param(self.TIME, rule=_mass_flow)
+            self.set_time_param('mass_flow', self.params['mass_flow'].v_array(),
+                                mutable=False)
 
             def _decl_init_heat_flow(b):
                 return b.heat_flow[0] == (
@@ -1438,25 +1352,12 @@ class AirSourceHeatPump(VariableComponent):
 
         Te = self.params['Te']
         eff_rel = self.params['eff_rel'].v()
+        t_supply = self.params['temperature_supply'].v()
 
-        if self.compiled:
-            if self.repr_days is None:
-                for t in self.TIME:
-                    self.block.COP[t] = self.params['temperature_supply'].v() / (
-                            self.params['temperature_supply'].v() - Te.v(t)) * eff_rel
-            else:
-                for t in self.TIME:
-                    for c in self.REPR_DAYS:
-                        self.block.COP[t, c] = self.params['temperature_supply'].v() / (
-                                self.params['temperature_supply'].v() - Te.v(t, c)) * eff_rel
-        else:
-            if self.repr_days is None:
-                def COP(m, t):
-                    return self.params['temperature_supply'].v() / (
-                            self.params['temperature_supply'].v() - Te.v(t)) * eff_rel
-
-                self.block.COP = Param(self.TIME, mutable=True, rule=COP)
+        self.set_time_param('COP', t_supply / (t_supply - Te.v_array()) * eff_rel)
 
+        if not self.compiled:
+            if self.repr_days is None:
                 self.block.heat_flow = Var(self.TIME, within=NonNegativeReals)
                 self.block.ramping_cost = Var(self.TIME, initialize=0,
                                               within=NonNegativeReals)
@@ -1497,11 +1398,6 @@ class AirSourceHeatPump(VariableComponent):
                 self.block.ineq_mass_lb = Constraint(self.TIME, rule=_mass_lb)
                 self.block.ineq_mass_ub = Constraint(self.TIME, rule=_mass_ub)
             else:
-                def COP(m, t, c):
-                    return self.params['temperature_supply'].v() / (
-                            self.params['temperature_supply'].v() - Te.v(t, c)) * eff_rel
-
-                self.block.COP = Param(self.TIME, self.REPR_DAYS, mutable=True, rule=COP)
                 self.block.heat_flow = Var(self.TIME,
                                            self.REPR_DAYS,
                                            within=NonNegativeReals)
@@ -2108,32 +2004,18 @@ class SolarThermalCollector(VariableComponent):
         """
         Component.compile(self, model, start_time)
 
-        solar_profile = self.params['solar_profile']
-
         eta_0 = self.params['eta_0'].v()
         a_1 = self.params['a_1'].v()
         a_2 = self.params['a_2'].v()
         T_m = 0.5 * (self.params['temperature_supply'].v() + self.params['temperature_return'].v())
-        Te = self.params['Te']
-        if self.compiled:
-            if self.repr_days is None:
-                for t in self.TIME:
-                    self.block.heat_flow_max[t] = self.params['area'].v() * max(0, solar_profile.v(t) * eta_0 - a_1 * (
-                            T_m - Te.v(t)) - a_2 * (T_m - Te.v(t)) ** 2)
-            else:
-                for t in self.TIME:
-                    for c in self.REPR_DAYS:
-                        self.block.heat_flow_max[t, c] = self.params['area'].v() * max(
-                            0, solar_profile.v(t, c) * eta_0 - a_1 * (T_m - Te.v(t, c)) - a_2 * (T_m - Te.v(t, c)) ** 2)
+        dT = T_m - self.params['Te'].v_array()
+        heat_flow_max = self.params['area'].v() * np.maximum(
+            0, self.params['solar_profile'].v_array() * eta_0 - a_1 * dT - a_2 * dT ** 2)
 
-        else:
-            if self.repr_days is None:
-                def _heat_flow_max(m, t):
-                    return self.params['area'].v() * max(0, solar_profile.v(t) * eta_0 - a_1 * (
-                            T_m - Te.v(t)) - a_2 * (T_m - Te.v(t)) ** 2)
+        self.set_time_param('heat_flow_max', heat_flow_max)
 
-                self.block.heat_flow_max = Param(self.TIME, rule=_heat_flow_max,
-                                                 mutable=True)
+        if not self.compiled:
+            if self.repr_days is None:
                 self.block.heat_flow = Var(self.TIME, within=NonNegativeReals)
                 self.block.heat_flow_curt = Var(self.TIME,
                                                 within=NonNegativeReals)
@@ -2158,13 +2040,6 @@ class SolarThermalCollector(VariableComponent):
                 self.block.eq_mass_lb = Constraint(self.TIME, rule=_mass_lb)
                 self.block.eq_mass_ub = Constraint(self.TIME, rule=_mass_ub)
             else:
-                def _heat_flow_max(m, t, c):
-                    return self.params['area'].v() * max(0, solar_profile.v(t, c) * eta_0 - a_1 * (
-                            T_m - Te.v(t, c)) - a_2 * (T_m - Te.v(t, c)) ** 2)
-
-                self.block.heat_flow_max = Param(self.TIME, self.REPR_DAYS,
-                                                 rule=_heat_flow_max,
-                                                 mutable=True)
                 self.block.heat_flow = Var(self.TIME,
                                            self.REPR_DAYS,
                                            within=NonNegativeReals)
@@ -2396,8 +2271,8 @@ class StorageVariable(VariableComponent):
         :return:
         """
         # Fixed heat loss
-        Te = self.params['Te'].v()
-        Tg = self.params['Tg'].v()
+        Te = self.params['Te'].v_array()
+        Tg = self.params['Tg'].v_array()
 
         if self.compiled:
             self.block.max_en = self.max_en
@@ -2405,10 +2280,6 @@ class StorageVariable(VariableComponent):
             self.block.UAt = self.UAt
             self.block.UAb = self.UAb
             self.block.exp_ttau = exp(-self.params['time_step'].v() / self.tau)
-
-            for t in self.TIME:
-                self.block.heat_loss_ct[t] = self.UAs * (self.temp_ret - (Te[t] + Tg[t]) / 2) + self.UAt * (
-                        self.temp_sup - Te[t]) + self.UAb * (self.temp_ret - Tg[t])
         else:
             self.block.max_en = Param(mutable=True, initialize=self.max_en)
             self.block.UAs = Param(mutable=True, initialize=self.UAs)
@@ -2418,14 +2289,10 @@ class StorageVariable(VariableComponent):
             self.block.exp_ttau = Param(mutable=True, initialize=exp(
                 -self.params['time_step'].v() / self.tau))
 
-            def _heat_loss_ct(b, t):
-                return self.UAs * (self.temp_ret - (Te[t] + Tg[t]) / 2) + \
-                       self.UAt * (self.temp_sup - Te[t]) + \
-                       self.UAb * (self.temp_ret - Tg[t])
-
-            self.block.heat_loss_ct = Param(self.TIME, rule=_heat_loss_ct,
-                                            mutable=True)
+        self.set_time_param('heat_loss_ct', self.UAs * (self.temp_ret - (Te + Tg) / 2) +
+                            self.UAt * (self.temp_sup - Te) + self.UAb * (self.temp_ret - Tg))
 
+        if not self.compiled:
             ############################################################################################
             # Initialize variables
             #       with upper and lower bounds
@@ -2517,8 +2384,11 @@ class StorageVariable(VariableComponent):
 
                 self.block.eq_cyclic = Constraint(rule=_eq_cyclic)
             else:  # Fixed initial
+                # Mutable, such that a new initial state (e.g. in a rolling horizon) does not require a recompilation
+                self.block.heat_stor_start = Param(mutable=True, initialize=self.params['heat_stor'].v())
+
                 def _init_eq(b):
-                    return b.heat_stor[0] == self.params['heat_stor'].v()
+                    return b.heat_stor[0] == b.heat_stor_start
 
                 self.block.init_eq = Constraint(rule=_init_eq)
 
@@ -2536,6 +2406,9 @@ class StorageVariable(VariableComponent):
             self.logger.info(
                 'Optimization model Storage {} compiled'.format(self.name))
 
+        elif self.block.find_component('heat_stor_start') is not None:
+            self.block.heat_stor_start = self.params['heat_stor'].v()
+
         self.compiled = True
 
     def get_heat_stor(self):
@@ -2821,8 +2694,8 @@ class StorageRepr(StorageVariable):
         # Declarations #
         ################
 
-        Te = self.params['Te']
-        Tg = self.params['Tg']
+        Te = self.params['Te'].v_array()
+        Tg = self.params['Tg'].v_array()
 
         if self.compiled:
             self.block.max_en = self.max_en
@@ -2831,13 +2704,6 @@ class StorageRepr(StorageVariable):
             self.block.UAb = self.UAb
             self.block.exp_ttau = exp(
                 -self.params['time_step'].v() / self.tau)
-
-            for t in self.TIME:
-                for c in self.REPR_DAYS:
-                    self.block.heat_loss_ct[t, c] = self.UAs * (
-                            self.temp_ret - (Te.v(t, c) + Tg.v(t, c)) / 2) + self.UAt * (
-                                                            self.temp_sup - Te.v(t, c)) + self.UAb * (
-                                                            self.temp_ret - Tg.v(t, c))
         else:
             self.block.max_en = Param(mutable=True, initialize=self.max_en)
             self.block.UAs = Param(mutable=True, initialize=self.UAs)
@@ -2847,14 +2713,10 @@ class StorageRepr(StorageVariable):
             self.block.exp_ttau = Param(mutable=True, initialize=exp(
                 -self.params['time_step'].v() / self.tau))
 
-            def _heat_loss_ct(b, t, c):
-                return self.UAs * (self.temp_ret - (Te.v(t, c) + Tg.v(t, c)) / 2) + \
-                       self.UAt * (self.temp_sup - Te.v(t, c)) + self.UAb * (self.temp_ret - Tg.v(t, c))
-
-            self.block.heat_loss_ct = Param(self.TIME, self.REPR_DAYS,
-                                            rule=_heat_loss_ct,
-                                            mutable=True)
+        self.set_time_param('heat_loss_ct', self.UAs * (self.temp_ret - (Te + Tg) / 2) +
+                            self.UAt * (self.temp_sup - Te) + self.UAb * (self.temp_ret - Tg))
 
+        if not self.compiled:
             ############################################################################################
             # Initialize variables
             #       with upper and lower bounds
@@ -2974,7 +2836,7 @@ class StorageRepr(StorageVariable):
 
         return self.block.heat_stor_intra[t, self.repr_days[d]]
 
-    def get_result(self, name, index, state, start_time):
+    def get_result_values(self, name, index=None, state=False):
         if name in ['soc', 'heat_stor']:
             result = []
 
@@ -2984,38 +2846,28 @@ class StorageRepr(StorageVariable):
                                         self.get_heat_stor_intra(d, t)))
             result.append(value(self.get_heat_stor_inter(self.DAYS_OF_YEAR[-1], self.TIME[-1]+1) +
                                 self.get_heat_stor_intra(self.DAYS_OF_YEAR[-1], self.TIME[-1]+1)))
-            index = pd.DatetimeIndex(start=start_time,
-                                     freq=str(
-                                         self.params['time_step'].v()) + 'S',
-                                     periods=len(result))
-            if name is 'soc':
-                return pd.Series(index=index, name=self.name + '.' + name,
-                                 data=result) / self.max_en * 100
-            if name is 'heat_stor':
-                return pd.Series(index=index,
-                                 name=self.name + '.' + name,
-                                 data=result)
-        elif name is 'heat_stor_inter':
+            result = np.array(result)
+            if name == 'soc':
+                result = result / self.max_en * 100
+            return result, self.name + '.' + name
+        elif name == 'heat_loss':
+            heat_loss_ct = self.expand_repr_days(self.block.heat_loss_ct.extract_values(), self.TIME)
+            heat_stor = self.get_result_values('heat_stor')[0][:-1]
+            result = heat_loss_ct + 1000 * 3600 / self.params['time_step'].v() * heat_stor * \
+                     (1 - value(self.block.exp_ttau))
+            return result, self.name + '.heat_loss'
+        else:
+            return super(StorageRepr, self).get_result_values(name, index, state)
+
+    def get_result(self, name, index, state, start_time):
+        if name == 'heat_stor_inter':
             result = []
 
             for d in self.DAYS_OF_YEAR:
                 result.append(value(self.get_heat_stor_inter(d, 0)))
-            index = pd.DatetimeIndex(start=start_time,
-                                     freq='1D',
-                                     periods=365)
+            index = ut.time_index(start_time, 24 * 3600, 365)
             return pd.Series(index=index, data=result,
                              name=self.name + '.heat_stor_inter')
-        elif name is 'heat_loss':
-            result = []
-            for d in self.DAYS_OF_YEAR:
-                for t in self.TIME:
-                    result.append(value(self.block.heat_loss_ct[t, self.repr_days[d]] + 1000 * 3600 / self.params[
-                        'time_step'].v() * (self.get_heat_stor_inter(d, t) + self.get_heat_stor_intra(d, t)) * (
-                                                1 - self.block.exp_ttau)))
-            index = pd.DatetimeIndex(start=start_time, freq=str(self.params['time_step'].v()) + 'S',
-                                     periods=len(result))
-            return pd.Series(index=index, data=result,
-                             name=self.name + '.heat_loss')
         else:
             return super(StorageRepr, self).get_result(name, index, state,
                                                        start_time)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""
+Timings and model statistics of modesto runs
+"""
+
+import logging
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+from pyomo.core.base import Var, Constraint
+from pyomo.core.base.block import BlockData
+from pyomo.core.expr.visitor import identify_variables
+
+logger = logging.getLogger('modesto.instrumentation')
+
+STATISTICS = ['variables', 'binaries', 'integers', 'constraints', 'nonzeros']
+
+
+class RunReport(object):
+    def __init__(self):
+        """
+        Timings of the phases of a modesto run (e.g. compile, solve) and of the compilation of every component,
+        together with the size of the optimization problem per component. Timings of a phase that occurs several
+        times are added up.
+        """
+        self.phases = OrderedDict()  # Phase name: [total time in seconds, number of calls]
+        self.components = OrderedDict()  # Component name: [total compilation time in seconds, number of calls]
+        self.statistics = OrderedDict()  # Component name: dict with the statistics, see block_statistics
+
+    def reset(self):
+        """
+        Remove all timings and statistics
+
+        :return:
+        """
+        self.phases.clear()
+        self.components.clear()
+        self.statistics.clear()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager timing a phase
+
+        :param name: Name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    @contextmanager
+    def component(self, name):
+        """
+        Context manager timing the compilation of a component
+
+        :param name: Name of the component
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_component(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        """
+        Add the time spent in a phase
+
+        :param name: Name of the phase
+        :param seconds: Time in seconds
+        :return:
+        """
+        entry = self.phases.setdefault(name, [0., 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def add_component(self, name, seconds):
+        """
+        Add the compilation time of a component
+
+        :param name: Name of the component
+        :param seconds: Time in seconds
+        :return:
+        """
+        entry = self.components.setdefault(name, [0., 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def phase_times(self):
+        """
+        :return: pd.DataFrame with the phases as index and the total time and number of calls as columns
+        """
+        return pd.DataFrame([[name, t, n] for name, (t, n) in self.phases.items()],
+                            columns=['phase', 'time', 'calls']).set_index('phase')
+
+    def component_table(self):
+        """
+        :return: pd.DataFrame with the components as index and the compilation time, number of compilations and the
+            model statistics as columns, sorted by compilation time
+        """
+        names = list(self.components) + [name for name in self.statistics if name not in self.components]
+        rows = []
+        for name in names:
+            t, n = self.components.get(name, [0., 0])
+            stats = self.statistics.get(name, {})
+            rows.append([name, t, n] + [stats.get(stat) for stat in STATISTICS])
+        table = pd.DataFrame(rows, columns=['component', 'compile_time', 'compilations'] + STATISTICS)
+        return table.set_index('component').sort_values('compile_time', ascending=False)
+
+    def to_dict(self):
+        """
+        :return: dict with the phase timings, component timings and statistics
+        """
+        return {'phases': {name: {'time': t, 'calls': n} for name, (t, n) in self.phases.items()},
+                'components': {name: {'time': t, 'calls': n} for name, (t, n) in self.components.items()},
+                'statistics': {name: dict(stats) for name, stats in self.statistics.items()}}
+
+    def log(self, level=logging.INFO, top=10):
+        """
+        Emit the report through the modesto.instrumentation logger
+
+        :param level: Logging level
+        :param top: Number of components to include, the ones that took longest to compile
+        :return:
+        """
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, 'Phase timings:\n{}'.format(self.phase_times().to_string()))
+        if self.components or self.statistics:
+            logger.log(level, 'Components (top {}):\n{}'.format(top, self.component_table().head(top).to_string()))
+
+    def __str__(self):
+        return 'Phase timings:\n{}\n\nComponents:\n{}'.format(self.phase_times().to_string(),
+                                                              self.component_table().to_string())
+
+
+def block_statistics(block, descend_into=True):
+    """
+    Count the variables, binary and integer variables, constraints and nonzeros (variables per constraint) of a block
+
+    :param block: Pyomo block
+    :param descend_into: If False, sub-blocks are not included
+    :return: dict with the statistics, see STATISTICS
+    """
+    stats = dict.fromkeys(STATISTICS, 0)
+
+    for var in block.component_data_objects(Var, descend_into=descend_into):
+        stats['variables'] += 1
+        if var.is_binary():
+            stats['binaries'] += 1
+        elif var.is_integer():
+            stats['integers'] += 1
+
+    for con in block.component_data_objects(Constraint, active=True, descend_into=descend_into):
+        stats['constraints'] += 1
+        stats['nonzeros'] += sum(1 for _ in identify_variables(con.body, include_fixed=False))
+
+    return stats
+
+
+class CompileProfiler(object):
+    def __init__(self, allocations=True):
+        """
+        Profiler of the construction of Pyomo components (constraints, parameters, variables, objectives) while a
+        model is compiled. The wall time, number of indices and Python memory allocations of every construction are
+        attributed to (class of the owning modesto component, block name, Pyomo component name). Components built
+        within the construction of another component (e.g. implicit index sets) are counted with the outer one.
+
+        Usage::
+
+            profiler = CompileProfiler()
+            with profiler.profile(owners):
+                ...  # Build Pyomo components
+            profiler.dump_folded('compile.folded')
+
+        :param allocations: If True, Python memory allocations are traced with tracemalloc. This slows down the
+            compilation considerably.
+        """
+        self.allocations = allocations
+        self.records = OrderedDict()  # (class, block, name): [time in seconds, indices, allocated bytes, constructions]
+        self._owners = {}
+        self._depth = 0
+
+    def reset(self):
+        """
+        Remove all recorded constructions
+
+        :return:
+        """
+        self.records.clear()
+
+    @contextmanager
+    def profile(self, owners=None):
+        """
+        Context manager profiling all Pyomo components added to blocks within it
+
+        :param owners: dict mapping block names to the names of the classes that build them (e.g. the modesto
+            component types), None for the top level model. Otherwise, the class name of the Pyomo block is used.
+        """
+        self._owners = owners or {}
+        original = BlockData.add_component
+        profiler = self
+
+        def add_component(block, name, val):
+            if profiler._depth > 0:
+                return original(block, name, val)
+            profiler._depth += 1
+            mem_start = tracemalloc.get_traced_memory()[0] if profiler.allocations else 0
+            start = time.perf_counter()
+            try:
+                return original(block, name, val)
+            finally:
+                seconds = time.perf_counter() - start
+                allocated = tracemalloc.get_traced_memory()[0] - mem_start if profiler.allocations else 0
+                profiler._depth -= 1
+                profiler._record(block, name, val, seconds, allocated)
+
+        started_tracing = False
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        BlockData.add_component = add_component
+        try:
+            yield self
+        finally:
+            BlockData.add_component = original
+            if started_tracing:
+                tracemalloc.stop()
+
+    def _record(self, block, name, val, seconds, allocated):
+        owner_block = block
+        while owner_block.parent_block() is not None and owner_block.local_name not in self._owners:
+            owner_block = owner_block.parent_block()
+        if owner_block.parent_block() is None:
+            owner = self._owners.get(None, type(owner_block).__name__)
+        else:
+            owner = self._owners[owner_block.local_name]
+        block_name = block.local_name if block.parent_block() is not None else 'model'
+
+        try:
+            indices = len(val) if val.is_indexed() else 1
+        except (AttributeError, TypeError):
+            indices = 1
+
+        entry = self.records.setdefault((owner, block_name, name), [0., 0, 0, 0])
+        entry[0] += seconds
+        entry[1] += indices
+        entry[2] += allocated
+        entry[3] += 1
+
+    def table(self):
+        """
+        :return: pd.DataFrame with one row per (class, block, component), sorted by time, with the time in seconds,
+            the number of indices, the allocated bytes and the number of constructions
+        """
+        rows = [list(key) + entry for key, entry in self.records.items()]
+        table = pd.DataFrame(rows, columns=['class', 'block', 'component', 'time', 'indices', 'allocated',
+                                            'constructions'])
+        return table.sort_values('time', ascending=False).reset_index(drop=True)
+
+    def dump_folded(self, fname, metric='time'):
+        """
+        Write the profile as folded stacks ('class;block;component value' per line), the input format of flame graph
+        tools such as flamegraph.pl and speedscope
+
+        :param fname: File name
+        :param metric: 'time' (in microseconds), 'indices' or 'allocated' (in bytes)
+        :return:
+        """
+        column = {'time': 0, 'indices': 1, 'allocated': 2}[metric]
+        with open(fname, 'w') as f:
+            for key, entry in self.records.items():
+                val = entry[column] * 1e6 if metric == 'time' else entry[column]
+                f.write('{} {}\n'.format(';'.join(str(part).replace(';', ':').replace(' ', '_') for part in key),
+                                         int(round(val))))
@@ -1,21 +1,29 @@
 import collections
+from contextlib import nullcontext
 from math import sqrt
 
 import networkx as nx
-from pyomo.core.base import ConcreteModel, Objective, minimize, value, Constraint, Var, NonNegativeReals, Block
+import numpy as np
+import pandas as pd
+from pyomo.core.base import ConcreteModel, Objective, minimize, value, Constraint, Var, NonNegativeReals, Block, Set
 from pyomo.opt import SolverFactory
 from pyomo.opt import SolverStatus, TerminationCondition
 import pyomo.environ
 
 import modesto.component as co
+import modesto.instrumentation as ins
 import modesto.pipe as pip
+import modesto.solver as slv
+import modesto.utils as ut
+import modesto.warmstart as ws
+from modesto.network_reduction import NetworkReduction
 from modesto.LTIModels import RCmodels as rc
 from modesto.parameter import *
 from modesto.submodel import Submodel
 
 
 class Modesto:
-    def __init__(self, pipe_model, graph, repr_days=None):
+    def __init__(self, pipe_model, graph, repr_days=None, balances='node', reduction=None):
         """
         This class allows setting up optimization problems for district energy systems
 
@@ -26,6 +34,14 @@ class Modesto:
         :param graph: networkx object, describing the structure of the network
         :param repr_days: None if regular optimization. Dict of days of year
             mapped to representative days if used.
+        :param balances: 'node' to add the mass and heat balances of every node to a block of that node, 'network' to
+            add the balances of all nodes as two constraints indexed by node and time step to the top level model,
+            assembled from the incidence matrix of the network. Nodes then get no block of their own, which makes large
+            networks faster to compile. Not available for temperature driven (NodeMethod) models.
+        :param reduction: None (default) to build the model from graph as is. True or a dict with keyword arguments of
+            NetworkReduction (e.g. pipe_keys with the diameters of the pipes) to first merge series pipes and aggregate
+            leaf buildings (see network_reduction.NetworkReduction). change_param, change_params and get_result then
+            take the names of the original network, the other methods those of the reduced network.
         """
 
         self.model = ConcreteModel(name=Modesto)
@@ -38,13 +54,25 @@ class Modesto:
         else:
             self.temperature_driven = False
 
+        if balances not in ['node', 'network']:
+            raise ValueError('balances should be \'node\' or \'network\', not {}'.format(balances))
+        if balances == 'network' and self.temperature_driven:
+            raise ValueError('Network balances are not available for temperature driven models')
+        self.balances = balances
+
         self.allow_flow_reversal = True
         self.start_time = None
+        self.compiled_start_time = None
         if repr_days is not None:
             self.repr_days = {i: int(round(j)) for i, j in repr_days.items()}
         else:
             self.repr_days = repr_days
 
+        self.reduction = None
+        if reduction is not None and reduction is not False:
+            self.reduction = NetworkReduction(graph, **({} if reduction is True else reduction))
+            graph = self.reduction.graph
+
         self.graph = graph
         self.edges = {}
         self.nodes = {}
@@ -53,12 +81,17 @@ class Modesto:
 
         self.logger = logging.getLogger('modesto.main.Modesto')
 
-        self.build(graph)
+        self.run_report = ins.RunReport()  # Phase timings and model statistics, see get_run_report
+        with self.run_report.phase('build'):
+            self.build(graph)
         self.compiled = False
 
         self.objectives = {}
+        self.objective_rules = {}
         self.act_objective = None
 
+        self.solver_session = None  # Solver kept alive between solves, see solve(persistent=True)
+
     def create_params(self):
         params = {
             'Te': WeatherDataParameter('Te',
@@ -182,6 +215,73 @@ class Modesto:
             end_node.add_pipe(self.edges[name].pipe)
             self.components[name] = self.edges[name].pipe
 
+    def incidence_matrix(self):
+        """
+        Oriented incidence matrix of the network: one row per node and one column per pipe (in the order of get_nodes
+        and of the edges of the graph), -1 at the start node and 1 at the end node of every pipe
+
+        :return: scipy.sparse CSR matrix
+        """
+        from scipy.sparse import csr_matrix
+
+        nodes = self.get_nodes()
+        return csr_matrix(self._incidence(), shape=(len(nodes), self.graph.number_of_edges()))
+
+    def _incidence(self):
+        """
+        Oriented incidence matrix of the network in compressed sparse row format, see incidence_matrix
+
+        :return: Tuple of the data, column indices and row pointers
+        """
+        position = {node: i for i, node in enumerate(self.get_nodes())}
+        rows = np.array([position[node] for edge in self.graph.edges for node in edge], dtype=int)
+        cols = np.repeat(np.arange(self.graph.number_of_edges()), 2)
+        data = np.tile([-1, 1], self.graph.number_of_edges())
+
+        order = np.lexsort((cols, rows))
+        indptr = np.searchsorted(rows[order], np.arange(len(position) + 1))
+        return data[order], cols[order], indptr
+
+    def __build_network_balances(self):
+        """
+        Add the mass and heat balances of all nodes to the top level model, as two constraints indexed by node and time
+        step (and representative day). The pipe terms follow from the incidence matrix: the mass flow rate of a pipe
+        enters its end node and leaves its start node, the heat flow leaves the start node as heat_flow_in and enters
+        the end node as heat_flow_out.
+
+        :return:
+        """
+        nodes = self.get_nodes()
+        pipes = [self.edges[name].pipe for _, _, name in self.graph.edges(data='name')]
+        data, indices, indptr = self._incidence()
+
+        terms = {}  # Node: (list of components, list of (pipe, coefficient))
+        for i, node in enumerate(nodes):
+            row = slice(indptr[i], indptr[i + 1])
+            terms[node] = (list(self.components[node].components.values()),
+                           [(pipes[j], int(a)) for j, a in zip(indices[row], data[row])])
+
+        def _heat_bal(m, node, *tc):
+            comps, edges = terms[node]
+            if not comps and not edges:
+                return Constraint.Skip
+            return 0 == sum(comp.get_heat(*tc) for comp in comps) + \
+                sum(pipe.block.heat_flow_out[tc] if a > 0 else -pipe.block.heat_flow_in[tc] for pipe, a in edges)
+
+        def _mass_bal(m, node, *tc):
+            comps, edges = terms[node]
+            if not comps and not edges:
+                return Constraint.Skip
+            return 0 == sum(comp.get_mflo(*tc) for comp in comps) + \
+                sum(a * pipe.block.mass_flow[tc] for pipe, a in edges)
+
+        node_obj = self.components[nodes[0]]
+        index = [node_obj.TIME] if self.repr_days is None else [node_obj.TIME, node_obj.REPR_DAYS]
+
+        self.model.NODES = Set(initialize=nodes, ordered=True)
+        self.model.heat_bal = Constraint(self.model.NODES, *index, rule=_heat_bal)
+        self.model.mass_bal = Constraint(self.model.NODES, *index, rule=_mass_bal)
+
     def __build_objectives(self):
         """
         Initialize different objectives
@@ -204,18 +304,19 @@ class Modesto:
         def obj_cost(model):
             return model.Slack + sum(
                 comp.obj_fuel_cost() for comp in self.iter_components()) + sum(
-                comp.obj_elec_cost() for comp in self.iter_components())
+                comp.obj_elec_cost() for comp in self.iter_components()) + sum(
+                comp.obj_investment() for comp in self.iter_components())
 
         def obj_cost_ramp(model):
             return model.Slack + sum(
-                comp.obj_cost_ramp() for comp in self.iter_components())
+                comp.obj_cost_ramp() + comp.obj_investment() for comp in self.iter_components())
 
         def obj_co2(model):
             return model.Slack + sum(
                 comp.obj_co2() for comp in self.iter_components())
 
         def obj_co2_fuel_cost(model):
-            return model.Slack + sum(comp.obj_co2_cost() + comp.obj_fuel_cost()
+            return model.Slack + sum(comp.obj_co2_cost() + comp.obj_fuel_cost() + comp.obj_investment()
                                      for comp in self.iter_components())
 
         self.model.OBJ_ENERGY = Objective(rule=obj_energy, sense=minimize)
@@ -236,6 +337,14 @@ class Modesto:
         for objective in self.objectives.values():
             objective.deactivate()
 
+        self.objective_rules = {
+            'energy': obj_energy,
+            'cost': obj_cost,
+            'cost_ramp': obj_cost_ramp,
+            'co2': obj_co2,
+            'cost_fuel_co2': obj_co2_fuel_cost
+        }
+
         if self.temperature_driven:
             def obj_temp(model):
                 return model.Slack + sum(
@@ -244,23 +353,43 @@ class Modesto:
             self.model.OBJ_TEMP = Objective(rule=obj_temp, sense=minimize)
 
             self.objectives['temp'] = self.model.OBJ_TEMP
+            self.objective_rules['temp'] = obj_temp
 
-    def compile(self, start_time='20140101', recompile=False):
+    def __refresh_objectives(self):
+        """
+        Rebuild the expressions of the objectives, which contain the (non-mutable) prices of the current horizon
+
+        :return:
+        """
+        for name, rule in self.objective_rules.items():
+            self.objectives[name].set_value(rule(self.model))
+
+    def compile(self, start_time='20140101', recompile=False, refresh_all=False, profiler=None):
         """
         Compile the optimization problem
 
+        If the model was compiled before and recompile is False, only the components of which a parameter changed since
+        the last compilation are refreshed. A change of start time, time step or horizon refreshes all components.
+
         :param start_time: Start time of this modesto instance. Either a pandas Timestamp object or a string of format
             'yyyymmdd'. Default '20140101'.
         :param recompile: True if model should be recompiled. If False, only mutable parameters are reloaded.
-        :return:
-        """
+        :param refresh_all: If True, the mutable parameters of all components are reloaded, changed or not.
+        :param profiler: CompileProfiler (see modesto.instrumentation) recording the construction of every Pyomo
+            component during this compilation
+        :return: dict with the compilation mode ('build' or 'update'), and lists of the names of the refreshed and
+            skipped components
+        """
+        if profiler is not None:
+            owners = {name: type(comp).__name__ for name, comp in self.components.items()}
+            owners[None] = type(self).__name__
+            with profiler.profile(owners):
+                return self.compile(start_time, recompile=recompile, refresh_all=refresh_all)
 
         # Set time
         if isinstance(start_time, str):
-            self.start_time = pd.Timestamp(start_time)
-        elif isinstance(start_time, pd.Timestamp):
-            self.start_time = start_time
-        else:
+            start_time = pd.Timestamp(start_time)
+        elif not isinstance(start_time, pd.Timestamp):
             raise IOError("start_time specifier not recognized. Should be "
                           "either string of format 'yyyymmdd' or pd.Timestamp.")
 
@@ -277,27 +406,68 @@ class Modesto:
                     self.components[comp].reinit()
                 self.logger.info('Recompiling model.')
 
-        # Check whether all necessary parameters are there
-        self.check_data()
-        self.update_time(self.start_time)
-
-        # Components
-        for name in self.get_edges():
-            edge_obj = self.get_component(name=name)
-            edge_obj.compile(self.model, start_time)
+        if self.compiled and not refresh_all:
+            # A different time axis changes the data of every component
+            refresh_all = start_time != self.compiled_start_time or \
+                          self.params['time_step'].is_dirty() or \
+                          self.params['horizon'].is_dirty()
+        else:
+            refresh_all = True
+        self.start_time = start_time
+        self.compiled_start_time = start_time
 
-        nodes = self.get_nodes()
+        # Check whether all necessary parameters are there
+        with self.run_report.phase('check_data'):
+            self.check_data()
+        if refresh_all:
+            with self.run_report.phase('update_time'):
+                self.update_time(self.start_time)
 
-        for node in nodes:
-            node_obj = self.get_component(name=node)
-            node_obj.compile(self.model, start_time)
+        refreshed = []
 
-        if not self.compiled or recompile:
-            self.__build_objectives()
+        # Components
+        with self.run_report.phase('compile_components'):
+            for name in self.get_edges():
+                edge_obj = self.get_component(name=name)
+                if refresh_all or edge_obj.is_dirty():
+                    with self.run_report.component(name):
+                        edge_obj.compile(self.model, start_time)
+                    refreshed.append(name)
+
+            nodes = self.get_nodes()
+
+            for node in nodes:
+                node_obj = self.get_component(name=node)
+                refreshed += node_obj.compile(self.model, start_time,
+                                              only_dirty=not refresh_all,
+                                              run_report=self.run_report,
+                                              balance=self.balances == 'node')
+
+            if self.balances == 'network' and self.model.find_component('heat_bal') is None:
+                with self.run_report.component('network'):
+                    self.__build_network_balances()
+
+        with self.run_report.phase('objectives'):
+            if not self.compiled or recompile:
+                self.__build_objectives()
+            elif refreshed:
+                self.__refresh_objectives()
+
+        report = {'mode': 'update' if self.compiled else 'build',
+                  'refreshed': refreshed,
+                  'skipped': [name for name, comp in self.components.items()
+                              if name not in refreshed and not isinstance(comp, Node)]}
+        self.logger.info('Compilation ({}): {} components refreshed, {} skipped'.format(
+            report['mode'], len(report['refreshed']), len(report['skipped'])))
+
+        for param in self.params.values():
+            param.clear_dirty()
+        for comp in self.components.values():
+            comp.clear_dirty()
 
         self.compiled = True  # Change compilation flag
 
-        return
+        return report
 
     def check_data(self):
         """
@@ -385,64 +555,72 @@ class Modesto:
         return self.components.values()
 
     def solve(self, tee=False, mipgap=None, mipfocus=None, verbose=False,
-              solver='gurobi', warmstart=False, probe=False,
-              timelim=None, threads=None):
+              solver=None, warmstart=False, probe=False,
+              timelim=None, threads=None, persistent=False, presolve=None,
+              seed=None, logfile=None, options=None):
         """
         Solve a new optimization
 
         :param probe: Use extra aggressive probing settings. Only has effect when using CPLEX
-        :param warmstart: Use warmstart if possible
-        :param mipfocus: Set MIP focus
-        :param solver: Choose solver
+        :param warmstart: Use warmstart if possible, starting from the current variable values. If a Snapshot, it is
+            restored first (see restore).
+        :param mipfocus: Set MIP focus. Only has effect when using Gurobi
+        :param solver: Choose solver: 'gurobi', 'cplex', 'cbc', 'glpk', 'highs', or 'auto' for the preferred installed
+            solver (see modesto.solver.auto_solver). Default: the MODESTO_SOLVER environment variable, or 'gurobi'.
         :param tee: If True, print the optimization model
         :param mipgap: Set mip optimality gap. Default 10%
         :param verbose: True to print extra diagnostic information
         :param timelim: Time limit for solver in seconds. Default: no time limit.
+        :param threads: Number of threads used by the solver
+        :param persistent: If True, keep the solver alive between solves using a persistent interface (if available
+            for the solver). Subsequent solves of the same model only pass the changes to the solver.
+        :param presolve: True or False to switch presolve on or off. Default: solver default.
+        :param seed: Random seed of the solver
+        :param logfile: File to which the solver log is written
+        :param options: dict with other options, using the option names of the solver
         :return:
         """
 
         if verbose:
             self.model.pprint()
 
-        opt = SolverFactory(solver, warmstart=warmstart)
+        if isinstance(warmstart, ws.Snapshot):
+            self.restore(warmstart)
+            warmstart = True
 
-        if solver == 'gurobi':
-            # opt.options["Crossover"] = 0
-            # opt.options['ImproveStartTime'] = 10
-            # opt.options['PumpPasses'] = 2
-            if mipgap is not None:
-                opt.options["MIPGap"] = mipgap
+        if solver is None:
+            solver = slv.default_solver()
+        if solver == 'auto':
+            solver = slv.auto_solver(persistent)
 
-            if mipfocus is not None:
-                opt.options["MIPFocus"] = mipfocus
-
-            if timelim is not None:
-                opt.options["TimeLimit"] = timelim
+        if not persistent:
+            opt = slv.make_session(solver)
+        else:
+            if self.solver_session is None or self.solver_session.solver != solver:
+                self.solver_session = slv.make_session(solver, persistent=True)
+            opt = self.solver_session
+            opt.reset_options()
 
-            if threads is not None:
-                opt.options["Threads"] = threads
-        elif solver == 'cplex':
-            opt.options['mip display'] = 3
-            if probe:
-                opt.options['mip strategy probe'] = 3
+        if solver == 'cplex':
             # https://www.ibm.com/support/knowledgecenter/SSSA5P_12.5.1/ilog.odms.cplex.help/CPLEX/Parameters/topics/Probe.html
-            # opt.options['emphasis mip'] = 1
-            # opt.options['mip cuts all'] = 2
-            if mipgap is not None:
-                opt.options['mip tolerances mipgap'] = mipgap
-
-            if timelim is not None:
-                opt.options['timelimit'] = timelim
+            opt.options['mip display'] = 3
             opt.options['parallel'] = -1
             opt.options[
                 'mip strategy fpheur'] = 2  # Feasibility pump heuristics
-            opt.options['parallel'] = -1
+
+        opt.set_options(mipgap=mipgap, timelim=timelim, threads=threads, presolve=presolve, seed=seed,
+                        mipfocus=mipfocus, probe=probe or None, logfile=logfile)
+        if options is not None:
+            opt.options.update(options)
 
         try:
-            self.results = opt.solve(self.model, tee=tee)
+            self.results = opt.solve(self.model, tee=tee, warmstart=warmstart)
         except ValueError:
             # self.logger.warning('No solution found before time limit.')
             return -2
+        finally:
+            for phase, seconds in opt.timings.items():
+                self.run_report.add_phase(phase, seconds)
 
         if verbose:
             print(self.results)
@@ -507,6 +685,10 @@ class Modesto:
         :param param: name of the parameter
         :param val: New value of the parameter
         """
+        if self.reduction is not None:
+            self.reduction.change_param(self, node, comp, param, val)
+            return
+
         if self.get_component(comp, node) is None:
             raise KeyError("%s is not recognized as a valid component" % comp)
 
@@ -588,6 +770,9 @@ class Modesto:
         :return: A pandas DataFrame containing all values of the variable/parameter over the time horizon
         """
 
+        if self.reduction is not None:
+            return self.reduction.get_result(self, name, node, comp, index, check_results, state)
+
         if self.results is None and check_results:
             raise Exception('The optimization problem has not been solved yet.')
 
@@ -595,6 +780,126 @@ class Modesto:
 
         return obj.get_result(name, index, state, self.start_time)
 
+    def get_results(self, spec, check_results=True, state=False):
+        """
+        Returns the numerical values of a set of parameters or time-dependent variables after optimization, in one
+        DataFrame.
+
+        :param spec: List of (node, comp, name) or (node, comp, name, index) tuples. node is None for pipes, index is
+            the index next to time (e.g. the line), if any.
+        :param check_results: Check if model is solved. Default True.
+        :param state: If True, the state time axis is used (one element longer) instead of the ordinary time axis
+        :return: pd.DataFrame with one column per requested result, named as in get_result. Shorter results are
+            padded with NaN.
+        """
+        if self.results is None and check_results:
+            raise Exception('The optimization problem has not been solved yet.')
+
+        results = collections.OrderedDict()
+        for item in spec:
+            node, comp, name = item[:3]
+            index = item[3] if len(item) > 3 else None
+            values, resname = self.get_component(comp, node).get_result_values(name, index, state)
+            if values is not None:
+                results[resname] = values
+
+        return self._results_frame(results)
+
+    def get_all_results(self, check_results=True):
+        """
+        Returns the numerical values of all parameters and variables indexed by time, of all nodes, components and
+        pipes, in one DataFrame. Variables and parameters with a second index (e.g. the line) get a column per index.
+
+        :param check_results: Check if model is solved. Default True.
+        :return: pd.DataFrame with one column per result. Results on the ordinary time axis are padded with NaN to
+            the length of those on the state time axis.
+        """
+        if self.results is None and check_results:
+            raise Exception('The optimization problem has not been solved yet.')
+
+        results = collections.OrderedDict()
+        for name in sorted(self.components):
+            results.update(self.components[name].get_all_result_values())
+
+        return self._results_frame(results)
+
+    def get_run_report(self, statistics=True, log=True):
+        """
+        Report of the time spent in every phase (build, check_data, update_time, compile_components, objectives and
+        the solver phases), of the compilation time of every component and of the size of the optimization problem
+        per component
+
+        :param statistics: If True, the model statistics (variables, binaries, constraints, nonzeros) of every
+            component are counted. This takes some time for large models.
+        :param log: If True, the report is also emitted through logging
+        :return: RunReport object
+        """
+        if statistics and self.compiled:
+            self.run_report.statistics.clear()
+            for name in sorted(self.components):
+                block = self.components[name].block
+                if block is not None:
+                    self.run_report.statistics[name] = ins.block_statistics(block)
+            self.run_report.statistics['model'] = ins.block_statistics(self.model, descend_into=False)
+
+        if log:
+            self.run_report.log()
+
+        return self.run_report
+
+    def shift_values(self, shift):
+        """
+        Shift the current values of all time indexed variables by a number of time steps towards the start of the
+        horizon, e.g. to warm start the optimization of a rolling horizon from the previous solution.
+
+        :param shift: Number of time steps
+        :return:
+        """
+        for comp in self.components.values():
+            comp.shift_values(shift)
+
+    def snapshot(self):
+        """
+        Take a snapshot of the values of all variables, e.g. after a solve
+
+        :return: Snapshot object
+        """
+        return ws.Snapshot(self.start_time, self.params['time_step'].v(),
+                           {name: comp.get_var_values() for name, comp in self.components.items()})
+
+    def restore(self, snapshot):
+        """
+        Set the variable values of the compiled model to those of a snapshot, e.g. to warm start a recompiled model. If
+        the start time of the model differs from the snapshot, the values are shifted in time. If the time step
+        differs, the values are interpolated (and rounded for integer variables such as the on/off state of
+        producers). Values beyond the horizon of the snapshot are those of its last time step.
+
+        :param snapshot: Snapshot object, see snapshot
+        :return:
+        """
+        if not self.compiled:
+            raise Exception('The model should be compiled before restoring a snapshot.')
+
+        position = snapshot.position(self.start_time, self.params['time_step'].v())
+        for name, values in snapshot.values.items():
+            if name in self.components:
+                self.components[name].set_var_values(values, position)
+
+    def _results_frame(self, results):
+        """
+        Collect arrays of results in one DataFrame, backed by a single NumPy array
+
+        :param results: dict with result names as keys and 1D arrays as values
+        :return: pd.DataFrame
+        """
+        n_rows = max([len(values) for values in results.values()] or [0])
+        data = np.full((n_rows, len(results)), np.nan)
+        for i, values in enumerate(results.values()):
+            data[:len(values), i] = values
+
+        index = ut.time_index(self.start_time, self.params['time_step'].v(), n_rows)
+        return pd.DataFrame(data, index=index, columns=list(results), copy=False)
+
     def get_objective(self, objtype=None, get_value=True):
         """
         Return value of objective function. With no argument supplied, the active objective is returned. Otherwise, the
@@ -878,15 +1183,14 @@ class Modesto:
 
     def get_heat_stor(self):
         """
-        Return dictionary of initial storage states
+        Return dictionary of storage state variables
 
-        :return:
+        :return: dict with 'node.comp' as keys and the heat_stor variables as values
         """
         out = {}
 
-        for node_name, node_obj in self.nodes.items():
-            for comp_name, comp_obj in node_obj.get_heat_stor().items():
-                out['.'.join([node_name, comp_name])] = comp_obj
+        for node_name in self.get_nodes():
+            out.update(self.get_component(name=node_name).get_heat_stor_init())
 
         return out
 
@@ -935,6 +1239,12 @@ class Node(Submodel):
         self.components = {}
         self.pipes = {}
 
+        # Mass flow rate direction of the connected elements, temperature driven models only (see set_flow_direction)
+        self.flow_elements = []
+        self.flow_position = {}
+        self.flow_mflo = None
+        self.flow_direction = None
+
         self.compiled = False
         self.repr_days = repr_days
 
@@ -1057,31 +1367,53 @@ class Node(Submodel):
                   }
         return params
 
-    def compile(self, model, start_time):
+    def compile(self, model, start_time, only_dirty=False, run_report=None, balance=True):
         """
 
         :param pd.Timestamp start_time: start time of optimization
         :param model:
-        :return:
-        """
+        :param only_dirty: If True and the node was compiled before, only components with changed parameters are
+            refreshed
+        :param run_report: RunReport to which the compilation times of the components and of the node balances are
+            added
+        :param balance: If False, the node gets no block and no balances, which are then added for the whole network
+            (see Modesto)
+        :return: List with the names of the components that were (re)compiled
+        """
+        def timed(name):
+            return run_report.component(name) if run_report is not None else nullcontext()
+
+        refreshed = []
         if self.compiled:
             for name, comp in self.components.items():
-                comp.compile(model, start_time)
+                if only_dirty and not comp.is_dirty():
+                    continue
+                with timed(name):
+                    comp.compile(model, start_time)
+                refreshed.append(name)
 
         else:
             self.set_time_axis()
-            self._make_block(model)
+            if balance:
+                self._make_block(model)
+            else:
+                self.model = model
+                self.block = None
 
             for name, comp in self.components.items():
-                comp.compile(model, start_time)
+                with timed(name):
+                    comp.compile(model, start_time)
+                refreshed.append(name)
 
-            self._add_bal()
+            if balance:
+                with timed(self.name):
+                    self._add_bal()
 
             self.logger.info('Compilation of {} finished'.format(self.name))
 
         self.compiled = True
 
-        return
+        return refreshed
 
     def reinit(self):
         """
@@ -1092,6 +1424,46 @@ class Node(Submodel):
         if self.compiled:
             self.compiled = False
 
+    def set_flow_direction(self):
+        """
+        Determine, for every time step, the direction of the mass flow rate of all components and pipes connected to
+        this node. This only applies to temperature driven models, in which all mass flow rates are known beforehand.
+
+        The result is stored in flow_direction, an array with one row per time step and one column per connected
+        element (listed in flow_elements as ('comp', name) or ('pipe', name) tuples): 1 if the element's mass flow rate
+        enters the node on the supply line (a non-negative mass flow rate), -1 if it enters on the return line.
+        The mass flow rates themselves are stored in flow_mflo.
+
+        :return:
+        """
+        self.flow_elements = [('comp', name) for name in self.components] + \
+                             [('pipe', name) for name in self.pipes]
+        self.flow_position = {element: i for i, element in enumerate(self.flow_elements)}
+
+        mflo = np.zeros((len(self.TIME), len(self.flow_elements)))
+        for i, (kind, name) in enumerate(self.flow_elements):
+            if kind == 'comp':
+                obj = self.components[name]
+                mflo[:, i] = [value(obj.get_mflo(t)) for t in self.TIME]
+            else:
+                obj = self.pipes[name]
+                mflo[:, i] = [value(obj.get_edge_mflo(self.name, t)) for t in self.TIME]
+
+        self.flow_mflo = mflo
+        self.flow_direction = np.where(mflo >= 0, 1, -1).astype(np.int8)
+
+    def get_flow_direction(self):
+        """
+        Flow direction of all components and pipes connected to this node, see set_flow_direction
+
+        :return: pd.DataFrame with the time steps as index and the names of the connected elements as columns
+        """
+        if self.flow_direction is None:
+            raise Exception('The flow directions of node {} are only known after compiling a temperature driven '
+                            'model'.format(self.name))
+        return pd.DataFrame(self.flow_direction, index=self.TIME,
+                            columns=[name for _, name in self.flow_elements])
+
     def _add_bal(self):
         """
         Add balance equations after all blocks for this node and subcomponents have been compiled
@@ -1109,80 +1481,59 @@ class Node(Submodel):
 
             self.block.mix_temp = Var(self.TIME, lines)
 
-            def _temp_bal_incoming(b, t, l):
+            self.set_flow_direction()
+            elements = self.flow_elements
+            direction = self.flow_direction
+            mflo = self.flow_mflo
+            line_sign = {'supply': 1, 'return': -1}
 
-                incoming_comps = collections.defaultdict(list)
-                incoming_pipes = collections.defaultdict(list)
+            def _element_mflo(i, t):
+                kind, name = elements[i]
+                if kind == 'comp':
+                    return c[name].get_mflo(t)
+                return p[name].get_edge_mflo(self.name, t)
 
-                for name, comp in c.items():
-                    if value(comp.get_mflo(t)) >= 0:
-                        incoming_comps['supply'].append(name)
-                    else:
-                        incoming_comps['return'].append(name)
+            def _element_temp(i, t, l):
+                kind, name = elements[i]
+                if kind == 'comp':
+                    return c[name].get_temperature(t, l)
+                return p[name].get_edge_temperature(self.name, t, l)
+
+            def _temp_bal_incoming(b, t, l):
+                incoming = np.flatnonzero(direction[t] == line_sign[l])
 
-                for name, pipe in p.items():
-                    if value(pipe.get_edge_mflo(self.name, t)) >= 0:
-                        incoming_pipes['supply'].append(name)
-                    else:
-                        incoming_pipes['return'].append(name)
                 # Zero mass flow rate:
-                if value(
-                        sum(c[comp].get_mflo(t) for comp in incoming_comps[l]) + \
-                        sum(p[pipe].get_edge_mflo(self.name, t) for pipe in
-                            incoming_pipes[l])) == 0:
+                if mflo[t, incoming].sum() == 0:
                     # mixed temperature is average of all joined pipes, actual value should not matter,
                     # because packages in pipes of this time step will have zero size and components do not take over
                     # mixed temperature in case there is no mass flow
 
                     return b.mix_temp[t, l] == (
                             sum(c[comp].get_temperature(t, l) for comp in c) +
-                            sum(p[pipe].get_temperature(self.name, t, l) for
+                            sum(p[pipe].get_edge_temperature(self.name, t, l) for
                                 pipe in p)) / (
                                    len(p) + len(c))
 
-
                 else:  # mass flow rate through the node
-                    return (sum(
-                        c[comp].get_mflo(t) for comp in incoming_comps[l]) +
-                            sum(p[pipe].get_edge_mflo(self.name, t) for pipe in
-                                incoming_pipes[l])) * b.mix_temp[t, l] == \
-                           sum(c[comp].get_mflo(t) * c[comp].get_temperature(t,
-                                                                             l)
-                               for comp in incoming_comps[l]) + \
-                           sum(p[pipe].get_edge_mflo(self.name, t) * p[
-                               pipe].get_edge_temperature(self.name, t, l)
-                               for pipe in incoming_pipes[l])
+                    return sum(_element_mflo(i, t) for i in incoming) * b.mix_temp[t, l] == \
+                           sum(_element_mflo(i, t) * _element_temp(i, t, l) for i in incoming)
 
             self.block.def_mixed_temp = Constraint(self.TIME,
                                                    lines,
                                                    rule=_temp_bal_incoming)
 
             def _temp_bal_outgoing(b, t, l, comp):
-
-                outgoing_comps = collections.defaultdict(list)
-                outgoing_pipes = collections.defaultdict(list)
-
-                for name, comp_obj in c.items():
-                    if comp_obj.get_mflo(t) >= 0:
-                        outgoing_comps['return'].append(name)
-                    else:
-                        outgoing_comps['supply'].append(name)
-
-                for name, pipe_obj in p.items():
-                    if pipe_obj.get_edge_mflo(self.name, t) >= 0:
-                        outgoing_pipes['return'].append(name)
-                    else:
-                        outgoing_pipes['supply'].append(name)
-
                 if t == 0:
                     return Constraint.Skip
-                if comp in outgoing_pipes[l]:
-                    return p[comp].get_edge_temperature(self.name, t, l) == \
-                           b.mix_temp[t, l]
-                elif comp in outgoing_comps[l]:
-                    return c[comp].get_temperature(t, l) == b.mix_temp[t, l]
-                else:
-                    return Constraint.Skip
+
+                # Pipes are checked before components, in case a pipe and a component share a name
+                for kind in ['pipe', 'comp']:
+                    i = self.flow_position.get((kind, comp))
+                    if i is not None and direction[t, i] == -line_sign[l]:
+                        if kind == 'pipe':
+                            return p[comp].get_edge_temperature(self.name, t, l) == b.mix_temp[t, l]
+                        return c[comp].get_temperature(t, l) == b.mix_temp[t, l]
+                return Constraint.Skip
 
             self.block.outgoing_temp_comps = Constraint(self.TIME,
                                                         lines,
@@ -1360,6 +1711,12 @@ class Edge(object):
         self.pipe.compile(model, start_time)
 
     def get_length(self):
+        """
+        :return: The length attribute of the edge if given (e.g. for merged pipes, see network_reduction), otherwise
+            the distance between the start and end node
+        """
+        if 'length' in self.edge:
+            return self.edge['length']
 
         sumsq = 0
 
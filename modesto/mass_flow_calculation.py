@@ -3,6 +3,7 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 import collections
+from scipy.sparse.linalg import splu
 
 
 class MfCalculation(object):
@@ -14,12 +15,13 @@ class MfCalculation(object):
         self.time = range(0, int(self.horizon/self.time_step))
         self.index = None
 
-        self.inc_matrix = -nx.incidence_matrix(self.graph, oriented=True).todense()
+        self.inc_matrix = -nx.incidence_matrix(self.graph, oriented=True).tocsr()
         self.nodes, self.edges, self.components = self.get_model_structure()
         self.unknown_node = None
         self.unknown_comp = None
 
         self.mass_flows = collections.defaultdict(dict)
+        self.result = None  # DataFrame with all mass flow rates, see calculate_mf
 
     def get_model_structure(self):
         """
@@ -78,12 +80,12 @@ class MfCalculation(object):
         """
         Remove the unknown node and the corresponding row from the matrix to make the system determined
 
-        :return:the resulting matrix and deleted row
+        :return:the resulting (sparse) matrix and the deleted row (1D array)
         """
 
         row_nr = self.nodes.index(self.unknown_node)
-        row = self.inc_matrix[row_nr, :]
-        matrix = np.delete(self.inc_matrix, row_nr, 0)
+        row = self.inc_matrix[row_nr, :].toarray().ravel()
+        matrix = self.inc_matrix[np.arange(len(self.nodes)) != row_nr, :]
 
         return matrix, row, row_nr
 
@@ -95,52 +97,80 @@ class MfCalculation(object):
                 elif not comp in self.mass_flows[node].keys():
                     raise Exception('Add a mass flow for {} at node {}'.format(comp, node))
 
-    def initialize_mass_flows(self):
-        for edge in self.edges:
-            self.mass_flows[edge] = pd.Series(0, index=self.index)
-
-        self.mass_flows[self.unknown_node][self.unknown_comp] = pd.Series(0, index=self.index)
+    def solve(self, matrix, rhs):
+        """
+        Solve the reduced network equations for all time steps at once. Only radial networks are supported: they give
+        a square system, which is factorized once. In a meshed network, the node balances alone do not determine the
+        mass flow rates, so an error is raised.
 
-    def calculate_mf(self):
+        :param matrix: Reduced incidence matrix (nodes x edges)
+        :param rhs: Known node mass flow rates (nodes x time)
+        :return: Edge mass flow rates (edges x time)
+        """
+        n_equations, n_edges = matrix.shape
+        if n_edges > n_equations:
+            raise ValueError('The network has {} edges but only {} independent node balances. The mass flow rates of '
+                             'a meshed network cannot be calculated without loop equations'.format(n_edges,
+                                                                                                   n_equations))
+        if n_edges < n_equations:
+            raise ValueError('The network has {} edges for {} nodes, it is not connected'.format(n_edges,
+                                                                                                n_equations + 1))
+        try:
+            return splu(matrix.tocsc()).solve(rhs)
+        except RuntimeError:
+            raise ValueError('The network equations are singular, the network is not connected')
+
+    def calculate_mf(self, as_frame=False):
         """
         Given the heat demands of all substations, calculate the mass flow throughout the entire network
         !!!! Only one producer node possible at the moment, with only a single component at this node
-        :return:
+
+        :param as_frame: If True, return the mass flow rates as a single DataFrame, with the edge names and the
+            components (as node.comp) as columns
+        :return: dict with the mass flow rates (pd.Series) of the edges and, per node, of the components, or a
+            DataFrame if as_frame is True
         """
         # TODO Only one producer node possible at the moment, with only a single componenta at the node
 
         self.check_data()
-        self.initialize_mass_flows()
         matrix, row, row_nr = self.get_reduced_matrix()
+        n_steps = min(len(self.time), len(self.index))
+
+        # Collect known mass flow rates at components and add them to corresponding nodes
+        vector = np.zeros((len(self.nodes), n_steps))
+        for i, node in enumerate(self.nodes):
+            if not node == self.unknown_node:
+                for comp in self.components[node]:
+                    vector[i] += np.asarray(self.get_comp_mf(node, comp), dtype=np.float64)[:n_steps]
+        vector = np.delete(vector, row_nr, 0)
+
+        # Solve system
+        sol = np.zeros((len(self.edges), len(self.index)))
+        sol[:, :n_steps] = self.solve(matrix, vector)
+
+        result = pd.DataFrame(sol.T, index=self.index, columns=self.edges)
+
+        # Calculate mass flow through producer node and producer component
+        unknown_node_mf = row.dot(sol)
+        for comp in self.components[self.unknown_node]:
+            if comp != self.unknown_comp:
+                unknown_node_mf = unknown_node_mf - np.asarray(self.get_comp_mf(self.unknown_node, comp),
+                                                               dtype=np.float64)
+        unknown_node_mf[n_steps:] = 0
 
-        for t in self.time:
-            # initializing vector with node mass flow rates
-            vector = [0] * len(self.nodes)
-
-            # Collect known mass flow rates at components and add them to corresponding nodes
-            for i, node in enumerate(self.nodes):
-                if not node == self.unknown_node:
-                    node_comps = self.components[node]
-                    for comp in node_comps:
-                        vector[i] += self.get_comp_mf(node, comp, index=t)
-
-            del vector[row_nr]
-
-            # Solve system
-            sol = np.linalg.solve(matrix, vector)
-
-            # Save pipe mass flow rates
-            for i, edge in enumerate(self.edges):
-               self.mass_flows[edge].iloc[t] = sol[i]
-
-            # Calculate mass flow through producer node
-            unknown_node_mf = (sum(
-                self.mass_flows[edge][t] * row[0, i] for i, edge in
-                enumerate(self.edges)))
+        for node in self.nodes:
+            for comp in self.components[node]:
+                if node == self.unknown_node and comp == self.unknown_comp:
+                    result[node + '.' + comp] = unknown_node_mf
+                else:
+                    result[node + '.' + comp] = np.asarray(self.get_comp_mf(node, comp), dtype=np.float64)
 
-            # Calculate mass flow through producer component
-            self.mass_flows[self.unknown_node][self.unknown_comp].iloc[t] = \
-                unknown_node_mf - sum(self.mass_flows[self.unknown_node][x].iloc[t]
-                                      for x in self.components[self.unknown_node])
+        # Save pipe and producer mass flow rates
+        for edge in self.edges:
+            self.mass_flows[edge] = result[edge]
+        self.mass_flows[self.unknown_node][self.unknown_comp] = result[self.unknown_node + '.' + self.unknown_comp]
+        self.result = result
 
-        return self.mass_flows
\ No newline at end of file
+        if as_frame:
+            return result
+        return self.mass_flows
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+"""
+Reduction of the network graph before building a modesto model: series pipes are merged and leaf buildings are
+aggregated into their parent node
+"""
+
+import logging
+from collections import OrderedDict
+from math import sqrt
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('modesto.network_reduction')
+
+# Parameters of aggregated buildings that are combined into a weighted average profile. All other parameters should
+# be the same for all buildings of an aggregate.
+PROFILES = ['heat_profile', 'DHW_demand']
+
+# Pipe results that are distributed over the merged pipes according to their length
+PIPE_LOSSES = ['heat_loss_tot', 'pumping_power']
+
+# Pipe results of a removed service pipe that follow from the flows of its building
+SERVICE_FLOWS = ['mass_flow', 'heat_flow_in', 'heat_flow_out']
+
+
+class NetworkReduction(object):
+    def __init__(self, graph, merge_series=True, aggregate_leaves=True, pipe_keys=None, building_keys=None,
+                 keep=(), building_types=('BuildingFixed',)):
+        """
+        Reduce a network graph for modesto (see Modesto), keeping track of the original nodes, components and pipes.
+
+        Leaf nodes with only buildings are removed together with the pipe connecting them to their parent node. Their
+        buildings are aggregated into one component of the parent node, with the number of buildings (mult) summed and
+        the profiles averaged (weighted by mult), which gives the same total heat demand. The heat losses and pumping
+        power of the removed service pipes are neglected.
+
+        Chains of pipes through nodes without components are merged into one pipe with the summed length. Only pipes
+        with the same orientation and the same known key (e.g. the diameter) are merged: the diameters are set later
+        through change_param, so they should be given in pipe_keys or as diameter attribute of the edges. Pipes
+        without a key are not merged.
+
+        Parameters of the original components are set with change_params, which translates them to the components of
+        the reduced network, and results of the original components are obtained with get_result.
+
+        :param graph: networkx DiGraph of the network, see Modesto. Edges may have a length attribute, otherwise the
+            length is the distance between their nodes.
+        :param merge_series: If True, series pipes are merged
+        :param aggregate_leaves: If True, leaf buildings are aggregated into their parent node
+        :param pipe_keys: dict with a key per pipe name (e.g. the diameter). Only pipes with the same key are merged.
+            Pipes that are not in pipe_keys use the diameter attribute of their edge, if any.
+        :param building_keys: dict with a key per node name or (node, component) tuple. Only leaf buildings with the
+            same key are aggregated into the same component. Default: all leaf buildings of a parent node together.
+        :param keep: Names of nodes that should not be removed
+        :param building_types: Component types that are aggregated
+        """
+        self.original = graph
+        self.pipe_keys = pipe_keys or {}
+        self.building_keys = building_keys or {}
+        self.keep = set(keep)
+        self.building_types = building_types
+
+        self.node_map = OrderedDict((node, node) for node in graph.nodes)  # Original node: reduced node or None
+        self.comp_map = OrderedDict()  # (node, comp): (reduced node, reduced comp)
+        self.groups = OrderedDict()  # (reduced node, reduced comp): list of original (node, comp) tuples
+        self.chains = OrderedDict()  # Reduced pipe: list of (original pipe, start fraction, end fraction)
+        self.pipe_map = OrderedDict()  # Original pipe: reduced pipe, None if removed
+        self.service_pipes = OrderedDict()  # Removed pipe: (leaf node, sign of the flow towards the leaf)
+
+        for node, comps in graph.nodes(data='comps'):
+            for comp in comps or {}:
+                self.comp_map[node, comp] = (node, comp)
+        for _, _, pipe in graph.edges(data='name'):
+            self.pipe_map[pipe] = pipe
+
+        self.graph = graph.copy()
+        for node in self.graph.nodes:
+            self.graph.nodes[node]['comps'] = dict(self.graph.nodes[node].get('comps') or {})
+        for start, end in self.graph.edges:
+            self.graph.edges[start, end]['length'] = self.original_length(start, end)
+
+        if aggregate_leaves:
+            self.aggregate_leaves()
+        if merge_series:
+            if not self.pipe_keys and all(diameter is None for _, _, diameter in graph.edges(data='diameter')):
+                logger.warning('No diameters given for the pipes, series pipes are not merged')
+            self.merge_series()
+
+        self._params = {}  # (node, comp): dict with the parameters set through change_params
+        self._values = {}  # (reduced node, reduced comp): dict with the values set on the reduced components
+
+        logger.info('Network reduced from {} to {} nodes and from {} to {} pipes'.format(
+            graph.number_of_nodes(), self.graph.number_of_nodes(),
+            graph.number_of_edges(), self.graph.number_of_edges()))
+
+    def original_length(self, start, end):
+        """
+        :return: Length of an edge of the original graph
+        """
+        edge = self.original.edges[start, end]
+        if 'length' in edge:
+            return edge['length']
+        return float(sqrt(sum((self.original.nodes[start][i] - self.original.nodes[end][i]) ** 2
+                              for i in ['x', 'y', 'z'])))
+
+    def _pipe_key(self, start, end):
+        edge = self.graph.edges[start, end]
+        return self.pipe_keys.get(edge['name'], edge.get('diameter'))
+
+    def _building_key(self, node, comp):
+        return self.building_keys.get((node, comp), self.building_keys.get(node))
+
+    def _is_leaf_building(self, node):
+        comps = self.graph.nodes[node]['comps']
+        return node not in self.keep and len(comps) > 0 and self.graph.degree(node) == 1 and \
+            all(comp_type in self.building_types for comp_type in comps.values())
+
+    def aggregate_leaves(self):
+        """
+        Aggregate the buildings of leaf nodes into their parent node
+
+        :return:
+        """
+        aggregates = {}  # (parent, type, key): reduced component name
+        for node in list(self.graph.nodes):
+            if not self._is_leaf_building(node):
+                continue
+            parent = next(iter(set(self.graph.predecessors(node)) | set(self.graph.successors(node))))
+            if self._is_leaf_building(parent):
+                continue  # Network of two buildings
+
+            if self.graph.has_edge(parent, node):
+                pipe, sign = self.graph.edges[parent, node]['name'], 1
+            else:
+                pipe, sign = self.graph.edges[node, parent]['name'], -1
+
+            parent_comps = self.graph.nodes[parent]['comps']
+            for comp, comp_type in self.graph.nodes[node]['comps'].items():
+                group = (parent, comp_type, self._building_key(node, comp))
+                if group not in aggregates:
+                    i = 0
+                    while 'leaves{}'.format(i) in parent_comps:
+                        i += 1
+                    aggregates[group] = 'leaves{}'.format(i)
+                    parent_comps[aggregates[group]] = comp_type
+                    self.groups[parent, aggregates[group]] = []
+                self.comp_map[node, comp] = (parent, aggregates[group])
+                self.groups[parent, aggregates[group]].append((node, comp))
+
+            self.pipe_map[pipe] = None
+            self.service_pipes[pipe] = (node, sign)
+            self.node_map[node] = parent
+            self.graph.remove_node(node)
+
+    def _is_series_node(self, node):
+        if node in self.keep or self.graph.nodes[node]['comps']:
+            return False
+        if self.graph.in_degree(node) != 1 or self.graph.out_degree(node) != 1:
+            return False
+        start = next(iter(self.graph.predecessors(node)))
+        end = next(iter(self.graph.successors(node)))
+        key = self._pipe_key(start, node)
+        return start != end and key is not None and key == self._pipe_key(node, end)
+
+    def merge_series(self):
+        """
+        Merge chains of pipes through nodes without components into one pipe
+
+        :return:
+        """
+        for start, end in list(self.graph.edges):
+            if not self.graph.has_edge(start, end) or self._is_series_node(start):
+                continue
+            chain = [(start, end)]
+            while self._is_series_node(chain[-1][1]) and len(chain) <= self.graph.number_of_nodes():
+                node = chain[-1][1]
+                chain.append((node, next(iter(self.graph.successors(node)))))
+            last = chain[-1][1]
+            if len(chain) == 1 or last == start or self.graph.has_edge(start, last):
+                continue
+
+            lengths = np.array([self.graph.edges[edge]['length'] for edge in chain], dtype=float)
+            bounds = np.concatenate([[0], np.cumsum(lengths)]) / lengths.sum()
+            names = [self.graph.edges[edge]['name'] for edge in chain]
+
+            attributes = dict(self.graph.edges[chain[0]])
+            attributes['length'] = float(lengths.sum())
+            for edge in chain:
+                self.graph.remove_edge(*edge)
+            for edge in chain[1:]:
+                self.node_map[edge[0]] = None
+                self.graph.remove_node(edge[0])
+            self.graph.add_edge(start, last, **attributes)
+
+            self.chains[names[0]] = [(name, bounds[i], bounds[i + 1]) for i, name in enumerate(names)]
+            for name in names:
+                self.pipe_map[name] = names[0]
+
+    def summary(self):
+        """
+        :return: dict with the number of nodes, pipes and components before and after the reduction
+        """
+        return {'nodes': (self.original.number_of_nodes(), self.graph.number_of_nodes()),
+                'pipes': (self.original.number_of_edges(), self.graph.number_of_edges()),
+                'components': (len(self.comp_map), len(set(self.comp_map.values())))}
+
+    def reduced_component(self, node, comp):
+        """
+        :param node: Name of the original node, None for pipes
+        :param comp: Name of the original component or pipe
+        :return: (node, comp) tuple of the component of the reduced network, (None, pipe) for pipes. Removed pipes
+            raise a KeyError.
+        """
+        if node is None:
+            if comp not in self.pipe_map:
+                raise KeyError('{} is not a pipe of the original network'.format(comp))
+            if self.pipe_map[comp] is None:
+                raise KeyError('Pipe {} was removed with its leaf node {}'.format(comp, self.service_pipes[comp][0]))
+            return None, self.pipe_map[comp]
+        if (node, comp) not in self.comp_map:
+            raise KeyError('{}.{} is not a component of the original network'.format(node, comp))
+        return self.comp_map[node, comp]
+
+    def change_params(self, optmodel, dict, node=None, comp=None):
+        """
+        Change parameters of an original component, node or pipe in the model of the reduced network, see
+        Modesto.change_params. Parameters of removed service pipes are ignored.
+
+        :param optmodel: Modesto object built from the reduced graph
+        :param dict: Dictionary with the names of the parameters as keys and their values as values
+        :param node: Name of the original node, None for pipes and general parameters
+        :param comp: Name of the original component or pipe, None for general parameters
+        :return:
+        """
+        if comp is None:
+            optmodel.change_params(dict)
+            return
+        for param, val in dict.items():
+            self.change_param(optmodel, node, comp, param, val)
+
+    def change_param(self, optmodel, node, comp, param, val):
+        """
+        Change a parameter of an original component or pipe in the model of the reduced network. For aggregated
+        buildings, mult is the sum and the profiles are the average (weighted by mult) of the original buildings, and
+        are set once all of them are known. Other parameters of merged pipes and aggregated buildings should be the
+        same for all original components.
+
+        :param optmodel: Modesto object built from the reduced graph
+        :param node: Name of the original node, None for pipes
+        :param comp: Name of the original component or pipe
+        :param param: Name of the parameter
+        :param val: New value of the parameter
+        :return:
+        """
+        if node is None and self.pipe_map.get(comp, comp) is None:
+            return
+
+        self._params.setdefault((node, comp), {})[param] = val
+        reduced = self.reduced_component(node, comp)
+
+        if reduced in self.groups and (param == 'mult' or param in PROFILES):
+            members = self.groups[reduced]
+            params = [self._params.get(member, {}) for member in members]
+            if not all('mult' in member for member in params):
+                return
+            mults = np.array([member['mult'] for member in params], dtype=float)
+            self._set(optmodel, reduced, 'mult', mults.sum())
+            for profile in PROFILES:
+                if all(profile in member for member in params):
+                    total = sum(mult * member[profile] for mult, member in zip(mults, params))
+                    self._set(optmodel, reduced, profile, total / mults.sum())
+            return
+
+        values = self._values.setdefault(reduced, {})
+        if param in values and not _same(values[param], val):
+            raise ValueError('Parameter {} of {} differs from that of the other components merged into {}'.format(
+                param, comp if node is None else '{}.{}'.format(node, comp), '.'.join(c for c in reduced if c)))
+        self._set(optmodel, reduced, param, val)
+
+    def _set(self, optmodel, reduced, param, val):
+        self._values.setdefault(reduced, {})[param] = val
+        optmodel.get_component(reduced[1], reduced[0]).change_param(param, val)
+
+    def _result(self, optmodel, name, node, comp, index, check_results, state):
+        """
+        Result of a component of the reduced network
+        """
+        if optmodel.results is None and check_results:
+            raise Exception('The optimization problem has not been solved yet.')
+        return optmodel.get_component(comp, node).get_result(name, index, state, optmodel.start_time)
+
+    def get_result(self, optmodel, name, node=None, comp=None, index=None, check_results=True, state=False):
+        """
+        Result of an original component or pipe, see Modesto.get_result
+
+        The results of an aggregated building are those of the aggregate, times the share of the building in the
+        total heat demand of the aggregate. Merged pipes have the flows of the merged pipe, with the heat losses and
+        pumping power divided according to length. Removed service pipes carry the flows of their building, without
+        losses.
+
+        :param optmodel: Solved Modesto object built from the reduced graph
+        :param name: Name of the variable or parameter
+        :param node: Name of the original node, None for pipes
+        :param comp: Name of the original component or pipe
+        :return: pd.Series
+        """
+        if node is None and comp in self.service_pipes:
+            leaf, sign = self.service_pipes[comp]
+            building = self.original_components(leaf)[0]
+            if name in PIPE_LOSSES:
+                result = self.get_result(optmodel, 'heat_flow', leaf, building, None, check_results, state) * 0.
+            elif name == 'mass_flow_abs':
+                result = self.get_result(optmodel, 'mass_flow', leaf, building, None, check_results, state).abs()
+            elif name in SERVICE_FLOWS:
+                flow = 'mass_flow' if name == 'mass_flow' else 'heat_flow'
+                result = sign * self.get_result(optmodel, flow, leaf, building, None, check_results, state)
+            else:
+                raise KeyError('Result {} is not available for the removed pipe {}'.format(name, comp))
+            return result.rename('{}.{}'.format(comp, name))
+
+        reduced_node, reduced_comp = self.reduced_component(node, comp)
+        result = self._result(optmodel, name, reduced_node, reduced_comp, index, check_results, state)
+
+        if node is None and reduced_comp in self.chains:
+            start, end = [(a, b) for pipe, a, b in self.chains[reduced_comp] if pipe == comp][0]
+            if name in PIPE_LOSSES:
+                result = result * (end - start)
+            elif name in ['heat_flow_in', 'heat_flow_out']:
+                # The heat flow decreases linearly along the merged pipe
+                inflow = self._result(optmodel, 'heat_flow_in', None, reduced_comp, None, check_results, state)
+                loss = self._result(optmodel, 'heat_loss_tot', None, reduced_comp, None, check_results, state)
+                result = inflow - (start if name == 'heat_flow_in' else end) * loss
+            return result.rename('{}.{}'.format(comp, name))
+
+        if (reduced_node, reduced_comp) in self.groups:
+            result = result * self.building_share(optmodel, node, comp, result.index)
+            return result.rename('{}.{}.{}'.format(node, comp, name))
+
+        return result
+
+    def original_components(self, node):
+        """
+        :param node: Name of an original node
+        :return: List of the names of the original components of this node
+        """
+        return [c for n, c in self.comp_map if n == node]
+
+    def building_share(self, optmodel, node, comp, index):
+        """
+        Share of an original building in the heat demand (space heating and domestic hot water) of its aggregate
+
+        :param optmodel: Modesto object built from the reduced graph
+        :param node: Name of the original node
+        :param comp: Name of the original component
+        :param index: Time index at which the share is needed
+        :return: np.array with the share at every time in index
+        """
+        reduced = self.comp_map[node, comp]
+        members = self.groups[reduced]
+        params = [self._params.get(member, {}) for member in members]
+
+        # Heat per l/min of domestic hot water, see BuildingFixed
+        component = optmodel.get_component(reduced[1], reduced[0])
+        dhw_heat = 0
+        if any('DHW_demand' in member for member in params):
+            dhw_heat = (min(component.params['temperature_supply'].v(), 55 + 273.15) - 283.15) / 60 * component.cp
+
+        demands = []
+        for member in params:
+            if 'mult' not in member or 'heat_profile' not in member:
+                raise Exception('The parameters of the aggregated buildings were not set through change_params')
+            demand = _at(member['heat_profile'], index)
+            if 'DHW_demand' in member:
+                demand = demand + dhw_heat * _at(member['DHW_demand'], index)
+            demands.append(member['mult'] * demand)
+        demands = np.array(demands)
+        total = demands.sum(axis=0)
+        mults = np.array([member['mult'] for member in params], dtype=float)
+
+        i = members.index((node, comp))
+        return np.where(total > 0, demands[i] / np.where(total > 0, total, 1), mults[i] / mults.sum())
+
+
+def _at(series, index):
+    """
+    Values of a time series at the times of an index, interpolated in time
+    """
+    if not isinstance(series, pd.Series):
+        return np.full(len(index), float(series))
+    if series.index.equals(index):
+        return series.values.astype(float)
+    union = series.index.union(index)
+    return series.reindex(union).interpolate(method='time', limit_direction='both').reindex(index).values
+
+
+def _same(a, b):
+    """
+    True if two parameter values are equal
+    """
+    if a is b:
+        return True
+    try:
+        if isinstance(a, (pd.Series, pd.DataFrame)) or isinstance(b, (pd.Series, pd.DataFrame)):
+            return a.equals(b)
+        return bool(np.all(np.asarray(a) == np.asarray(b)))
+    except (TypeError, ValueError, AttributeError):
+        return False
@@ -1,9 +1,9 @@
 import logging
 
 import modesto.utils as ut
+import numpy as np
 import pandas as pd
 from pyomo.core import Param
-from scipy import interpolate
 
 
 class Parameter(object):
@@ -28,6 +28,7 @@ class Parameter(object):
 
         self.mutable = mutable
         self.constructed = False
+        self.dirty = True  # Value changed since the last compilation
 
         self.param = None
         self.block = None
@@ -50,6 +51,7 @@ class Parameter(object):
         :return:
         """
         self.value = new_val
+        self.dirty = True
         if not self.mutable:
             self.logger.info(
                 'Changing value in parameter {}. Model needs to be recompiled for changes to take effect.'.format(
@@ -61,9 +63,32 @@ class Parameter(object):
     def is_constructed(self):
         return self.constructed
 
+    def is_dirty(self):
+        """
+        :return: True if the parameter was changed since the last compilation of the model
+        """
+        return self.dirty
+
+    def clear_dirty(self):
+        """
+        Mark the parameter as unchanged, called after the model has been compiled
+
+        :return:
+        """
+        self.dirty = False
+
     def resample(self):
         pass
 
+    def slice_horizon(self, repr_days=None):
+        """
+        Prepare the values of the current optimization horizon for fast access. Only relevant for time series.
+
+        :param repr_days: Sorted list of representative days, None if no representative days are used
+        :return:
+        """
+        pass
+
     def check(self):
         """
         Check whether the value of the parameter is known, otherwise an error is raised
@@ -218,6 +243,7 @@ class StateParameter(Parameter):
                     new_type))
 
         self.init_type = new_type
+        self.dirty = True
 
     def change_upper_bound(self, new_ub):
         """
@@ -227,6 +253,7 @@ class StateParameter(Parameter):
         :param new_ub: New value of the upper bound
         """
         self.ub = new_ub
+        self.dirty = True
 
     def change_lower_bound(self, new_lb):
         """
@@ -236,6 +263,7 @@ class StateParameter(Parameter):
         :param new_lb: New value of the upper bound
         """
         self.lb = new_lb
+        self.dirty = True
 
     def change_slack(self, new_slack):
         """
@@ -246,6 +274,7 @@ class StateParameter(Parameter):
         :param new_slack: New value of the upper bound
         """
         self.slack = new_slack
+        self.dirty = True
 
     def get_slack(self):
         """
@@ -298,6 +327,11 @@ class SeriesParameter(Parameter):
             self.value = self.value.astype('float')
         self.unit_index = unit_index
 
+        # Breakpoints of the look-up table, built by _build_table
+        self._x = None
+        self._y = None
+        self._build_table()
+
     def change_value(self, new_val):
         """
         Change value of this SeriesParameter or derived class to a lookup table.
@@ -306,8 +340,52 @@ class SeriesParameter(Parameter):
         :return:
         """
         self.value = new_val
+        self.dirty = True
         if isinstance(new_val, pd.Series):
             self.value.index = self.value.index.astype('float')
+        self._build_table()
+
+    def _build_table(self):
+        """
+        Store the look-up table as breakpoint arrays, sorted by the independent variable
+
+        :return:
+        """
+        if isinstance(self.value, pd.Series):
+            x = self.value.index.values.astype(np.float64)
+            y = self.value.values.astype(np.float64)
+            order = np.argsort(x, kind='stable')
+            self._x = x[order]
+            self._y = y[order]
+        else:
+            self._x = None
+            self._y = None
+
+    def _interpolate(self, index):
+        """
+        Piecewise linear interpolation in the look-up table, with linear extrapolation from the two extreme
+        breakpoints at both sides.
+
+        :param index: Independent variable value(s)
+        :return: Dependent variable value(s), float for a scalar index, array otherwise
+        """
+        x, y = self._x, self._y
+        index = np.asarray(index, dtype=np.float64)
+        result = np.interp(index, x, y)
+
+        if len(x) > 1:
+            below = index < x[0]
+            above = index > x[-1]
+            if below.any():
+                slope = (y[1] - y[0]) / (x[1] - x[0])
+                result = np.where(below, y[0] + slope * (index - x[0]), result)
+            if above.any():
+                slope = (y[-1] - y[-2]) / (x[-1] - x[-2])
+                result = np.where(above, y[-1] + slope * (index - x[-1]), result)
+
+        if result.ndim == 0:
+            return float(result)
+        return result
 
     def get_value(self, index):
         """
@@ -316,17 +394,18 @@ class SeriesParameter(Parameter):
         index (input) is multiplied by this unit price to get the final value. If the cost is indicated in table format,
         the cost is returned as-is.
 
-        :param index:   independent variable value. Cannot be None.
+        :param index:   independent variable value, or an array of values to evaluate them all at once. Cannot be
+                        None.
         :return:
         """
         if self.value is None:
             raise Exception('Parameter {} has no value yet'.format(self.name))
         elif isinstance(self.value, (int, float)):
+            if isinstance(index, (list, tuple)):
+                index = np.asarray(index, dtype=np.float64)
             return self.value * index
         else:
-            f = interpolate.interp1d(self.value.index.values, self.value.values,
-                                     fill_value='extrapolate')
-            return f(index)
+            return self._interpolate(index)
 
     def v(self, index):
         """
@@ -341,7 +420,9 @@ class SeriesParameter(Parameter):
 class TimeSeriesParameter(Parameter):
     def __init__(self, name, description, unit, val=None, mutable=False):
         """
-        Class that describes a parameter with a value consisting of a dataframe
+        Class that describes a parameter with a value consisting of a dataframe. The values of the optimization
+        horizon are sliced once (see slice_horizon), so a value that is modified in place is only used after it is
+        passed to change_value again.
 
         :param name:        Name of the parameter (str)
         :param description: Description of the parameter (str)
@@ -353,6 +434,14 @@ class TimeSeriesParameter(Parameter):
         self.time_step = None
         self.horizon = None
         self.start_time = None
+
+        # Horizon values sliced into arrays by slice_horizon
+        self._values = None
+        self._repr_values = None
+        self._repr_index = {}
+        self._slice_key = None
+        self._repr_days = None
+
         Parameter.__init__(self, name, description, unit, val, mutable=mutable)
 
     # todo indexed time variables (such as return/supply temperature profile could use two or more columns to distinguish between indexes instead of using multiple indexes. These parameters would become real TimeDataFrameParameters. Just an idea ;)
@@ -394,6 +483,8 @@ class TimeSeriesParameter(Parameter):
             return None
         else:
             if c is None:
+                if self._values is not None and 0 <= time < len(self._values):
+                    return self._values[time]
                 if self.time_data:
                     timeindex = self.start_time + pd.Timedelta(
                         seconds=time * self.time_step)
@@ -403,6 +494,9 @@ class TimeSeriesParameter(Parameter):
                 else:
                     return self.value[time]
             else:
+                row = self._repr_index.get(c)
+                if row is not None and 0 <= time < self._repr_values.shape[1]:
+                    return self._repr_values[row, time]
                 if self.time_data:
                     timeindex = self.start_time + pd.Timedelta(days=c,
                                                                seconds=time * self.time_step)
@@ -415,9 +509,123 @@ class TimeSeriesParameter(Parameter):
     def v(self, time=None, c=None):
         return self.get_value(time, c=c)
 
+    def v_array(self):
+        """
+        Returns all values of the current optimization horizon as a float64 array. If representative days are used,
+        a 2D array with one row per representative day (in the order of REPR_DAYS) and one column per time step is
+        returned. The returned array should not be modified.
+
+        :return: np.ndarray
+        """
+        if self.value is None:
+            raise Exception('Parameter {} has no value yet'.format(self.name))
+
+        if self._slice_key is None:
+            self.slice_horizon(self._repr_days)
+        if self._slice_key is None:
+            raise Exception(
+                'No start time, time step or horizon has been given to parameter {} yet'.format(self.name))
+
+        if self._repr_days is None:
+            values = self._values
+        else:
+            values = self._repr_values
+        if values is None:
+            # Horizon could not be sliced from the data, look up values one by one
+            if self._repr_days is None:
+                values = np.array([self.get_value(t) for t in range(int(self.horizon // self.time_step))],
+                                  dtype=np.float64)
+            else:
+                values = np.array([[self.get_value(t, c) for t in range(int(24 * 3600 // self.time_step))]
+                                   for c in self._repr_days], dtype=np.float64)
+        return values
+
+    def slice_horizon(self, repr_days=None):
+        """
+        Slice the values of the current optimization horizon into contiguous float64 arrays, such that v(t) and
+        v(t, c) become array look-ups. Slicing is skipped if start time, time step, horizon and data did not change.
+        Only replacing the data is detected, not changes in place: pass a modified Series to change_value again.
+
+        :param repr_days: Sorted list of representative days, None if no representative days are used
+        :return:
+        """
+        if None in (self.start_time, self.time_step, self.horizon):
+            return
+
+        repr_days = None if repr_days is None else tuple(repr_days)
+        self._repr_days = repr_days
+        key = (self.start_time, self.time_step, self.horizon, repr_days,
+               id(self.value))
+        if key == self._slice_key:
+            return
+
+        self._invalidate()
+        self._slice_key = key
+
+        n_steps = int(self.horizon // self.time_step)
+        if self.time_data:
+            self._values = self._take(self._time_range(0, n_steps))
+        elif isinstance(self.value, (int, float)):
+            self._values = np.full(n_steps, self.value, dtype=np.float64)
+        else:
+            return
+
+        if repr_days is not None:
+            n_day = int(24 * 3600 // self.time_step)
+            if self.time_data:
+                rows = [self._take(self._time_range(c, n_day)) for c in repr_days]
+                if any(row is None for row in rows):
+                    return
+                self._repr_values = np.vstack(rows)
+            else:
+                self._repr_values = np.full((len(repr_days), n_day),
+                                            self.value, dtype=np.float64)
+            self._repr_index = {c: i for i, c in enumerate(repr_days)}
+
+    def _time_range(self, day, n_steps):
+        """
+        Time stamps of n_steps consecutive time steps, starting day days after the start time
+
+        :param day: Number of days after start time
+        :param n_steps: Number of time steps
+        :return: pd.DatetimeIndex
+        """
+        return self.start_time + pd.Timedelta(days=day) + pd.to_timedelta(
+            np.arange(n_steps) * self.time_step, unit='s')
+
+    def _take(self, times):
+        """
+        Look up the values at the given time stamps in one go
+
+        :param times: pd.DatetimeIndex
+        :return: float64 array, None if not all time stamps are present in the data
+        """
+        index = self.value.index
+        if not index.is_unique:
+            return None
+        positions = index.get_indexer(times)
+        if (positions < 0).any():
+            self.logger.debug(
+                'Not all time steps of parameter {} are in its data, falling back to pandas indexing'.format(
+                    self.name))
+            return None
+        return np.asarray(self.value.values, dtype=np.float64)[positions]
+
+    def _invalidate(self):
+        """
+        Remove the sliced horizon values
+
+        :return:
+        """
+        self._values = None
+        self._repr_values = None
+        self._repr_index = {}
+        self._slice_key = None
+
     def change_value(self, new_val):
         """
-        Change the value of the Dataframe parameter
+        Change the value of the Dataframe parameter. This is also needed after the current value was modified in
+        place, to slice the horizon again.
 
         :param new_val: New value of the parameter
         """
@@ -434,21 +642,28 @@ class TimeSeriesParameter(Parameter):
             new_val = ut.resample(new_val, new_sample_time=self.time_step)
 
         self.value = new_val
+        self.dirty = True
+        self._invalidate()
 
     def change_start_time(self, val):
-        if isinstance(val, pd.Timestamp):
-            self.start_time = val
-        elif isinstance(val, str):
-            self.start_time = pd.Timestamp(val)
-        else:
+        if isinstance(val, str):
+            val = pd.Timestamp(val)
+        elif not isinstance(val, pd.Timestamp):
             raise TypeError(
                 'New start time should be pandas timestamp or string representation of a timestamp')
+        if val != self.start_time:
+            self.start_time = val
+            self._invalidate()
 
     def change_horizon(self, val):
-        self.horizon = val
+        if val != self.horizon:
+            self.horizon = val
+            self._invalidate()
 
     def change_time_step(self, val):
-        self.time_step = val
+        if val != self.time_step:
+            self.time_step = val
+            self._invalidate()
 
     def resample(self):
         """
@@ -457,7 +672,10 @@ class TimeSeriesParameter(Parameter):
         :return:
         """
         if self.time_data:  # TODO This is a TimeSeries Parameter, a Boolean indicating whether or not it contains time data should be unnecessary
-            self.value = ut.resample(self.value, new_sample_time=self.time_step)
+            resampled = ut.resample(self.value, new_sample_time=self.time_step)
+            if resampled is not self.value:
+                self.value = resampled
+                self._invalidate()
 
 
 class UserDataParameter(TimeSeriesParameter):
@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 import warnings
 from functools import reduce
 from math import pi
@@ -10,9 +11,150 @@ from modesto.component import Component
 from modesto.parameter import DesignParameter, StateParameter, UserDataParameter, \
     WeatherDataParameter
 from pkg_resources import resource_filename
-from pyomo.core.base import Param, Var, Constraint, Set, NonNegativeReals
+from pyomo.core.base import Param, Var, Constraint, Set, NonNegativeReals, Binary, Expression, value
 
 CATALOG_PATH = resource_filename('modesto', 'Data/PipeCatalog')
+DEFAULT_CATALOG = 'Twin200Compound1000'
+
+
+class PipeSpec(object):
+    """
+    Catalog data of a single pipe diameter
+    """
+    __slots__ = ('dn', 'di', 'do', 'rs', 'f', 'mflo_max')
+
+    def __init__(self, dn, di, do, rs, f, mflo_max):
+        """
+
+        :param dn: Nominal diameter (mm)
+        :param di: Inner diameter of the steel pipe (m)
+        :param do: Outer diameter of the steel pipe (m)
+        :param rs: Thermal resistance between the fluid and the ground (mK/W)
+        :param f: Darcy friction factor (-)
+        :param mflo_max: Maximum mass flow rate (kg/s)
+        """
+        self.dn = dn
+        self.di = di
+        self.do = do
+        self.rs = rs
+        self.f = f
+        self.mflo_max = mflo_max
+
+    def __repr__(self):
+        return 'PipeSpec(DN{})'.format(self.dn)
+
+
+class PipeCatalog(object):
+    columns = {'di': 'Di', 'do': 'Do', 'rs': 'Rs', 'f': 'Friction factor', 'mflo_max': 'Max mflow'}
+
+    def __init__(self, table):
+        """
+        Table of pipe properties per nominal diameter. The properties are stored as NumPy arrays, ordered by DN, and
+        as one PipeSpec record per DN for look-ups.
+
+        :param table: pd.DataFrame indexed by DN, with (at least) the columns Di, Do, Rs, Friction factor and Max mflow
+        """
+        missing = set(self.columns.values()) - set(table.columns)
+        if missing:
+            raise ValueError('Pipe catalog misses the columns {}'.format(sorted(missing)))
+
+        self.table = table.sort_index()
+        self.dn = self.table.index.values.astype(int)
+        for attr, column in self.columns.items():
+            setattr(self, attr, self.table[column].values.astype(float))
+
+        self.specs = {dn: PipeSpec(dn, *(getattr(self, attr)[i] for attr in ['di', 'do', 'rs', 'f', 'mflo_max']))
+                      for i, dn in enumerate(self.dn)}
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Read a catalog from a semicolon separated file with a DN column
+
+        :param path: Location of the file
+        :return: PipeCatalog
+        """
+        return cls(pd.read_csv(path, sep=';', index_col='DN'))
+
+    def lookup(self, dn):
+        """
+        Get the properties of a single diameter
+
+        :param dn: Nominal diameter
+        :return: PipeSpec
+        """
+        try:
+            return self.specs[dn]
+        except KeyError:
+            raise KeyError('DN {} is not in the pipe catalog. Available diameters: {}'.format(dn, list(self.dn)))
+
+    def __contains__(self, dn):
+        return dn in self.specs
+
+    def to_frame(self):
+        """
+        :return: Copy of the full catalog table
+        """
+        return self.table.copy()
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+_default_catalog = [DEFAULT_CATALOG]
+
+
+def register_catalog(name, catalog, default=False):
+    """
+    Register a custom pipe catalog
+
+    :param name: Name under which the catalog is registered
+    :param catalog: PipeCatalog, pd.DataFrame indexed by DN or path to a semicolon separated file
+    :param default: If True, pipes created from now on use this catalog
+    :return: The registered PipeCatalog
+    """
+    if isinstance(catalog, pd.DataFrame):
+        catalog = PipeCatalog(catalog)
+    elif not isinstance(catalog, PipeCatalog):
+        catalog = PipeCatalog.from_csv(catalog)
+
+    with _catalogs_lock:
+        _catalogs[name] = catalog
+        if default:
+            _default_catalog[0] = name
+
+    return catalog
+
+
+def unregister_catalog(name):
+    """
+    Remove a registered pipe catalog. If it was the default catalog, the bundled catalog becomes the default again.
+
+    :param name: Name under which the catalog is registered
+    :return:
+    """
+    with _catalogs_lock:
+        if name not in _catalogs:
+            raise KeyError('No pipe catalog registered under the name {}'.format(name))
+        del _catalogs[name]
+        if _default_catalog[0] == name:
+            _default_catalog[0] = DEFAULT_CATALOG
+
+
+def get_catalog(name=None):
+    """
+    Get a pipe catalog. The bundled catalog is read from disk only once, on first use.
+
+    :param name: Name of a registered catalog. If None, the default catalog is returned.
+    :return: PipeCatalog
+    """
+    with _catalogs_lock:
+        if name is None:
+            name = _default_catalog[0]
+        if name not in _catalogs:
+            if name != DEFAULT_CATALOG:
+                raise KeyError('No pipe catalog registered under the name {}'.format(name))
+            _catalogs[name] = PipeCatalog.from_csv(os.path.join(CATALOG_PATH, DEFAULT_CATALOG + '.csv'))
+        return _catalogs[name]
 
 
 def str_to_pipe(string):
@@ -64,10 +206,7 @@ class Pipe(Component):
 
     @staticmethod
     def get_pipe_catalog():
-        df = pd.read_csv(
-            os.path.join(CATALOG_PATH, 'Twin200Compound1000.csv'), sep=';',
-            index_col='DN')
-        return df
+        return get_catalog().to_frame()
 
     def get_investment_cost(self):
         """
@@ -264,12 +403,8 @@ class ExtensivePipe(Pipe):
                       temperature_driven=temperature_driven,
                       repr_days=repr_days)
 
-        pipe_catalog = self.get_pipe_catalog()
+        self.catalog = get_catalog()
 
-        self.mflo_max_list = pipe_catalog['Max mflow']
-        self.f_list = pipe_catalog['Friction factor']
-        self.Rs = pipe_catalog['Rs']
-        self.di = pipe_catalog['Di']
         self.allow_flow_reversal = allow_flow_reversal
         self.dn = None
         self.heat_var = heat_var
@@ -277,7 +412,6 @@ class ExtensivePipe(Pipe):
         self.hl_setting = .7233  # Fraction of max mass flow where heat losses are equal to nominal value
         # 0.7233 is the middle of the economic flow rates according to IsoPlus, taken as average over all diameters
 
-        self.n_pump_constr = 5  # Number of linear pieces in pumping power approximation
 
         self.params['temperature_supply'] = DesignParameter(
             'temperature_supply', 'Supply temperature', 'K',
@@ -285,6 +419,43 @@ class ExtensivePipe(Pipe):
         self.params['temperature_return'] = DesignParameter(
             'temperature_return', 'Return temperature', 'K',
             mutable=False)
+        self.params['diameters'] = DesignParameter(
+            'diameters',
+            'Candidate diameters. If any are given, the diameter is chosen by the optimization (0 meaning no pipe) and '
+            'the diameter parameter is not used',
+            'DN (mm)', val=[], mutable=False)
+        self.params['investment_factor'] = DesignParameter(
+            'investment_factor',
+            'Factor with which the investment cost enters the cost objectives when sizing the diameter, e.g. a capital '
+            'recovery factor times the fraction of a year covered by the optimization horizon',
+            '-', val=1, mutable=False)
+        self.params['pumping_segments'] = DesignParameter(
+            'pumping_segments',
+            'Number of linear segments of the pumping power approximation, placed according to pumping_placement',
+            '-', val=5, mutable=True)
+        self.params['pumping_placement'] = DesignParameter(
+            'pumping_placement',
+            'Placement of the breakpoints of the pumping power approximation: \'uniform\' in the mass flow rate, or '
+            '\'equal_error\' such that the approximation error is the same in every segment',
+            '-', val='uniform', mutable=False)
+        self.params['pumping_breakpoints'] = DesignParameter(
+            'pumping_breakpoints',
+            'Breakpoints of the pumping power approximation as fractions of the maximum mass flow rate, increasing from '
+            '0 to 1. If given, pumping_segments is not used. See also adapt_pumping_breakpoints',
+            '-', val=[], mutable=False)
+
+    def is_sizing(self):
+        """
+        :return: True if the diameter is chosen by the optimization from a set of candidate diameters
+        """
+        return len(self.params['diameters'].v()) > 0
+
+    def check_data(self):
+        missing_params, flag = Pipe.check_data(self)
+        if self.is_sizing() and 'diameter' in missing_params:
+            del missing_params['diameter']
+            flag = bool(missing_params)
+        return missing_params, flag
 
     def compile(self, model, start_time):
         """
@@ -296,43 +467,38 @@ class ExtensivePipe(Pipe):
         """
 
         Component.compile(self, model, start_time)
+
+        if self.is_sizing():
+            self.compile_sizing()
+            return
+
         self.dn = self.params['diameter'].v()
 
         if self.dn is not 0:
-            self.mflo_max = self.mflo_max_list[self.dn]
+            spec = self.catalog.lookup(self.dn)
+            self.mflo_max = spec.mflo_max
 
-            Rs = self.Rs[self.dn]
-            self.f = self.f_mult * self.f_list[self.dn]
+            Rs = spec.rs
+            self.f = self.f_mult * spec.f
         else:
             self.mflo_max = 0
             self.f = 0
 
-        Te = self.params["Te"]
-
         self.temp_sup = self.params['temperature_supply'].v()
         self.temp_ret = self.params['temperature_return'].v()
 
+        # Maximal heat loss per unit length (W/m)
+        if self.dn != 0:
+            heat_loss_nom = (self.temp_sup + self.temp_ret - 2 * self.params['Te'].v_array()) / Rs
+        else:
+            heat_loss_nom = 0
+
         if self.compiled:
             self.block.mass_flow_max = self.mflo_max
             self.logger.debug('Redefining mass_flow_max')
             self.construct_pumping_constraints()
 
-            if self.repr_days is None:
-                for t in self.TIME:
-                    if self.dn is not 0:
-                        self.block.heat_loss_nom[t] = (self.temp_sup + self.temp_ret - 2 *
-                                                       Te.v(t)) / Rs
-                    else:
-                        self.block.heat_loss_nom[t] = 0
-
-            else:
-                for t in self.TIME:
-                    for c in self.REPR_DAYS:
-                        if self.dn is not 0:
-                            self.block.heat_loss_nom[t, c] = (self.temp_sup + self.temp_ret - 2 *
-                                                              Te.v(t, c)) / Rs
-                        else:
-                            self.block.heat_loss_nom[t, c] = 0
+            self.set_time_param('heat_loss_nom', heat_loss_nom)
         else:
             """
             Parameters and sets
@@ -340,28 +506,7 @@ class ExtensivePipe(Pipe):
             self.block.mass_flow_max = Param(
                 initialize=self.mflo_max, mutable=True)
 
-            # Maximal heat loss per unit length
-            def _heat_loss(b, t, c=None):
-                """
-                Rule to calculate maximal heat loss per unit length
-
-                :param b: block identifier
-                :param t: time index
-                :param dn: DN index
-                :return: Heat loss in W/m
-                """
-                if self.dn is not 0:
-                    dq = (self.temp_sup + self.temp_ret - 2 * Te.v(t, c)) / Rs
-                else:
-                    dq = 0
-                return dq
-
-            if self.repr_days is None:
-                self.block.heat_loss_nom = Param(self.TIME, rule=_heat_loss,
-                                                 mutable=True)
-            else:
-                self.block.heat_loss_nom = Param(self.TIME, self.REPR_DAYS,
-                                                 rule=_heat_loss, mutable=True)
+            self.set_time_param('heat_loss_nom', heat_loss_nom)
 
             """
             Variables
@@ -480,80 +625,266 @@ class ExtensivePipe(Pipe):
         # self.logger.debug(self.block.mass_flow_max.pprint())
         # self.logger.debug(self.block.pps.pprint())
 
+    def compile_sizing(self):
+        """
+        Build the optimization model of a pipe of which the diameter is chosen from a set of candidates. A binary
+        variable selects the diameter. The absolute mass flow rate is split over the candidates, such that only the
+        flow through the selected diameter is non-zero and limited to its maximum. The heat losses and the pumping
+        power are linear in these flow rates, with the coefficients of every candidate. The investment cost of the
+        selected diameter enters the cost objectives, see obj_investment.
+
+        :return:
+        """
+        candidates = sorted(set(self.params['diameters'].v()))
+        specs = {dn: self.catalog.lookup(dn) for dn in candidates if dn != 0}
+        mflo_max = {dn: specs[dn].mflo_max if dn != 0 else 0 for dn in candidates}
+        self.mflo_max = max(mflo_max.values())
+
+        self.temp_sup = self.params['temperature_supply'].v()
+        self.temp_ret = self.params['temperature_return'].v()
+
+        # Heat loss per unit of temperature difference, as a fraction of the mass flow rate through a candidate
+        heat_loss_temp = self.temp_sup + self.temp_ret - 2 * self.params['Te'].v_array()
+        hl_coef = {dn: self.length / (specs[dn].rs * self.hl_setting * mflo_max[dn]) if dn != 0 else 0
+                   for dn in candidates}
+
+        index = [self.TIME] if self.repr_days is None else [self.TIME, self.REPR_DAYS]
+
+        if self.compiled:
+            self.set_time_param('heat_loss_temp', heat_loss_temp)
+            self.construct_sizing_pumping_constraints(candidates, specs, mflo_max, index)
+            return
+
+        self.block.DN = Set(initialize=candidates, ordered=True)
+        self.block.mass_flow_max = Param(initialize=self.mflo_max, mutable=True)
+        self.set_time_param('heat_loss_temp', heat_loss_temp)
+
+        mflo_bounds = (-self.mflo_max, self.mflo_max) if self.allow_flow_reversal else (0, self.mflo_max)
+
+        self.block.dn_select = Var(self.block.DN, within=Binary, doc='1 for the selected diameter')
+        self.block.heat_flow_in = Var(*index, doc='Heat flow entering in-node')
+        self.block.heat_flow_out = Var(*index, doc='Heat flow exiting out-node')
+        self.block.mass_flow = Var(*index, bounds=mflo_bounds,
+                                   doc='Mass flow rate entering in-node and exiting out-node')
+        self.block.heat_loss_tot = Var(*index, within=NonNegativeReals, doc='Total heat lost from pipe')
+        self.block.mass_flow_abs = Var(*index, within=NonNegativeReals, doc='Absolute value of mass flow rate')
+        self.block.mass_flow_dn = Var(self.block.DN, *index, within=NonNegativeReals,
+                                      doc='Absolute mass flow rate through each candidate diameter')
+        self.block.pumping_power = Var(*index, within=NonNegativeReals)
+
+        def _one_diameter(b):
+            return sum(b.dn_select[dn] for dn in b.DN) == 1
+
+        def _eq_heat_flow_bal(b, *tc):
+            return b.heat_flow_in[tc] == b.heat_loss_tot[tc] + b.heat_flow_out[tc]
+
+        def _mass_flow_pos(b, *tc):
+            return b.mass_flow_abs[tc] >= b.mass_flow[tc]
+
+        def _mass_flow_neg(b, *tc):
+            return b.mass_flow_abs[tc] >= -b.mass_flow[tc]
+
+        def _mass_flow_split(b, *tc):
+            return b.mass_flow_abs[tc] == sum(b.mass_flow_dn[(dn,) + tc] for dn in b.DN)
+
+        def _mass_flow_dn_max(b, dn, *tc):
+            return b.mass_flow_dn[(dn,) + tc] <= mflo_max[dn] * b.dn_select[dn]
+
+        def _eq_heat_loss(b, *tc):
+            return b.heat_loss_tot[tc] == b.heat_loss_temp[tc] * sum(
+                hl_coef[dn] * b.mass_flow_dn[(dn,) + tc] for dn in b.DN)
+
+        self.block.one_diameter = Constraint(rule=_one_diameter)
+        self.block.eq_heat_flow_bal = Constraint(*index, rule=_eq_heat_flow_bal)
+        self.block.ineq_mass_flow_pos = Constraint(*index, rule=_mass_flow_pos)
+        self.block.ineq_mass_flow_neg = Constraint(*index, rule=_mass_flow_neg)
+        self.block.eq_mass_flow_split = Constraint(*index, rule=_mass_flow_split)
+        self.block.ineq_mass_flow_dn = Constraint(self.block.DN, *index, rule=_mass_flow_dn_max)
+        self.block.eq_heat_loss = Constraint(*index, rule=_eq_heat_loss)
+
+        self.construct_sizing_pumping_constraints(candidates, specs, mflo_max, index)
+
+        self.block.investment = Expression(expr=self.length * sum(
+            (self.params['c_l'].v() + dn * self.params['c_dl'].v()) * self.block.dn_select[dn]
+            for dn in candidates if dn != 0))
+
+        self.logger.info('Optimization model Pipe {} compiled with {} candidate diameters'.format(
+            self.name, len(candidates)))
+        self.compiled = True
+
+    def construct_sizing_pumping_constraints(self, candidates, specs, mflo_max, index):
+        """
+        Piecewise linear pumping power of every candidate diameter, one constraint indexed by segment and time step.
+        The segments of the selected diameter bound the pumping power from below. The coefficients are not mutable,
+        so the constraint is rebuilt at every compilation.
+
+        :param candidates: Candidate diameters
+        :param specs: dict with the PipeSpec of every candidate diameter except 0
+        :param mflo_max: dict with the maximum mass flow rate of every candidate diameter
+        :param index: List of the time (and representative day) sets
+        :return:
+        """
+        for name in ['ineq_pumping', 'ineq_pumping_index']:
+            if self.block.find_component(name) is not None:
+                self.block.del_component(name)
+
+        self.mfs_ratio = self.get_pumping_breakpoints()
+        slopes = {}
+        intercepts = {}
+        for dn in candidates:
+            if dn == 0:
+                dn_slopes, dn_intercepts = np.zeros(len(self.mfs_ratio) - 1), np.zeros(len(self.mfs_ratio) - 1)
+            else:
+                dn_slopes, dn_intercepts = self.pumping_segments(mflo_max[dn], self.f_mult * specs[dn].f,
+                                                                 specs[dn].di)
+            for i in range(len(dn_slopes)):
+                slopes[dn, i] = dn_slopes[i]
+                intercepts[dn, i] = dn_intercepts[i]
+
+        def _ineq_pumping(b, i, *tc):
+            return b.pumping_power[tc] >= sum(slopes[dn, i] * b.mass_flow_dn[(dn,) + tc] +
+                                              intercepts[dn, i] * b.dn_select[dn] for dn in b.DN)
+
+        self.block.ineq_pumping = Constraint(range(len(self.mfs_ratio) - 1), *index, rule=_ineq_pumping)
+
+    def obj_investment(self):
+        """
+        Investment cost of the selected diameter when sizing, multiplied by the investment factor
+
+        :return:
+        """
+        if not self.is_sizing():
+            return 0
+        return self.params['investment_factor'].v() * self.block.investment
+
     def get_diameter(self):
         """
         Show chosen diameter
 
-        :return:
+        :return: DN of the pipe. When sizing, the diameter selected by the optimization (None if not solved yet).
         """
+        if self.is_sizing() and self.block is not None and self.block.find_component('dn_select') is not None:
+            selected = [dn for dn in self.block.DN if self.block.dn_select[dn].value is not None and
+                        self.block.dn_select[dn].value > 0.5]
+            return selected[0] if selected else None
         if self.dn is not None:
             return self.dn
         else:
             return None
 
+    def get_investment_cost(self):
+        """
+        Get total investment of this pipe based on the installed (or selected) diameter and length.
+
+        :return: Cost in EUR
+        """
+        if self.is_sizing():
+            dn = self.get_diameter()
+            if not dn:
+                return 0
+            return self.length * (self.params['c_l'].v() + dn * self.params['c_dl'].v())
+        return Pipe.get_investment_cost(self)
+
+    def get_pumping_breakpoints(self):
+        """
+        Breakpoints of the pumping power approximation, from the pumping_breakpoints parameter if given, otherwise
+        placed for pumping_segments segments according to pumping_placement
+
+        :return: Array of fractions of the maximum mass flow rate, from 0 to 1
+        """
+        breakpoints = self.params['pumping_breakpoints'].v()
+        if breakpoints is None or len(breakpoints) == 0:
+            return pumping_breakpoints(self.params['pumping_segments'].v(),
+                                       placement=self.params['pumping_placement'].v())
+
+        breakpoints = np.asarray(breakpoints, dtype=float)
+        if breakpoints[0] != 0 or breakpoints[-1] != 1 or not (np.diff(breakpoints) > 0).all():
+            raise ValueError('The pumping power breakpoints of pipe {} should increase from 0 to 1'.format(self.name))
+        return breakpoints
+
+    def pumping_segments(self, mflo_max, f, di):
+        """
+        Slopes and intercepts of the linear segments of the pumping power approximation. The pumping power is cubic
+        in the mass flow rate, every segment is the line through two neighbouring breakpoints.
+
+        :param mflo_max: Maximum mass flow rate (kg/s)
+        :param f: Friction factor
+        :param di: Inner diameter (m)
+        :return: Arrays with the slopes (W/(kg/s)) and intercepts (W) of the segments
+        """
+        mass_flows = self.mfs_ratio * mflo_max
+        pps = 2 * f * self.length * mass_flows ** 3 * 8 / (di ** 5 * 983 ** 2 * pi ** 2)
+        slopes = np.diff(pps) / np.diff(mass_flows)
+        return slopes, pps[:-1] - slopes * mass_flows[:-1]
+
     def construct_pumping_constraints(self):
         """
-        Construct a set of constraints
-        :param n_segments: How many linear segments should be used to approximate the pumping power curve
+        Piecewise linear approximation of the pumping power as a function of the absolute mass flow rate: one
+        constraint indexed by segment and time step, bounding the pumping power from below by every segment. The
+        slopes and intercepts of the segments are mutable parameters. If the number of segments changed since the
+        last compilation, the constraint is rebuilt.
 
         :return:
         """
-        if self.dn is not 0:
-            di = self.di[self.dn]
-        else:
-            di = 1
+        self.mfs_ratio = self.get_pumping_breakpoints()
+        n_segments = len(self.mfs_ratio) - 1
 
-        if self.compiled:
-            for n in self.n_pump:
-                if self.dn is not 0:
-                    self.block.pps[n] = 2 * self.f * self.length * (
-                            self.mfs_ratio[n] * self.mflo_max) ** 3 * 8 / (di ** 5 * 983 ** 2 * pi ** 2)
-                else:
-                    self.block.pps[n] = 0
+        if self.dn != 0:
+            slopes, intercepts = self.pumping_segments(self.mflo_max, self.f, self.catalog.lookup(self.dn).di)
         else:
-            n_segments = self.n_pump_constr
-            self.n_pump = range(n_segments + 1)
-            self.mfs_ratio = np.linspace(0, 1, n_segments + 1)
-            self.block.pps = Param(self.n_pump, mutable=True)
-
-            for n in self.n_pump:
-                if self.dn is not 0:
-                    self.block.pps[n] = 2 * self.f * self.length * (
-                            self.mfs_ratio[n] * self.mflo_max) ** 3 * 8 / (
-                                                di ** 5 * 983 ** 2 * pi ** 2)
-                else:
-                    self.block.pps[n] = 0
+            slopes, intercepts = np.zeros(n_segments), np.zeros(n_segments)
+        slopes = dict(enumerate(slopes.tolist()))
+        intercepts = dict(enumerate(intercepts.tolist()))
 
-            if self.repr_days:
-                self.block.pumping_power = Var(self.TIME, self.REPR_DAYS,
-                                               within=NonNegativeReals)
-            else:
-                self.block.pumping_power = Var(self.TIME, within=NonNegativeReals)
-
-            for i in range(n_segments):
-                def _ineq_pumping(b, t, c=None):
-                    if self.repr_days is None:
-                        return b.pumping_power[t] * b.mass_flow_max >= (
-                                b.mass_flow_abs[t] - b.mass_flow_max * self.mfs_ratio[i]) / (
-                                           self.mfs_ratio[i + 1] - self.mfs_ratio[i]) * (
-                                           b.pps[i + 1] - b.pps[i]) + b.mass_flow_max * b.pps[i]
-
-                    else:
-                        return b.pumping_power[t, c] *  b.mass_flow_max >= (
-                                b.mass_flow_abs[t, c] -  b.mass_flow_max * self.mfs_ratio[
-                                    i]) / (
-                                       self.mfs_ratio[i + 1] - self.mfs_ratio[
-                                   i]) * (b.pps[i + 1] - b.pps[i]) +  b.mass_flow_max * b.pps[i]
+        if self.compiled and len(self.block.pump_segments) == n_segments:
+            self.block.pump_slope.store_values(slopes)
+            self.block.pump_intercept.store_values(intercepts)
+            return
 
-                if self.repr_days is None:
-                    self.block.add_component('ineq_pumping_' + str(i),
-                                             Constraint(self.TIME,
-                                                        rule=_ineq_pumping))
-                else:
-                    self.block.add_component('ineq_pumping_' + str(i),
-                                             Constraint(self.TIME,
-                                                        self.REPR_DAYS,
-                                                        rule=_ineq_pumping))
+        for name in ['ineq_pumping', 'ineq_pumping_index', 'pump_slope', 'pump_intercept', 'pump_segments']:
+            if self.block.find_component(name) is not None:
+                self.block.del_component(name)
+
+        self.block.pump_segments = Set(initialize=range(n_segments), ordered=True)
+        self.block.pump_slope = Param(self.block.pump_segments, initialize=slopes, mutable=True)
+        self.block.pump_intercept = Param(self.block.pump_segments, initialize=intercepts, mutable=True)
+
+        index = [self.TIME] if self.repr_days is None else [self.TIME, self.REPR_DAYS]
+        if self.block.find_component('pumping_power') is None:
+            self.block.pumping_power = Var(*index, within=NonNegativeReals)
+
+        def _ineq_pumping(b, i, *tc):
+            return b.pumping_power[tc] >= b.pump_slope[i] * b.mass_flow_abs[tc] + b.pump_intercept[i]
+
+        self.block.ineq_pumping = Constraint(self.block.pump_segments, *index, rule=_ineq_pumping)
+
+    def adapt_pumping_breakpoints(self, n_segments=None, margin=0.1):
+        """
+        Place the breakpoints of the pumping power approximation based on the mass flow rates of the last solution:
+        all but the last segment cover the range of flow rates that occurred, placed according to pumping_placement,
+        the last segment covers the remaining range up to the maximum mass flow rate. The new breakpoints are used from
+        the next compilation on.
+
+        :param n_segments: Number of segments. Default: the number of segments of the current approximation.
+        :param margin: Relative margin added to the largest flow rate that occurred
+        :return: Array with the new breakpoints
+        """
+        if self.block is None or self.block.find_component('mass_flow_abs') is None:
+            raise Exception('Pipe {} should be solved before adapting its pumping power approximation'.format(
+                self.name))
+        if n_segments is None:
+            n_segments = len(self.get_pumping_breakpoints()) - 1
+
+        mflo_max = self.catalog.lookup(self.get_diameter()).mflo_max if self.is_sizing() and self.get_diameter() \
+            else self.mflo_max
+        if not mflo_max:
+            return self.get_pumping_breakpoints()
+
+        flows = np.array([abs(value(v)) for v in self.block.mass_flow_abs.values()
+                          if v.value is not None], dtype=float) / mflo_max
+        breakpoints = pumping_breakpoints(n_segments, flows, margin, placement=self.params['pumping_placement'].v())
+        self.change_param('pumping_breakpoints', breakpoints.tolist())
+        return breakpoints
 
     def obj_energy(self):
         pef_el = self.params['PEF_elec']
@@ -637,10 +968,7 @@ class NodeMethod(Pipe):
                       direction=direction,
                       repr_days=repr_days)
 
-        pipe_catalog = self.get_pipe_catalog()
-        self.Rs = pipe_catalog['Rs']
-        self.Di = pipe_catalog['Di']
-        self.Do = pipe_catalog['Do']
+        self.catalog = get_catalog()
         self.allow_flow_reversal = allow_flow_reversal
         self.history_length = 0  # Number of known historical values
 
@@ -735,55 +1063,55 @@ class NodeMethod(Pipe):
 
         Component.compile(self, model, start_time)
 
-        self.history_length = len(self.params['mass_flow_history'].v())
+        mass_flow_history, temperature_history = self.get_history()
         Tg = self.params['Tg'].v()
         lines = self.params['lines'].v()
-        dn = self.params['diameter'].v()
         time_step = self.params['time_step'].v()
         n_steps = int(self.params['horizon'].v() / time_step)
 
-        self.block.all_time = Set(
-            initialize=range(self.history_length + n_steps), ordered=True)
-
-        pipe_wall_rho = 7.85 * 10 ** 3  # http://www.steel-grades.com/Steel-Grades/Structure-Steel/en-p235.html kg/m^3
-        pipe_wall_c = 461  # http://www.steel-grades.com/Steel-Grades/Structure-Steel/en-p235.html J/kg/K
-        pipe_wall_volume = np.pi * (
-                self.Do[dn] ** 2 - self.Di[dn] ** 2) / 4 * self.length
-        C = pipe_wall_volume * pipe_wall_c * pipe_wall_rho
-        surface = np.pi * self.Di[
-            dn] ** 2 / 4  # cross sectional area of the pipe
-        Z = surface * self.rho * self.length  # water mass in the pipe
+        thermal = self.get_thermal_properties()
+        C = thermal['C']
+        surface = thermal['surface']
+        Z = thermal['Z']
 
         # TODO Move capacity?
 
-        def _decl_mf(b, t):
-            return self.params['mass_flow'].v(t)
+        mass_flow = self.params['mass_flow'].v_array()
+        plug_flow = plug_flow_indices(mass_flow, mass_flow_history, time_step, Z)
+        if not plug_flow['found_n'].all():
+            self.logger.warning('A proper value for n could not be calculated')
+        if not plug_flow['found_m'].all():
+            self.logger.warning('A proper value for m could not be calculated')
+
+        # Only the part of the history that still leaves the pipe during the horizon is modelled
+        self.history_length = history_window(plug_flow, n_steps)
+        if self.history_length < len(mass_flow_history):
+            self.logger.debug('History of {} truncated from {} to {} values'.format(self.name, len(mass_flow_history),
+                                                                                   self.history_length))
+        plug_flow['mf_history'] = plug_flow['mf_history'][:n_steps + self.history_length]
+
+        self.block.all_time = Set(
+            initialize=range(self.history_length + n_steps), ordered=True)
 
-        self.block.mass_flow = Param(self.TIME, rule=_decl_mf)
+        self.set_time_param('mass_flow', mass_flow, mutable=False)
 
         # Declare temperature variables ################################################################################
 
         self.block.temperatures = Var(lines,
                                       self.block.all_time)  # all temperatures (historical and future)
         self.block.temperature_out_nhc = Var(lines,
-                                             self.block.all_time)  # no heat capacity (only future)
+                                             self.TIME)  # no heat capacity
         self.block.temperature_out_nhl = Var(lines,
-                                             self.block.all_time)  # no heat losses (only future)
+                                             self.TIME)  # no heat losses
         self.block.temperature_out = Var(lines,
-                                         self.block.all_time)  # no heat losses (only future)
+                                         self.TIME)
         self.block.temperature_in = Var(lines,
-                                        self.block.all_time)  # incoming temperature (future)
+                                        self.TIME)  # incoming temperature
 
         # Declare list filled with all previous mass flows and future mass flows #######################################
 
-        def _decl_mf_history(b, t):
-            if t < n_steps:
-                return self.block.mass_flow[n_steps - t - 1]
-            else:
-                return self.params['mass_flow_history'].v(t - n_steps)
-
         self.block.mf_history = Param(self.block.all_time,
-                                      rule=_decl_mf_history)
+                                      initialize=dict(enumerate(plug_flow['mf_history'].tolist())))
 
         # Declare list filled with all previous temperatures for every optimization step ###############################
 
@@ -792,8 +1120,7 @@ class NodeMethod(Pipe):
                 return b.temperatures[l, t] == b.temperature_in[
                     l, n_steps - t - 1]
             else:
-                return b.temperatures[l, t] == self.params[
-                    'temperature_history_' + l].v(t - n_steps)
+                return b.temperatures[l, t] == temperature_history[l][t - n_steps]
 
         self.block.def_temp_history = Constraint(self.block.all_time, lines,
                                                  rule=_decl_temp_history)
@@ -801,9 +1128,7 @@ class NodeMethod(Pipe):
         # Initialize incoming temperature ##############################################################################
 
         def _decl_init_temp_in(b, l):
-            return b.temperature_in[l, 0] == self.params[
-                'temperature_history_' + l].v(
-                0)  # TODO better initialization??
+            return b.temperature_in[l, 0] == temperature_history[l][0]  # TODO better initialization??
 
         self.block.decl_init_temp_in = Constraint(lines,
                                                   rule=_decl_init_temp_in)
@@ -811,41 +1136,17 @@ class NodeMethod(Pipe):
         # Define n #####################################################################################################
 
         # Eq 3.4.7
-        def _decl_n(b, t):
-            sum_m = 0
-            for i in range(len(self.block.all_time) - (n_steps - 1 - t)):
-                sum_m += b.mf_history[n_steps - 1 - t + i] * time_step
-                if sum_m > Z:
-                    return i
-            self.logger.warning('A proper value for n could not be calculated')
-            return i
-
-        self.block.n = Param(self.TIME, rule=_decl_n)
+        self.block.n = Param(self.TIME, initialize=dict(zip(self.TIME, plug_flow['n'].tolist())))
 
         # Define R #####################################################################################################
 
         # Eq 3.4.3
-        def _decl_r(b, t):
-            return sum(self.block.mf_history[i] for i in
-                       range(n_steps - 1 - t,
-                             n_steps - 1 - t + b.n[t] + 1)) * time_step
-
-        self.block.R = Param(self.TIME, rule=_decl_r)
+        self.set_time_param('R', plug_flow['R'], mutable=False)
 
         # Define m #####################################################################################################
 
         # Eq. 3.4.8
-
-        def _decl_m(b, t):
-            sum_m = 0
-            for i in range(len(self.block.all_time) - (n_steps - 1 - t)):
-                sum_m += b.mf_history[n_steps - 1 - t + i] * time_step
-                if sum_m > Z + self.block.mass_flow[t] * time_step:
-                    return i
-            self.logger.warning('A proper value for m could not be calculated')
-            return i
-
-        self.block.m = Param(self.TIME, rule=_decl_m)
+        self.block.m = Param(self.TIME, initialize=dict(zip(self.TIME, plug_flow['m'].tolist())))
 
         # Define Y #####################################################################################################
 
@@ -863,16 +1164,7 @@ class NodeMethod(Pipe):
         # Define S #####################################################################################################
 
         # Eq 3.4.10 and 3.4.11
-        def _s(b, t):
-            if b.m[t] > b.n[t]:
-                return sum(b.mf_history[i] * time_step
-                           for i in
-                           range(n_steps - 1 - t, n_steps - 1 - t + b.m[t]))
-
-            else:
-                return b.R[t]
-
-        self.block.S = Param(self.TIME, rule=_s)
+        self.set_time_param('S', plug_flow['S'], mutable=False)
 
         # Define outgoing temperature, without wall capacity and heat losses ###########################################
 
@@ -895,7 +1187,7 @@ class NodeMethod(Pipe):
         # Pipe wall heat capacity ######################################################################################
 
         # Eq. 3.4.20
-        self.block.K = 1 / self.Rs[self.params['diameter'].v()]
+        self.block.K = thermal['K']
 
         # Eq. 3.4.14
 
@@ -970,20 +1262,9 @@ class NodeMethod(Pipe):
 
         # Eq. 3.4.24
 
-        def _tk(b, t):
-            if b.mass_flow[t] == 0:
-                return Constraint.Skip
-            else:
-                delta_time = time_step * ((b.R[t] - Z) * b.n[t]
-                                          + sum(
-                            b.mf_history[n_steps - 1 - t + i] * time_step * i
-                            for i in range(b.n[t] + 1, b.m[t]))
-                                          + (b.mass_flow[t] * time_step - b.S[
-                            t] + Z) * b.m[t]) \
-                             / b.mass_flow[t] / time_step
-                return delta_time
-
-        self.block.tk = Param(self.TIME, rule=_tk)
+        # Only defined for time steps with a mass flow rate
+        self.block.tk = Param(self.TIME, initialize={
+            t: tk for t, tk in zip(self.TIME, plug_flow['tk'].tolist()) if not np.isnan(tk)})
 
         # Eq. 3.4.27
 
@@ -1007,8 +1288,208 @@ class NodeMethod(Pipe):
 
         self.block.def_temp_out = Constraint(self.TIME, lines, rule=_temp_out)
 
+    def get_history(self):
+        """
+        Historic mass flow rates and incoming temperatures of the pipe, most recent value first. Only the first
+        values of the temperature histories are used, as many as there are historic mass flow rates.
+
+        :return: Array of mass flow rates (kg/s) and dict with an array of temperatures (K) per line
+        """
+        mass_flow_history = np.asarray(self.params['mass_flow_history'].v(), dtype=np.float64)
+        history_length = len(mass_flow_history)
+        temperature_history = {}
+        for l in self.params['lines'].v():
+            temperature_history[l] = np.asarray(self.params['temperature_history_' + l].v(),
+                                                dtype=np.float64)[:history_length]
+            if len(temperature_history[l]) < history_length:
+                raise ValueError('The temperature history of the {} line of {} is shorter than its mass flow '
+                                 'history'.format(l, self.name))
+        return mass_flow_history, temperature_history
+
+    def get_thermal_properties(self):
+        """
+        Pipe properties used by the node method
+
+        :return: dict with the heat capacity of the pipe wall C (J/K), the cross section of the pipe surface (m^2), the
+            mass of the water in the pipe Z (kg) and the heat transfer coefficient to the ground K (Eq. 3.4.20)
+        """
+        pipe_wall_rho = 7.85 * 10 ** 3  # http://www.steel-grades.com/Steel-Grades/Structure-Steel/en-p235.html kg/m^3
+        pipe_wall_c = 461  # http://www.steel-grades.com/Steel-Grades/Structure-Steel/en-p235.html J/kg/K
+        spec = self.catalog.lookup(self.params['diameter'].v())
+        pipe_wall_volume = np.pi * (spec.do ** 2 - spec.di ** 2) / 4 * self.length
+        surface = np.pi * spec.di ** 2 / 4  # cross sectional area of the pipe
+
+        return {'C': pipe_wall_volume * pipe_wall_c * pipe_wall_rho,
+                'surface': surface,
+                'Z': surface * self.rho * self.length,  # water mass in the pipe
+                'K': 1 / spec.rs}
+
     def get_diameter(self):
-        return self.Di[self.params['diameter'].v()]
+        return self.catalog.lookup(self.params['diameter'].v()).di
 
     def get_length(self):
         return self.length
+
+
+def plug_flow_indices(mass_flow, mass_flow_history, time_step, mass):
+    """
+    Calculate the plug flow quantities of the node method (Eq. 3.4.3 - 3.4.24) for all time steps at once, using
+    cumulative sums of the mass flow history and binary search instead of summing over the history for every time
+    step.
+
+    The history of mass flow rates combines the predicted mass flow rates (in reversed order) with the historic mass
+    flow rates, such that the most recent value comes first.
+
+    :param mass_flow: Predicted mass flow rates through the pipe, one per time step (kg/s)
+    :param mass_flow_history: Historic mass flow rates through the pipe, most recent value first (kg/s)
+    :param time_step: Time step (s)
+    :param mass: Mass of the water in the pipe (kg)
+    :return: dict with arrays, one value per time step: n, m (int), R, S, tk (float, NaN if the mass flow rate is 0)
+        and found_n, found_m (bool, False if no proper value for n or m exists in the history). The key mf_history
+        contains the combined history of mass flow rates.
+    """
+    mass_flow = np.asarray(mass_flow, dtype=np.float64)
+    n_steps = len(mass_flow)
+    mf_history = np.concatenate([mass_flow[::-1], np.asarray(mass_flow_history, dtype=np.float64)])
+    n_all = len(mf_history)
+
+    # cum_m[j] is the mass that passed over the first j elements of the history, cum_mi weighs each element by its
+    # position in the history
+    mass_step = mf_history * time_step
+    cum_m = np.concatenate([[0.], np.cumsum(mass_step)])
+    cum_mi = np.concatenate([[0.], np.cumsum(mass_step * np.arange(n_all))])
+
+    start = n_steps - 1 - np.arange(n_steps)  # Position of time step t in the history
+
+    def first_exceeding(target):
+        """
+        Smallest i for every time step, such that the mass over history[start:start + i + 1] exceeds target
+        """
+        threshold = cum_m[start] + target
+        if (mf_history >= 0).all():
+            end = np.searchsorted(cum_m, threshold, side='right')
+        else:
+            # Cumulative mass is not monotonic, search the first crossing for every time step
+            end = np.array([s + 1 + np.argmax(cum_m[s + 1:] > th) if (cum_m[s + 1:] > th).any() else n_all + 1
+                            for s, th in zip(start, threshold)], dtype=int)
+        found = end <= n_all
+        return np.minimum(end, n_all) - start - 1, found
+
+    # Eq. 3.4.7 and 3.4.8
+    n, found_n = first_exceeding(mass)
+    m, found_m = first_exceeding(mass + mass_flow * time_step)
+
+    # Eq. 3.4.3
+    R = cum_m[start + n + 1] - cum_m[start]
+
+    # Eq. 3.4.10 and 3.4.11
+    S = np.where(m > n, cum_m[start + m] - cum_m[start], R)
+
+    # Eq. 3.4.24
+    low = start + n + 1
+    high = np.maximum(start + m, low)
+    weighted = (cum_mi[high] - cum_mi[low]) - start * (cum_m[high] - cum_m[low])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tk = time_step * ((R - mass) * n + weighted + (mass_flow * time_step - S + mass) * m) / mass_flow / time_step
+    tk[mass_flow == 0] = np.nan
+
+    return {'n': n, 'm': m, 'R': R, 'S': S, 'tk': tk, 'found_n': found_n, 'found_m': found_m,
+            'mf_history': mf_history}
+
+
+def history_window(plug_flow, n_steps):
+    """
+    Number of historic values the node method needs: the history up to the oldest water that leaves the pipe during
+    the horizon. Older values do not change the plug flow quantities, unless the history is too short to contain all
+    water that leaves the pipe, in which case the whole history is needed. Both n and m are taken into account, as n
+    exceeds m for a reverse mass flow rate.
+
+    :param plug_flow: Plug flow quantities, see plug_flow_indices
+    :param n_steps: Number of time steps of the horizon
+    :return: Number of historic values, at least 1
+    """
+    start = n_steps - 1 - np.arange(n_steps)
+    return max(int((start + np.maximum(plug_flow['n'], plug_flow['m'])).max()) + 1 - n_steps, 1)
+
+
+def _cubic_error(a, b):
+    """
+    Largest difference between the line through (a, a^3) and (b, b^3) and the cubic itself on [a, b]
+    """
+    x = np.sqrt((a ** 2 + a * b + b ** 2) / 3)
+    return a ** 3 + (a ** 2 + a * b + b ** 2) * (x - a) - x ** 3
+
+
+def _uniform_breakpoints(n_segments):
+    """
+    Breakpoints uniformly spread on [0, 1]
+    """
+    return np.linspace(0, 1, n_segments + 1)
+
+
+def _equal_error_breakpoints(n_segments):
+    """
+    Breakpoints on [0, 1] such that the linear interpolation of x^3 has the same largest error in every segment
+    """
+    def place(error):
+        points = [0.]
+        while points[-1] < 1 and len(points) <= n_segments:
+            a = points[-1]
+            if _cubic_error(a, 1.) <= error:
+                points.append(1.)
+                break
+            lo, hi = a, 1.
+            for _ in range(60):
+                mid = (lo + hi) / 2
+                if _cubic_error(a, mid) <= error:
+                    lo = mid
+                else:
+                    hi = mid
+            points.append(lo)
+        return points
+
+    lo, hi = 0., _cubic_error(0., 1.)
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if place(mid)[-1] < 1:
+            lo = mid
+        else:
+            hi = mid
+    points = place(hi)
+    points[-1] = 1.
+    return np.array(points)
+
+
+def pumping_breakpoints(n_segments, flows=None, margin=0.1, placement='uniform'):
+    """
+    Breakpoints of the piecewise linear approximation of the pumping power, which is cubic in the mass flow rate.
+    The breakpoints are either uniform in the mass flow rate, or placed such that the largest approximation error is
+    the same in every segment, which puts more of them at high flow rates.
+
+    :param n_segments: Number of segments
+    :param flows: Mass flow rates that occur, as fractions of the maximum mass flow rate (e.g. of a previous
+        solution). If given, all but the last segment cover the range up to the largest of these flow rates.
+    :param margin: Relative margin added to the largest flow rate
+    :param placement: 'uniform' (default) or 'equal_error'
+    :return: Array of fractions of the maximum mass flow rate, from 0 to 1
+    """
+    if n_segments < 1:
+        raise ValueError('The pumping power approximation needs at least one segment')
+    if placement == 'uniform':
+        place = _uniform_breakpoints
+    elif placement == 'equal_error':
+        place = _equal_error_breakpoints
+    else:
+        raise ValueError('Unknown placement {} of the pumping power breakpoints, use uniform or equal_error'.format(
+            placement))
+
+    top = 1.
+    if flows is not None and len(flows) > 0:
+        top = min(1., np.max(np.abs(flows)) * (1 + margin))
+    if top >= 1 or n_segments == 1:
+        return place(n_segments)
+    if top <= 0:
+        return np.array([0., 1.])
+
+    # The approximation error of a cubic scales with the cube of the range, so the breakpoints scale linearly
+    return np.append(place(n_segments - 1) * top, 1.)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Columnar on-disk store for the results of many optimizations
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 1
+MANIFEST = 'store.json'
+
+logger = logging.getLogger('modesto.results_store')
+
+
+class ResultStore(object):
+    def __init__(self, path, chunk_size=100):
+        """
+        Store for the time series and scalar results (e.g. objective, investment cost, solve time, status) of many
+        scenarios. Results are kept in memory until chunk_size scenarios have been added, after which they are written
+        to disk as one compressed chunk. Within a chunk, every variable is stored as a separate array, such that a
+        single variable can be loaded for all scenarios without reading the others.
+
+        An existing store at path is opened, and new results are added to it.
+
+        :param path: Directory of the store
+        :param chunk_size: Number of scenarios per chunk
+        """
+        if chunk_size < 1:
+            raise ValueError('chunk_size should be at least 1')
+
+        self.path = path
+        self.chunk_size = chunk_size
+
+        self.chunks = []  # Manifest entries of the chunks on disk
+        self._buffer = []  # (scenario, series, scalars) tuples not yet written
+
+        manifest = os.path.join(path, MANIFEST)
+        if os.path.isfile(manifest):
+            with open(manifest) as f:
+                meta = json.load(f)
+            if meta['version'] != STORE_VERSION:
+                raise IOError('{} is a result store of version {}, expected {}'.format(path, meta['version'],
+                                                                                       STORE_VERSION))
+            self.chunks = meta['chunks']
+        else:
+            os.makedirs(path, exist_ok=True)
+
+        self._scenarios = set(self.scenarios())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, scenario, series=None, scalars=None):
+        """
+        Add the results of a scenario
+
+        :param scenario: Unique name of the scenario (str)
+        :param series: pd.DataFrame with one column per variable, or a dict with variable names as keys and arrays
+            as values
+        :param scalars: dict with scalar results, numbers or strings
+        :return:
+        """
+        scenario = str(scenario)
+        if scenario in self._scenarios:
+            raise ValueError('Scenario {} is already in the result store'.format(scenario))
+
+        if series is None:
+            series = {}
+        elif isinstance(series, pd.DataFrame):
+            series = {name: series[name].values for name in series.columns}
+        series = {str(name): np.asarray(values, dtype=np.float64) for name, values in series.items()}
+
+        self._buffer.append((scenario, series, dict(scalars or {})))
+        self._scenarios.add(scenario)
+
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def append_model(self, scenario, optmodel, spec=None, status=None, solve_time=None, **scalars):
+        """
+        Add the results of a solved Modesto model
+
+        :param scenario: Unique name of the scenario (str)
+        :param optmodel: Solved Modesto object
+        :param spec: Results to store, see Modesto.get_results. If None, all time indexed results are stored.
+        :param status: Status returned by Modesto.solve
+        :param solve_time: Solve time in seconds
+        :param scalars: Other scalar results
+        :return:
+        """
+        if spec is None:
+            series = optmodel.get_all_results()
+        else:
+            series = optmodel.get_results(spec)
+
+        kpis = {'objective': optmodel.get_objective()}
+        if status is not None:
+            kpis['status'] = status
+        if solve_time is not None:
+            kpis['solve_time'] = solve_time
+        kpis.update(scalars)
+
+        self.append(scenario, series, kpis)
+
+    def flush(self):
+        """
+        Write all results in memory to a new chunk
+
+        :return:
+        """
+        if not self._buffer:
+            return
+
+        chunk_id = len(self.chunks)
+        scenarios = [scenario for scenario, _, _ in self._buffer]
+
+        variables = []
+        for _, series, _ in self._buffer:
+            variables.extend(name for name in series if name not in variables)
+        n_rows = max([len(values) for _, series, _ in self._buffer for values in series.values()] or [0])
+
+        arrays = {}
+        for name in variables:
+            data = np.full((len(scenarios), n_rows), np.nan)
+            for i, (_, series, _) in enumerate(self._buffer):
+                if name in series:
+                    data[i, :len(series[name])] = series[name]
+            arrays[name] = data
+
+        scalar_names = []
+        for _, _, scalars in self._buffer:
+            scalar_names.extend(name for name in scalars if name not in scalar_names)
+        scalar_arrays = {name: _scalar_array([scalars.get(name) for _, _, scalars in self._buffer])
+                         for name in scalar_names}
+
+        series_file = 'series_{:05d}.npz'.format(chunk_id)
+        scalars_file = 'scalars_{:05d}.npz'.format(chunk_id)
+        _savez(os.path.join(self.path, series_file), variables, arrays)
+        _savez(os.path.join(self.path, scalars_file), scalar_names, scalar_arrays)
+
+        self.chunks.append({'id': chunk_id,
+                            'scenarios': scenarios,
+                            'variables': variables,
+                            'scalars': scalar_names,
+                            'n_rows': n_rows,
+                            'series_file': series_file,
+                            'scalars_file': scalars_file})
+        self._write_manifest()
+        self._buffer = []
+
+        logger.debug('Wrote chunk {} with {} scenarios to {}'.format(chunk_id, len(scenarios), self.path))
+
+    def close(self):
+        """
+        Write the remaining results to disk
+
+        :return:
+        """
+        self.flush()
+
+    def _write_manifest(self):
+        fname = os.path.join(self.path, MANIFEST)
+        tmp = fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': STORE_VERSION, 'chunks': self.chunks}, f)
+        os.replace(tmp, fname)
+
+    def scenarios(self):
+        """
+        :return: List of the names of all scenarios in the store
+        """
+        return [scenario for chunk in self.chunks for scenario in chunk['scenarios']] + \
+               [scenario for scenario, _, _ in self._buffer]
+
+    def variables(self):
+        """
+        :return: List of the names of all stored time series
+        """
+        names = []
+        for chunk_variables in [chunk['variables'] for chunk in self.chunks] + \
+                               [list(series) for _, series, _ in self._buffer]:
+            names.extend(name for name in chunk_variables if name not in names)
+        return names
+
+    def scalar_names(self):
+        """
+        :return: List of the names of all stored scalar results
+        """
+        names = []
+        for chunk_scalars in [chunk['scalars'] for chunk in self.chunks] + \
+                             [list(scalars) for _, _, scalars in self._buffer]:
+            names.extend(name for name in chunk_scalars if name not in names)
+        return names
+
+    def iter_chunks(self, variable):
+        """
+        Read a time series chunk by chunk. Only the arrays of this variable are read from disk.
+
+        :param variable: Name of the variable
+        :return: Generator of pd.DataFrame objects, with the time step as index and the scenarios as columns
+        """
+        for chunk in self.chunks:
+            if variable not in chunk['variables']:
+                continue
+            with np.load(os.path.join(self.path, chunk['series_file'])) as npz:
+                data = npz[_key(chunk['variables'], variable)]
+            yield pd.DataFrame(data.T, columns=chunk['scenarios'])
+
+        buffered = [(scenario, series[variable]) for scenario, series, _ in self._buffer if variable in series]
+        if buffered:
+            n_rows = max(len(values) for _, values in buffered)
+            data = np.full((n_rows, len(buffered)), np.nan)
+            for i, (_, values) in enumerate(buffered):
+                data[:len(values), i] = values
+            yield pd.DataFrame(data, columns=[scenario for scenario, _ in buffered])
+
+    def load(self, variable, scenarios=None):
+        """
+        Load a time series for all scenarios, or for a selection of scenarios
+
+        :param variable: Name of the variable
+        :param scenarios: List of scenario names. If None, all scenarios with this variable are loaded.
+        :return: pd.DataFrame with the time step as index and the scenarios as columns
+        """
+        if variable not in self.variables():
+            raise KeyError('{} is not stored in the result store'.format(variable))
+
+        selected = None if scenarios is None else set(str(scenario) for scenario in scenarios)
+        frames = []
+        for frame in self.iter_chunks(variable):
+            if selected is not None:
+                frame = frame[[scenario for scenario in frame.columns if scenario in selected]]
+            if len(frame.columns) > 0:
+                frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame()
+        result = pd.concat(frames, axis=1)
+        if scenarios is not None:
+            result = result[[str(scenario) for scenario in scenarios if str(scenario) in result.columns]]
+        return result
+
+    def load_scalars(self, names=None, scenarios=None):
+        """
+        Load scalar results
+
+        :param names: List of names of the scalar results. If None, all are loaded.
+        :param scenarios: List of scenario names. If None, all scenarios are loaded.
+        :return: pd.DataFrame with the scenarios as index and the scalar results as columns
+        """
+        if names is None:
+            names = self.scalar_names()
+
+        frames = []
+        for chunk in self.chunks:
+            columns = {}
+            with np.load(os.path.join(self.path, chunk['scalars_file'])) as npz:
+                for name in names:
+                    if name in chunk['scalars']:
+                        columns[name] = npz[_key(chunk['scalars'], name)]
+            frames.append(pd.DataFrame(columns, index=chunk['scenarios']))
+
+        if self._buffer:
+            frames.append(pd.DataFrame([{name: scalars.get(name) for name in names} for _, _, scalars in self._buffer],
+                                       index=[scenario for scenario, _, _ in self._buffer]))
+
+        if not frames:
+            return pd.DataFrame(columns=names)
+        result = pd.concat(frames).reindex(columns=names)
+        if scenarios is not None:
+            result = result.loc[[str(scenario) for scenario in scenarios]]
+        return result
+
+
+def _key(names, name):
+    """
+    Key of an array in an npz file. Arrays are numbered, since variable names can contain any character.
+    """
+    return 'a{}'.format(names.index(name))
+
+
+def _savez(fname, names, arrays):
+    """
+    Write arrays to a compressed npz file, replacing the file at once
+    """
+    tmp = fname + '.tmp.npz'
+    np.savez_compressed(tmp, **{_key(names, name): arrays[name] for name in names})
+    os.replace(tmp, fname)
+
+
+def _scalar_array(values):
+    """
+    Convert a list of scalar results to an array: float if all values are numbers (None becomes NaN), str otherwise
+    """
+    if all(value is None or isinstance(value, (int, float, np.number)) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.array(['' if value is None else str(value) for value in values])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Rolling horizon (model predictive control) optimization with modesto
+"""
+
+import logging
+import time
+
+import pandas as pd
+from pyomo.core.base import value
+
+logger = logging.getLogger('modesto.rolling_horizon')
+
+TIMING_COLUMNS = ['step', 'start_time', 'mode', 'status', 'objective', 'compile_time', 'solve_time', 'collect_time']
+
+
+class RollingHorizon(object):
+    def __init__(self, optmodel, start_time, end_time=None, n_steps=None, control_horizon=None, objective='cost',
+                 solver=None, warmstart=True, spec=None, **solve_kwargs):
+        """
+        Rolling horizon driver. Every step, the model is optimized over its full horizon, after which only the first
+        control_horizon seconds of the solution are applied: the optimization window moves forward by that amount, and
+        the resulting storage states become the initial states of the next step.
+
+        The model is compiled once. Later steps only update the mutable parameters of the compiled model, and are
+        solved with a persistent solver (if available for the solver) that is warm started from the previous solution,
+        shifted in time.
+
+        :param optmodel: Modesto object with all parameters set. The horizon parameter is the prediction horizon.
+        :param start_time: Start time of the first step, pd.Timestamp or string of format 'yyyymmdd'
+        :param end_time: Time at which the last applied interval ends. Either end_time or n_steps is required.
+        :param n_steps: Number of steps
+        :param control_horizon: Part of the solution that is applied every step in seconds. Multiple of the time step.
+            Default: one time step.
+        :param objective: Name of the objective
+        :param solver: Name of the solver, see Modesto.solve
+        :param warmstart: If True, every solve after the first is warm started from the shifted previous solution
+        :param spec: Results to collect of every step, see Modesto.get_results. If None, all time indexed results are
+            collected.
+        :param solve_kwargs: Other arguments of Modesto.solve, e.g. mipgap
+        """
+        self.optmodel = optmodel
+        self.start_time = pd.Timestamp(start_time)
+        self.objective = objective
+        self.solver = solver
+        self.warmstart = warmstart
+        self.spec = spec
+        self.solve_kwargs = solve_kwargs
+
+        time_step = optmodel.params['time_step'].v()
+        horizon = optmodel.params['horizon'].v()
+        if control_horizon is None:
+            control_horizon = time_step
+        if control_horizon % time_step != 0:
+            raise ValueError('The control horizon should be a multiple of the time step ({} s)'.format(time_step))
+        if not 0 < control_horizon <= horizon:
+            raise ValueError('The control horizon should be positive and not longer than the horizon ({} s)'.format(
+                horizon))
+        self.control_horizon = control_horizon
+        self.shift = int(control_horizon // time_step)
+
+        if n_steps is None:
+            if end_time is None:
+                raise ValueError('Either end_time or n_steps should be given')
+            duration = (pd.Timestamp(end_time) - self.start_time).total_seconds()
+            n_steps = int(-(-duration // control_horizon))
+        if n_steps < 1:
+            raise ValueError('The rolling horizon should contain at least one step')
+        self.n_steps = n_steps
+
+        self.timings = []  # Per step: compile, solve and collection times
+        self.results = []  # Per step: applied part of the solution
+
+    def step_start(self, step):
+        """
+        :param step: Number of the step
+        :return: Start time of the step
+        """
+        return self.start_time + pd.Timedelta(seconds=step * self.control_horizon)
+
+    def run(self):
+        """
+        Optimize all steps
+
+        :return: Generator of dicts with the step number, start time, solver status, objective value, timings and
+            the applied part of the solution (pd.DataFrame) of every step
+        """
+        self.timings = []
+        self.results = []
+
+        for step in range(self.n_steps):
+            start_time = self.step_start(step)
+
+            start = time.time()
+            report = self.optmodel.compile(start_time)
+            if step == 0:
+                self.optmodel.set_objective(self.objective)
+            compile_time = time.time() - start
+
+            start = time.time()
+            status = self.optmodel.solve(solver=self.solver, persistent=True,
+                                         warmstart=self.warmstart and step > 0, **self.solve_kwargs)
+            solve_time = time.time() - start
+            if status < 0:
+                raise Exception('Step {} starting at {} could not be solved (status {})'.format(step, start_time,
+                                                                                              status))
+
+            objective = self.optmodel.get_objective()
+
+            start = time.time()
+            applied = self.collect()
+            self.carry_states()
+            if self.warmstart:
+                self.optmodel.shift_values(self.shift)
+            collect_time = time.time() - start
+
+            timing = {'step': step, 'start_time': start_time, 'mode': report['mode'], 'status': status,
+                      'objective': objective, 'compile_time': compile_time,
+                      'solve_time': solve_time, 'collect_time': collect_time}
+            self.timings.append(timing)
+            self.results.append(applied)
+
+            logger.info('Step {}/{} ({}): compiled in {:.3f} s, solved in {:.3f} s'.format(
+                step + 1, self.n_steps, start_time, compile_time, solve_time))
+
+            result = dict(timing)
+            result['results'] = applied
+            yield result
+
+    def run_all(self):
+        """
+        Optimize all steps
+
+        :return: pd.DataFrame with the applied results of all steps after each other
+        """
+        for _ in self.run():
+            pass
+        return self.get_results()
+
+    def collect(self):
+        """
+        Collect the part of the current solution that is applied
+
+        :return: pd.DataFrame with the results of the first control_horizon seconds
+        """
+        if self.spec is None:
+            results = self.optmodel.get_all_results()
+        else:
+            results = self.optmodel.get_results(self.spec)
+        return results.iloc[:self.shift]
+
+    def carry_states(self):
+        """
+        Use the storage states at the end of the applied interval as initial states of the next step. Only storage
+        units with a fixed initial state are updated.
+
+        :return:
+        """
+        for name, heat_stor in self.optmodel.get_heat_stor().items():
+            node, comp = name.split('.', 1)
+            comp_obj = self.optmodel.get_component(comp, node)
+            if comp_obj.params['heat_stor'].init_type != 'fixedVal':
+                continue
+            comp_obj.change_param('heat_stor', value(heat_stor[self.shift]))
+
+    def get_results(self):
+        """
+        :return: pd.DataFrame with the applied results of all steps run so far after each other
+        """
+        if not self.results:
+            return pd.DataFrame()
+        return pd.concat(self.results)
+
+    def get_timings(self):
+        """
+        :return: pd.DataFrame with the step number as index and the start time, compilation mode, status, objective
+            value and timings of every step as columns
+        """
+        return pd.DataFrame(self.timings, columns=TIMING_COLUMNS).set_index('step')
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Run many scenarios of the same modesto problem in parallel
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import pandas as pd
+
+from modesto.main import Modesto
+
+logger = logging.getLogger('modesto.scenarios')
+
+# Model of the current worker process, built once by _init_worker
+_worker = {}
+
+
+def grid(**values):
+    """
+    All combinations of a set of parameter values
+
+    :param values: Lists of values, one per parameter. Use change_params style keys, see apply_params.
+    :return: List of scenarios (dicts)
+    """
+    names = list(values)
+    return [OrderedDict(zip(names, combination)) for combination in product(*(values[name] for name in names))]
+
+
+def param_name(key):
+    """
+    :param key: Parameter key of a scenario, see apply_params
+    :return: String representation of the key
+    """
+    if isinstance(key, tuple):
+        return '.'.join(str(part) for part in key if part is not None)
+    return str(key)
+
+
+def scenario_name(scenario):
+    """
+    Name of a scenario, based on its parameter values
+
+    :param scenario: dict with parameter keys and values
+    :return: str
+    """
+    return ','.join('{}={}'.format(param_name(key), val) for key, val in scenario.items())
+
+
+def apply_params(optmodel, scenario):
+    """
+    Default way to apply a scenario to a model
+
+    :param optmodel: Modesto object
+    :param scenario: dict with parameter keys and values. A key is either a (node, comp, param) tuple (node None for
+        pipes), or the name of a general parameter.
+    :return:
+    """
+    for key, val in scenario.items():
+        if isinstance(key, tuple):
+            node, comp, param = key
+            if comp is None:
+                optmodel.change_general_param(param, val)
+            else:
+                optmodel.change_param(node, comp, param, val)
+        else:
+            optmodel.change_general_param(key, val)
+
+
+def get_params(optmodel, keys):
+    """
+    Current values of a set of parameters, the counterpart of apply_params
+
+    :param optmodel: Modesto object
+    :param keys: Parameter keys, see apply_params
+    :return: dict with the keys and the values of the parameters
+    """
+    values = OrderedDict()
+    for key in keys:
+        if isinstance(key, tuple):
+            node, comp, param = key
+            params = optmodel.params if comp is None else optmodel.get_component(comp, node).params
+        else:
+            params, param = optmodel.params, key
+        if params[param].value is None:
+            raise ValueError('Parameter {} is not changed by all scenarios, so it needs a value in the base '
+                             'problem'.format(param_name(key)))
+        values[key] = params[param].value
+    return values
+
+
+def _build(graph, pipe_model, repr_days, setup, start_time, reset_keys):
+    """
+    Build and compile the base problem
+
+    :return: Modesto object and dict with the base values of the parameters in reset_keys
+    """
+    optmodel = Modesto(pipe_model=pipe_model, graph=graph, repr_days=repr_days)
+    setup(optmodel)
+    optmodel.compile(start_time)
+    return optmodel, get_params(optmodel, reset_keys)
+
+
+def _init_worker(graph, pipe_model, repr_days, setup, start_time, threads, reset_keys):
+    """
+    Build and compile the model of a worker process once
+    """
+    if threads is not None:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    _worker['model'], _worker['base'] = _build(graph, pipe_model, repr_days, setup, start_time, reset_keys)
+
+
+def _run_scenario(name, scenario, settings, optmodel=None, base=None):
+    """
+    Apply a scenario to the model of this worker, solve it and collect the results. Parameters that other scenarios
+    change, but this one does not, are first reset to their values in the base problem, so the result does not depend
+    on the scenarios that ran before on the same worker.
+
+    :return: dict with the scenario name and parameters, status, objective value, solve time and optionally the
+        requested time series. If the scenario failed, status is None and error contains the error message.
+    """
+    if optmodel is None:
+        optmodel, base = _worker['model'], _worker['base']
+    result = {'name': name, 'scenario': scenario, 'status': None, 'objective': None, 'solve_time': None,
+              'series': None, 'error': None}
+
+    try:
+        reset = OrderedDict((key, val) for key, val in (base or {}).items() if key not in scenario)
+        if reset:
+            settings['apply'](optmodel, reset)
+        settings['apply'](optmodel, scenario)
+        optmodel.compile(settings['start_time'], recompile=settings['recompile'])
+        optmodel.set_objective(settings['objective'])
+
+        start = time.time()
+        solve_kwargs = {'threads': settings['threads'], 'persistent': True}
+        solve_kwargs.update(settings['solve_kwargs'])
+        status = optmodel.solve(**solve_kwargs)
+        result['solve_time'] = time.time() - start
+        result['status'] = status
+
+        if status >= 0:
+            result['objective'] = optmodel.get_objective()
+            if settings['spec'] is not None:
+                result['series'] = optmodel.get_results(settings['spec'])
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return result
+
+
+class ScenarioRunner(object):
+    def __init__(self, graph, setup, scenarios, pipe_model='ExtensivePipe', repr_days=None,
+                 start_time='20140101', objective='cost', apply=apply_params, spec=None, workers=None, threads=1,
+                 recompile=False, store=None, flush_every=1, **solve_kwargs):
+        """
+        Run a set of scenarios of the same problem in parallel. Every worker process builds and compiles the model
+        once, and then applies, solves and collects the scenarios assigned to it, only recompiling the changed
+        parameters between scenarios.
+
+        :param graph: networkx graph of the network
+        :param setup: Function taking a Modesto object and setting all parameters of the base problem. Must be
+            defined at module level, to be sent to the worker processes.
+        :param scenarios: List of scenarios (dicts, see apply_params and grid), or a dict with scenario names as keys
+            and scenarios as values. Scenarios may change different parameters: before a scenario is applied, the
+            parameters changed by other scenarios are reset to their values in the base problem. With a custom apply
+            function, all scenarios should change the same parameters.
+        :param pipe_model: Pipe model, see Modesto
+        :param repr_days: Representative days, see Modesto
+        :param start_time: Start time of the optimization
+        :param objective: Name of the objective
+        :param apply: Function taking a Modesto object and a scenario, changing the parameters of the scenario
+        :param spec: Time series results to collect, see Modesto.get_results. If None, only scalar results are
+            collected.
+        :param workers: Number of worker processes. Default: number of CPUs divided by threads. If 1, the scenarios
+            are run in this process.
+        :param threads: Number of threads per solve
+        :param recompile: If True, the model is recompiled completely for every scenario. Necessary if a scenario
+            changes the structure of the problem.
+        :param store: ResultStore to which the results are added. Scenarios already in the store are skipped, such
+            that an interrupted run can be resumed.
+        :param flush_every: Number of results after which the store is written to disk. The store is also written
+            when the run ends or is interrupted.
+        :param solve_kwargs: Other arguments of Modesto.solve, e.g. solver
+        """
+        if isinstance(scenarios, dict):
+            self.scenarios = OrderedDict((str(name), scenario) for name, scenario in scenarios.items())
+        else:
+            self.scenarios = OrderedDict((scenario_name(scenario), scenario) for scenario in scenarios)
+        if len(self.scenarios) < len(scenarios):
+            raise ValueError('Scenario names should be unique')
+
+        keys = []
+        for scenario in self.scenarios.values():
+            keys.extend(key for key in scenario if key not in keys)
+        self.reset_keys = [key for key in keys if not all(key in scenario for scenario in self.scenarios.values())]
+        if self.reset_keys and apply is not apply_params:
+            raise ValueError('With a custom apply function, all scenarios should change the same parameters')
+
+        self.graph = graph
+        self.setup = setup
+        self.pipe_model = pipe_model
+        self.repr_days = repr_days
+        self.start_time = pd.Timestamp(start_time)
+        self.store = store
+        self.flush_every = flush_every
+        self._unflushed = 0
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 1) // (threads or 1))
+        self.workers = workers
+        self.threads = threads
+
+        self.settings = {'apply': apply, 'start_time': self.start_time, 'objective': objective,
+                         'recompile': recompile, 'threads': threads, 'spec': spec, 'solve_kwargs': solve_kwargs}
+
+    def pending(self):
+        """
+        :return: Names of the scenarios that are not in the result store yet
+        """
+        done = set(self.store.scenarios()) if self.store is not None else set()
+        return [name for name in self.scenarios if name not in done]
+
+    def run(self):
+        """
+        Run all pending scenarios. Results are yielded as soon as they are available, not necessarily in the order
+        of the scenarios.
+
+        :return: Generator of result dicts, see _run_scenario
+        """
+        pending = self.pending()
+        logger.info('Running {} scenarios ({} already done) on {} workers'.format(
+            len(pending), len(self.scenarios) - len(pending), self.workers))
+
+        try:
+            if self.workers == 1:
+                optmodel, base = _build(self.graph, self.pipe_model, self.repr_days, self.setup, self.start_time,
+                                        self.reset_keys)
+                for name in pending:
+                    yield self._collect(_run_scenario(name, self.scenarios[name], self.settings, optmodel, base))
+                return
+
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.graph, self.pipe_model, self.repr_days, self.setup,
+                                               self.start_time, self.threads, self.reset_keys)) as executor:
+                futures = [executor.submit(_run_scenario, name, self.scenarios[name], self.settings)
+                           for name in pending]
+                for future in as_completed(futures):
+                    yield self._collect(future.result())
+        finally:
+            if self.store is not None:
+                self.store.flush()
+                self._unflushed = 0
+
+    def run_all(self):
+        """
+        Run all pending scenarios and collect their scalar results
+
+        :return: pd.DataFrame with the scenario names as index and the status, objective and solve time as columns
+        """
+        results = {result['name']: {'status': result['status'], 'objective': result['objective'],
+                                    'solve_time': result['solve_time']}
+                   for result in self.run()}
+        return pd.DataFrame.from_dict(results, orient='index').reindex(
+            [name for name in self.scenarios if name in results])
+
+    def _collect(self, result):
+        """
+        Log a result and add it to the result store, writing the store to disk every flush_every results
+        """
+        if result['error'] is not None:
+            logger.warning('Scenario {} failed: {}'.format(result['name'], result['error']))
+        elif self.store is not None and result['status'] >= 0:
+            scalars = {'status': result['status'], 'objective': result['objective'],
+                       'solve_time': result['solve_time']}
+            for key, val in result['scenario'].items():
+                if isinstance(val, (int, float, str)):
+                    scalars[param_name(key)] = val
+            self.store.append(result['name'], result['series'], scalars)
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self.store.flush()
+                self._unflushed = 0
+        return result
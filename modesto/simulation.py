@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+Simulation of the temperatures of temperature driven (NodeMethod) networks with known mass flow rates
+"""
+
+import logging
+from collections import OrderedDict
+from itertools import accumulate
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import modesto.utils as ut
+from modesto.component import FixedProfile, ProducerVariable
+from modesto.pipe import NodeMethod, history_window, plug_flow_indices
+from modesto.warmstart import Snapshot
+
+logger = logging.getLogger('modesto.simulation')
+
+# Variables indexed by (time, line) instead of (line, time)
+TIME_FIRST = ['mix_temp']
+
+
+class NodeMethodSimulation(object):
+    def __init__(self, optmodel):
+        """
+        Simulation of the supply and return temperatures of a temperature driven network. With all mass flow rates
+        known, the node method equations of the pipes (Eq. 3.4.3 - 3.4.27) and the mixing at the nodes are a
+        deterministic simulation, which is evaluated here with NumPy instead of being posed as constraints: the supply
+        line is simulated from the producers to the buildings and the return line back, every pipe for all time steps at
+        once. The only inputs besides the parameters of the model are the supply temperatures of the producers.
+
+        Use it to check the parameters of a model before optimizing (see check_limits), to initialize the variables of
+        a compiled model (see to_snapshot and Modesto.restore) or as a fast forecast of the network temperatures.
+
+        Where the optimization model leaves a temperature free because there is no mass flow rate, the simulation uses
+        the mixed temperature of the node for the outgoing elements, and the unweighted mean of the known incoming
+        temperatures as mixed temperature of a node without incoming mass flow rate (the previous mixed temperature if
+        none are known).
+
+        Only FixedProfile buildings and ProducerVariable producers are supported, in networks without cycles and
+        without flow reversal in the pipes.
+
+        :param optmodel: Modesto object of a NodeMethod network with all parameters set. It does not need to be
+            compiled.
+        """
+        if optmodel.pipe_model != 'NodeMethod':
+            raise ValueError('Only NodeMethod networks can be simulated, not {}'.format(optmodel.pipe_model))
+        if not nx.is_directed_acyclic_graph(optmodel.graph):
+            raise ValueError('Only networks without cycles can be simulated')
+
+        self.optmodel = optmodel
+        self.start_time = None
+        self.time_step = None
+        self.n_steps = None
+        self.results = OrderedDict()  # Component name: {variable name: {line or None: array}}
+        self._plug_flow = {}  # Pipe name: plug flow quantities, see plug_flow_indices
+
+    def run(self, start_time, supply_temperature=None):
+        """
+        Simulate the network over the horizon of the model
+
+        :param start_time: Start time, pd.Timestamp or string of format 'yyyymmdd'
+        :param supply_temperature: dict with the names of the producers ('node.comp') as keys and their supply
+            temperatures as values, a scalar or one value per time step (K). Producers that are not in the dict keep
+            their initial supply temperature (temperature_supply). As in the optimization model, the temperatures of
+            the first time step are the initial temperatures.
+        :return:
+        """
+        optmodel = self.optmodel
+        self.start_time = pd.Timestamp(start_time)
+        self.time_step = optmodel.params['time_step'].v()
+        self.n_steps = int(optmodel.params['horizon'].v() / self.time_step)
+
+        optmodel.check_data()
+        previous_start = optmodel.start_time
+        optmodel.update_time(self.start_time)
+        try:
+            self.results = OrderedDict()
+            self._plug_flow = {}
+            self._simulate(supply_temperature or {})
+        finally:
+            if previous_start is not None and previous_start != self.start_time:
+                optmodel.update_time(previous_start)
+
+    def _simulate(self, supply_temperature):
+        optmodel = self.optmodel
+        graph = optmodel.graph
+        n_steps = self.n_steps
+
+        pipes = {}  # Pipe name: (pipe object, mass flow rate)
+        for _, _, name in graph.edges(data='name'):
+            pipe = optmodel.components[name]
+            if not isinstance(pipe, NodeMethod):
+                raise ValueError('Pipe {} is no NodeMethod pipe'.format(name))
+            mass_flow = pipe.params['mass_flow'].v_array()
+            if (mass_flow < 0).any():
+                raise ValueError('The mass flow rate through pipe {} changes direction'.format(name))
+            pipes[name] = (pipe, mass_flow)
+
+        producers = {}  # Node: list of (component, mass flow rate)
+        buildings = {}
+        for node in graph.nodes:
+            producers[node] = []
+            buildings[node] = []
+            for comp in optmodel.components[node].components.values():
+                if isinstance(comp, ProducerVariable):
+                    producers[node].append((comp, comp.params['mass_flow'].v_array()))
+                elif isinstance(comp, FixedProfile) and comp.direction == -1:
+                    buildings[node].append((comp, np.abs(comp.params['mass_flow'].v_array())))
+                else:
+                    raise ValueError('Component {} of type {} cannot be simulated'.format(comp.name,
+                                                                                        type(comp).__name__))
+
+        names = [comp.name for node in graph.nodes for comp, _ in producers[node]]
+        unknown = set(supply_temperature) - set(names)
+        if unknown:
+            raise KeyError('{} are no producers of the network'.format(sorted(unknown)))
+
+        def initial(comp, line, values):
+            values = np.array(np.broadcast_to(values, (n_steps,)), dtype=np.float64)
+            values[0] = comp.params['temperature_' + line].v()
+            return values
+
+        order = list(nx.topological_sort(graph))
+
+        # Supply line, from the producers to the buildings
+        for node in order:
+            incoming = []
+            for _, _, name in graph.in_edges(node, data='name'):
+                incoming.append((pipes[name][1], self._get(name, 'temperature_out', 'supply')))
+            for comp, mass_flow in producers[node]:
+                supply = initial(comp, 'supply',
+                                 supply_temperature.get(comp.name, comp.params['temperature_supply'].v()))
+                self._store(comp.name, 'temperatures', supply, 'supply')
+                incoming.append((mass_flow, supply))
+
+            mixed = _mix(incoming, n_steps)
+            self._store(node, 'mix_temp', mixed, 'supply')
+
+            for comp, _ in buildings[node]:
+                self._store(comp.name, 'temperatures', initial(comp, 'supply', mixed), 'supply')
+            for _, _, name in graph.out_edges(node, data='name'):
+                self._simulate_pipe(name, pipes[name][0], pipes[name][1], 'supply', mixed)
+
+        # Return line, from the buildings back to the producers
+        for node in reversed(order):
+            incoming = []
+            for _, _, name in graph.out_edges(node, data='name'):
+                incoming.append((pipes[name][1], self._get(name, 'temperature_out', 'return')))
+            returns = []
+            for comp, mass_flow in buildings[node]:
+                heat_flow = comp.params['mult'].v() * comp.params['heat_profile'].v_array()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ret = self._get(comp.name, 'temperatures', 'supply') - heat_flow / mass_flow / comp.cp
+                ret[mass_flow == 0] = np.nan  # Equal to the mixed temperature
+                ret[0] = comp.params['temperature_return'].v()
+                returns.append(ret)
+                incoming.append((mass_flow, ret))
+
+            mixed = _mix(incoming, n_steps)
+            self._store(node, 'mix_temp', mixed, 'return')
+
+            for (comp, _), ret in zip(buildings[node], returns):
+                self._store(comp.name, 'temperatures', np.where(np.isnan(ret), mixed, ret), 'return')
+            for comp, mass_flow in producers[node]:
+                ret = initial(comp, 'return', mixed)
+                self._store(comp.name, 'temperatures', ret, 'return')
+                heat_flow = (self._get(comp.name, 'temperatures', 'supply') - ret) * comp.cp * mass_flow
+                self._store(comp.name, 'heat_flow', heat_flow)
+            for _, _, name in graph.in_edges(node, data='name'):
+                self._simulate_pipe(name, pipes[name][0], pipes[name][1], 'return', mixed)
+
+        logger.info('Simulated {} time steps of {} pipes'.format(n_steps, len(pipes)))
+
+    def _simulate_pipe(self, name, pipe, mass_flow, line, temperature_in):
+        """
+        Simulate one line of a pipe for all time steps, Eq. 3.4.3 - 3.4.27
+
+        :param name: Name of the pipe
+        :param pipe: NodeMethod object
+        :param mass_flow: Mass flow rate through the pipe, one value per time step (kg/s)
+        :param line: 'supply' or 'return'
+        :param temperature_in: Incoming temperature, one value per time step (K). The first value is replaced by the
+            most recent historic temperature.
+        :return:
+        """
+        time_step = self.time_step
+        n_steps = self.n_steps
+        _, temperature_history = pipe.get_history()
+        thermal = pipe.get_thermal_properties()
+        C, surface, Z, K = thermal['C'], thermal['surface'], thermal['Z'], thermal['K']
+        Tg = pipe.params['Tg'].v_array()
+
+        # The same for both lines
+        if name not in self._plug_flow:
+            plug_flow = plug_flow_indices(mass_flow, pipe.get_history()[0], time_step, Z)
+            plug_flow['window'] = history_window(plug_flow, n_steps)
+            self._plug_flow[name] = plug_flow
+        plug_flow = self._plug_flow[name]
+        n, m, R, S = plug_flow['n'], plug_flow['m'], plug_flow['R'], plug_flow['S']
+        mf_history = plug_flow['mf_history'][:n_steps + plug_flow['window']]
+
+        temperature_in = np.array(temperature_in, dtype=np.float64)
+        temperature_in[0] = temperature_history[line][0]
+        temperatures = np.concatenate([temperature_in[::-1], temperature_history[line][:plug_flow['window']]])
+
+        # Eq. 3.4.9
+        start = n_steps - 1 - np.arange(n_steps)
+        cumulative = np.concatenate([[0.], np.cumsum(mf_history * temperatures * time_step)])
+        low = start + n + 1
+        Y = cumulative[np.maximum(start + m, low)] - cumulative[low]
+
+        flow = mass_flow != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Eq. 3.4.12
+            temp_out_nhc = ((R - Z) * temperatures[start + n] + Y +
+                            (mass_flow * time_step - S + Z) * temperatures[start + m]) / mass_flow / time_step
+            # Eq. 3.4.27
+            loss = np.exp(-(K * plug_flow['tk']) / (surface * pipe.rho * pipe.cp))
+        temp_out_nhc[~flow] = np.nan
+        decay = np.exp(-K * time_step / (surface * pipe.rho * pipe.cp + C / pipe.length))
+
+        # Wall heat capacity (Eq. 3.4.14 - 3.4.18): the wall temperature follows the outgoing temperature without
+        # heat losses when there is a mass flow rate and cools down towards the ground temperature otherwise, a linear
+        # recurrence wall[t] = alpha[t] * wall[t - 1] + beta[t]
+        capacity = mass_flow * pipe.cp * time_step
+        alpha = np.where(flow, C / (C + capacity), decay)
+        beta = np.where(flow, temp_out_nhc * capacity / (C + capacity), (1 - decay) * Tg)
+        wall = np.array(list(accumulate(zip(alpha[1:].tolist(), beta[1:].tolist()), lambda w, ab: ab[0] * w + ab[1],
+                                        initial=pipe.params['wall_temperature_' + line].v())))
+        temp_out_nhl = np.where(flow, wall, np.nan)
+
+        # Heat losses (Eq. 3.4.27), the outgoing water cools down like the wall when there is no mass flow rate
+        temp_out = Tg + (temp_out_nhl - Tg) * loss
+        if not flow[0]:
+            temp_out[0] = pipe.params['temperature_out_' + line].v()
+        for t in np.flatnonzero(~flow[1:]) + 1:
+            temp_out[t] = Tg[t] + (temp_out[t - 1] - Tg[t]) * decay
+
+        self._store(name, 'temperature_in', temperature_in, line)
+        self._store(name, 'temperatures', temperatures, line)
+        self._store(name, 'Y', Y, line)
+        self._store(name, 'temperature_out_nhc', temp_out_nhc, line)
+        self._store(name, 'temperature_out_nhl', temp_out_nhl, line)
+        self._store(name, 'wall_temp', wall, line)
+        self._store(name, 'temperature_out', temp_out, line)
+
+    def _store(self, name, var, values, line=None):
+        self.results.setdefault(name, OrderedDict()).setdefault(var, OrderedDict())[line] = values
+
+    def _get(self, name, var, line=None):
+        return self.results[name][var][line]
+
+    def get_result(self, name, node=None, comp=None, index=None):
+        """
+        Simulated values of a variable, with the same names as in the optimization model (see Modesto.get_result)
+
+        :param name: Name of the variable, e.g. temperatures, temperature_out, mix_temp or heat_flow
+        :param node: Name of the node of the component, None for pipes and nodes
+        :param comp: Name of the component, pipe or node
+        :param index: Line ('supply' or 'return'), None for variables without line
+        :return: pd.Series with one value per time step
+        """
+        if not self.results:
+            raise Exception('The network has not been simulated yet')
+        key = comp if node is None else node + '.' + comp
+        if key not in self.results or name not in self.results[key] or index not in self.results[key][name]:
+            raise KeyError('No simulated values of {} of {} (index {})'.format(name, key, index))
+
+        values = self.results[key][name][index][:self.n_steps]
+        resname = '.'.join([key, name] + ([index] if index is not None else []))
+        return pd.Series(values, index=ut.time_index(self.start_time, self.time_step, self.n_steps), name=resname)
+
+    def get_results(self):
+        """
+        :return: pd.DataFrame with all simulated variables of all components, pipes and nodes, one column per
+            variable and line, one row per time step
+        """
+        columns = OrderedDict()
+        for key, variables in self.results.items():
+            for name, lines in variables.items():
+                for line, values in lines.items():
+                    columns['.'.join([key, name] + ([line] if line is not None else []))] = values[:self.n_steps]
+        return pd.DataFrame(columns, index=ut.time_index(self.start_time, self.time_step, self.n_steps))
+
+    def to_snapshot(self):
+        """
+        Simulated values as a snapshot, to initialize the variables of the compiled model before solving it, see
+        Modesto.restore
+
+        :return: Snapshot object
+        """
+        if not self.results:
+            raise Exception('The network has not been simulated yet')
+        values = {}
+        for key, variables in self.results.items():
+            values[key] = {}
+            for name, lines in variables.items():
+                var_values = {}
+                for line, array in lines.items():
+                    for t, val in enumerate(array.tolist()):
+                        if np.isnan(val):
+                            continue
+                        if line is None:
+                            var_values[t] = val
+                        elif name in TIME_FIRST:
+                            var_values[t, line] = val
+                        else:
+                            var_values[line, t] = val
+                values[key][name] = var_values
+        return Snapshot(self.start_time, self.time_step, values)
+
+    def check_limits(self):
+        """
+        Compare the simulated supply temperatures of the buildings and producers with their temperature_min and
+        temperature_max parameters
+
+        :return: pd.DataFrame with one row per component and time step where a limit is exceeded, with the name of the
+            component, the time, the supply temperature and the exceeded limit
+        """
+        rows = []
+        index = ut.time_index(self.start_time, self.time_step, self.n_steps)
+        for key, variables in self.results.items():
+            if key not in self.optmodel.components or 'temperatures' not in variables:
+                continue
+            comp = self.optmodel.components[key]
+            if isinstance(comp, NodeMethod):
+                continue
+            supply = variables['temperatures']['supply']
+            for limit, exceeded in [('temperature_min', np.less), ('temperature_max', np.greater)]:
+                bound = comp.params[limit].v()
+                for t in np.flatnonzero(exceeded(supply, bound)):
+                    rows.append([key, index[t], supply[t], limit, bound])
+        return pd.DataFrame(rows, columns=['component', 'time', 'temperature', 'limit', 'bound'])
+
+
+def _mix(incoming, n_steps):
+    """
+    Mixed temperature of the incoming flows of a node: the mass flow weighted mean, the unweighted mean of the known
+    temperatures if there is no mass flow rate, and the previous mixed temperature if no temperature is known
+
+    :param incoming: List of (mass flow rate, temperature) tuples of arrays with one value per time step. Unknown
+        temperatures are NaN.
+    :param n_steps: Number of time steps
+    :return: Array with the mixed temperature per time step
+    """
+    if not incoming:
+        return np.full(n_steps, np.nan)
+    flows = np.array([np.abs(mf) for mf, _ in incoming])
+    temperatures = np.array([temp for _, temp in incoming])
+    known = ~np.isnan(temperatures)
+
+    total = flows.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mixed = (flows * np.where(known, temperatures, 0)).sum(axis=0) / total
+        mean = np.where(known, temperatures, 0).sum(axis=0) / known.sum(axis=0)
+    mixed = np.where(total > 0, mixed, mean)
+
+    # Previous value where nothing is known
+    missing = np.isnan(mixed)
+    if missing.any():
+        last = np.where(~missing, np.arange(n_steps), 0)
+        np.maximum.accumulate(last, out=last)
+        mixed = np.where(missing & ~missing[last], mixed[last], mixed)
+    return mixed
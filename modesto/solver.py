@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""
+Solver sessions for modesto, keeping a solver instance alive across solves
+"""
+
+import logging
+import os
+import time
+from math import ceil
+
+from pyomo.opt import SolverFactory, TerminationCondition
+
+logger = logging.getLogger('modesto.solver')
+
+# Pyomo persistent interfaces per solver
+PERSISTENT_INTERFACES = {
+    'gurobi': 'appsi_gurobi',
+    'cplex': 'appsi_cplex',
+    'cbc': 'appsi_cbc',
+    'highs': 'appsi_highs',
+    'ipopt': 'appsi_ipopt',
+}
+
+# Solvers tried by the auto mode, in order of preference
+AUTO_SOLVERS = ['gurobi', 'cplex', 'highs', 'cbc', 'glpk']
+
+
+def _on_off(val):
+    return 'on' if val else 'off'
+
+
+# Solver independent options and their names (or a function returning a dict of solver options) per solver. The
+# same names are used by the persistent interfaces.
+SOLVER_OPTIONS = {
+    'gurobi': {'mipgap': 'MIPGap',
+               'timelim': 'TimeLimit',
+               'threads': 'Threads',
+               'presolve': lambda val: {'Presolve': -1 if val else 0},
+               'seed': 'Seed',
+               'logfile': 'LogFile',
+               'mipfocus': 'MIPFocus'},
+    'cplex': {'mipgap': 'mip tolerances mipgap',
+              'timelim': 'timelimit',
+              'threads': 'threads',
+              'presolve': lambda val: {'preprocessing presolve': int(bool(val))},
+              'seed': 'randomseed',
+              'probe': lambda val: {'mip strategy probe': 3 if val else 0}},
+    'cbc': {'mipgap': 'ratioGap',
+            'timelim': 'sec',
+            'threads': 'threads',
+            'presolve': lambda val: {'presolve': _on_off(val)},
+            'seed': 'randomSeed'},
+    'glpk': {'mipgap': 'mipgap',
+             'timelim': lambda val: {'tmlim': int(ceil(val))},
+             'presolve': lambda val: {'presol' if val else 'nopresol': ''},
+             'seed': 'seed',
+             'logfile': 'log'},
+    'highs': {'mipgap': 'mip_rel_gap',
+              'timelim': lambda val: {'time_limit': float(val)},
+              'threads': 'threads',
+              'presolve': lambda val: {'presolve': _on_off(val)},
+              'seed': 'random_seed',
+              'logfile': 'log_file'},
+}
+
+_session_types = {}
+_auto_solvers = {}
+
+
+def solver_options(solver, **options):
+    """
+    Translate solver independent options to the options of a solver
+
+    :param solver: Name of the solver
+    :param options: Solver independent options: mipgap (relative MIP gap), timelim (time limit in seconds), threads,
+        presolve (True or False), seed (random seed), logfile (file name of the solver log), and the solver specific
+        mipfocus (Gurobi) and probe (CPLEX). Options that are None are not set.
+    :return: tuple with a dict of solver options and a list of the names of the options the solver does not support
+    """
+    names = SOLVER_OPTIONS.get(solver, {})
+    out = {}
+    unsupported = []
+    for name, val in options.items():
+        if val is None:
+            continue
+        if name not in names:
+            unsupported.append(name)
+        elif callable(names[name]):
+            out.update(names[name](val))
+        else:
+            out[names[name]] = val
+    return out, unsupported
+
+
+class SolverSession(object):
+    persistent = False
+
+    def __init__(self, solver):
+        """
+        File based solver. The instance is reused between solves, but the full model is written to the solver every
+        time it is solved.
+
+        :param solver: Name of the solver, as known by Pyomo's SolverFactory
+        """
+        self.solver = solver
+        self.opt = SolverFactory(solver)
+        self.model = None
+        self.logfile = None
+        self.n_solves = 0
+        self.timings = {}  # Time spent in the phases of the last solve, in seconds
+
+    @property
+    def options(self):
+        """
+        :return: Options dict of the solver
+        """
+        return self.opt.options
+
+    def available(self):
+        """
+        :return: True if the solver can be used
+        """
+        return bool(self.opt.available(exception_flag=False))
+
+    def reset_options(self):
+        """
+        Remove all options set for previous solves
+
+        :return:
+        """
+        self.options.clear()
+        self.logfile = None
+
+    def set_options(self, **options):
+        """
+        Set solver independent options, see solver_options. Options the solver does not support are ignored with a
+        warning.
+
+        :param options: Solver independent options
+        :return:
+        """
+        native, unsupported = solver_options(self.solver, **options)
+        if 'logfile' in unsupported:
+            # Let Pyomo write the solver output to the log file
+            unsupported.remove('logfile')
+            self.logfile = options['logfile']
+        for name in unsupported:
+            logger.warning('Option {} is not supported for solver {} and is ignored'.format(name, self.solver))
+        self.options.update(native)
+
+    def _solve_kwargs(self, tee, warmstart):
+        kwargs = {'tee': tee}
+        if warmstart:
+            if self.opt.warm_start_capable():
+                kwargs['warmstart'] = True
+            else:
+                logger.info('Solver {} does not support warm starts'.format(self.solver))
+        if self.logfile is not None:
+            kwargs['logfile'] = self.logfile
+        return kwargs
+
+    def solve(self, model, tee=False, warmstart=False):
+        """
+        Solve an optimization model
+
+        :param model: Pyomo model
+        :param tee: If True, print the solver output
+        :param warmstart: If True, use the current variable values as a starting point
+        :return: Pyomo results object
+        """
+        self.model = model
+        self.timings = {}
+        start = time.perf_counter()
+        results = self.opt.solve(model, **self._solve_kwargs(tee, warmstart))
+        total = time.perf_counter() - start
+
+        # The time reported by the solver, if any, separates the solver from writing and reading files
+        solver_time = _solver_time(results)
+        if solver_time is None:
+            self.timings['solve'] = total
+        else:
+            self.timings['solver'] = solver_time
+            self.timings['model_write_and_load'] = max(total - solver_time, 0.)
+        self.n_solves += 1
+        return results
+
+
+class PersistentSession(SolverSession):
+    persistent = True
+
+    def __init__(self, solver):
+        """
+        Solver using a Pyomo persistent interface. The model is loaded into the solver at its first solve. Later
+        solves of the same model only push the changes to the solver: values of mutable parameters, variable bounds,
+        the active objective and added or removed constraints. Solving a new model object (e.g. after recompiling)
+        loads that model again.
+
+        :param solver: Name of the solver (e.g. 'gurobi') or of a persistent interface (e.g. 'appsi_gurobi')
+        """
+        self.interface = PERSISTENT_INTERFACES.get(solver, solver)
+        SolverSession.__init__(self, self.interface)
+        self.solver = solver
+
+    def solve(self, model, tee=False, warmstart=False):
+        """
+        Solve an optimization model, only pushing the changes since the previous solve if it is the same model
+
+        :param model: Pyomo model
+        :param tee: If True, print the solver output
+        :param warmstart: If True, use the current variable values as a starting point
+        :return: Pyomo results object
+        """
+        if model is not self.model:
+            logger.info('Loading model into persistent solver {}'.format(self.interface))
+        else:
+            logger.info('Updating model in persistent solver {}'.format(self.interface))
+        self.model = model
+
+        # Solutions are only loaded when one was found, so that an infeasible model can be reported as such
+        self.timings = {}
+        start = time.perf_counter()
+        results = self.opt.solve(model, load_solutions=False, **self._solve_kwargs(tee, warmstart))
+        self.timings['solve'] = time.perf_counter() - start
+        if results.solver.termination_condition in [TerminationCondition.optimal, TerminationCondition.feasible,
+                                                    TerminationCondition.maxTimeLimit,
+                                                    TerminationCondition.maxIterations]:
+            start = time.perf_counter()
+            try:
+                self.opt.load_vars()
+            except RuntimeError:
+                logger.warning('The solver did not return a solution to load')
+            self.timings['load_results'] = time.perf_counter() - start
+        self.n_solves += 1
+        return results
+
+
+def _solver_time(results):
+    """
+    :return: Solution time reported by the solver in seconds, None if not reported
+    """
+    try:
+        solver_time = results.solver.time
+    except AttributeError:
+        return None
+    if isinstance(solver_time, (int, float)):
+        return float(solver_time)
+    return None
+
+
+def register_session(solver, session_type):
+    """
+    Register the session type to be used for a solver if no persistent interface is used or available
+
+    :param solver: Name of the solver
+    :param session_type: Class or callable taking the solver name and returning a SolverSession
+    :return:
+    """
+    _session_types[solver] = session_type
+
+
+def make_session(solver, persistent=False):
+    """
+    Create a solver session
+
+    :param solver: Name of the solver, or 'auto' for the preferred installed solver (see auto_solver)
+    :param persistent: If True, a persistent interface is used if it is available. Otherwise, the session type
+        registered for the solver is used (file based by default).
+    :return: SolverSession
+    """
+    if solver == 'auto':
+        solver = auto_solver(persistent)
+
+    if persistent:
+        session = PersistentSession(solver)
+        if session.available():
+            return session
+        logger.info('No persistent interface available for {}, using a file based solver'.format(solver))
+
+    return _session_types.get(solver, SolverSession)(solver)
+
+
+def default_solver():
+    """
+    Solver used when none is given, set by the MODESTO_SOLVER environment variable (e.g. 'auto' on machines without
+    commercial solvers). Default 'gurobi'.
+
+    :return: Name of the solver
+    """
+    return os.environ.get('MODESTO_SOLVER', 'gurobi')
+
+
+def auto_solver(persistent=False):
+    """
+    Find the preferred solver that is installed, see AUTO_SOLVERS
+
+    :param persistent: If True, solvers with an available persistent interface are preferred
+    :return: Name of the solver
+    """
+    if persistent not in _auto_solvers:
+        candidates = [(solver, True) for solver in AUTO_SOLVERS] if persistent else []
+        candidates += [(solver, False) for solver in AUTO_SOLVERS]
+        for solver, use_persistent in candidates:
+            session = make_session(solver, persistent=use_persistent)
+            if session.available() and session.persistent == use_persistent:
+                _auto_solvers[persistent] = solver
+                break
+        else:
+            raise Exception('None of the supported solvers ({}) is available'.format(', '.join(AUTO_SOLVERS)))
+        logger.info('Using solver {}'.format(_auto_solvers[persistent]))
+
+    return _auto_solvers[persistent]
@@ -1,13 +1,17 @@
 
 
 from collections import Counter
+from itertools import product
 
-from pyomo.core.base import Block, Var, NonNegativeReals, value
+from pyomo.core.base import Block, Param, Var, NonNegativeReals, value
 from pyomo.core.base.param import IndexedParam, _ParamData
 from pyomo.core.base.var import IndexedVar
 
+import numpy as np
 import pandas as pd
 
+import modesto.utils as ut
+
 
 class Submodel(object):
     def __init__(self, name=None, temperature_driven=False, repr_days=None):
@@ -72,11 +76,17 @@ class Submodel(object):
         :param pd.Timestamp new_val: New start time
         :return:
         """
+        if self.repr_days is None:
+            repr_days = None
+        else:
+            repr_days = sorted(set(self.repr_days.values()))
+
         for _, param in self.params.items():
             param.change_start_time(start_time)
             param.change_time_step(time_step)
             param.change_horizon(horizon)
             param.resample()
+            param.slice_horizon(repr_days)
 
         if not horizon % time_step == 0:
             raise Exception(
@@ -167,6 +177,27 @@ class Submodel(object):
 
         self.params[param].change_value(new_data)
 
+    def get_dirty_params(self):
+        """
+        :return: List with the names of the parameters that changed since the last compilation
+        """
+        return [name for name, param in self.params.items() if param.is_dirty()]
+
+    def is_dirty(self):
+        """
+        :return: True if any parameter of this submodel changed since the last compilation
+        """
+        return any(param.is_dirty() for param in self.params.values())
+
+    def clear_dirty(self):
+        """
+        Mark all parameters of this submodel as unchanged
+
+        :return:
+        """
+        for param in self.params.values():
+            param.clear_dirty()
+
     def check_data(self):
         """
         Check if all data required to build the optimization problem is available
@@ -244,6 +275,38 @@ class Submodel(object):
         self.logger.info(
             'Optimization block initialized for {}'.format(self.name))
 
+    def set_time_param(self, name, values, mutable=True):
+        """
+        Fill a time indexed Param from an array in one call. If the Param does not exist in the block yet, it is
+        created (indexed by TIME, or by TIME and REPR_DAYS), otherwise all its values are updated.
+
+        :param name: Name of the Param in the block
+        :param values: Array with one value per time step, or an array of shape (len(REPR_DAYS), len(TIME)) for a
+            Param indexed by time step and representative day. A scalar is broadcast to all time steps.
+        :param mutable: True if the Param should be mutable
+        :return: The Param object
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 2 or (values.ndim == 0 and self.repr_days is not None):
+            index = (self.TIME, self.REPR_DAYS)
+            keys = product(self.TIME, self.REPR_DAYS)
+            values = np.broadcast_to(values, (len(self.REPR_DAYS), len(self.TIME))).T
+        else:
+            index = (self.TIME,)
+            keys = self.TIME
+            values = np.broadcast_to(values, (len(self.TIME),))
+        data = dict(zip(keys, values.ravel().tolist()))
+
+        param = self.block.component(name)
+        if param is None:
+            self.block.add_component(name, Param(*index, mutable=mutable,
+                                                 initialize=data))
+            param = self.block.component(name)
+        else:
+            param.store_values(data)
+
+        return param
+
     def obj_slack(self):
         """
         Yield summation of all slacks in the componenet
@@ -321,6 +384,14 @@ class Submodel(object):
         """
         return 0
 
+    def obj_investment(self):
+        """
+        Investment cost for the cost objectives, only for components of which the size is optimized
+
+        :return:
+        """
+        return 0
+
     def get_investment_cost(self):
         """
         Get the investment cost of this component. For a generic component, this is currently 0, but as components with price data are added, the cost parameter is used to get this value.
@@ -379,58 +450,226 @@ class Submodel(object):
 
         return 0
 
-    def get_result(self, name, index, state, start_time):
-        obj = self.block.find_component(name)
+    def get_result_values(self, name, index=None, state=False):
+        """
+        Get the values of a variable or parameter after optimization as an array
 
-        result = []
+        :param name: Name of the variable or parameter
+        :param index: Index of the variable next to time (e.g. the line), if any
+        :param state: If True, the state time axis is used instead of the ordinary time axis
+        :return: tuple with a 1D array of values (one per time step, or one per time step of every day of the year for
+            representative days) and the name of the result. The array is None if the object is no indexed variable or
+            parameter.
+        """
+        if self.block is None:
+            raise Exception('{} has no optimization block, {} is not available. With network balances (see Modesto), '
+                            'nodes have no block and no results of their own.'.format(self.name, name))
+
+        obj = self.block.find_component(name)
 
         if obj is None:
             raise Exception(
                 '{} is not a valid parameter or variable of {}'.format(name,
                                                                        self.name))
 
+        resname = self.name + '.' + name
+        if not isinstance(obj, (IndexedVar, IndexedParam)):
+            self.logger.warning(
+                '{}.{} was a different type of variable/parameter than what has been implemented: '
+                '{}'.format(self.name, name, type(obj)))
+            return None, resname
+
+        values = obj.extract_values()
         time = self.get_time_axis(state)
 
-        if isinstance(obj, IndexedVar) and self.repr_days is None:
-            if index is None:
-                for i in obj:
-                    result.append(value(obj[i]))
+        if self.repr_days is not None:
+            return self.expand_repr_days(values, time), resname
+        elif index is not None and isinstance(obj, IndexedVar):
+            resname = resname + '.' + index
+            return np.array([values[index, t] for t in time], dtype=np.float64), resname
+        else:
+            return np.array([values[i] for i in obj], dtype=np.float64), resname
+
+    def get_all_result_values(self):
+        """
+        Get the values of all variables and parameters of this submodel that are indexed by time (and possibly by a
+        second index, such as the line, or by representative day)
 
-                resname = self.name + '.' + name
+        :return: dict with the result names as keys and the arrays of values (see get_result_values) as values
+        """
+        results = {}
+        if self.block is None:
+            return results
 
-            else:
-                for i in time:
-                    result.append(obj[(index, i)].value)
+        for obj in self.block.component_objects((Var, Param), descend_into=False):
+            if not obj.is_indexed():
+                continue
+            values = obj.extract_values()
+            for time in [self.TIME, self.X_TIME]:
+                arrays = self._time_indexed_values(values, time)
+                if arrays is not None:
+                    for suffix, array in arrays.items():
+                        results[self.name + '.' + obj.local_name + suffix] = array
+                    break
 
-                    resname = self.name + '.' + name + '.' + index
-        elif isinstance(obj, IndexedVar) and self.repr_days is not None:
-            for d in self.DAYS_OF_YEAR:
-                for t in time:
-                    result.append(value(obj[t, self.repr_days[d]]))
+        return results
 
-                    resname = self.name + '.' +name
+    def get_var_values(self):
+        """
+        Get the current values of all variables of this submodel
 
-        elif isinstance(obj, IndexedParam):
-            resname = self.name + '.' + name
-            if self.repr_days is None:
-                result = []
-                for t in obj:
-                    result.append(value(obj[t]))
+        :return: dict with the variable names as keys and dicts with the values per index as values
+        """
+        if self.block is None:
+            return {}
+        return {var.local_name: var.extract_values()
+                for var in self.block.component_objects(Var, descend_into=False)}
 
-            else:
-                for d in self.DAYS_OF_YEAR:
-                    for t in time:
-                        result.append(value(obj[t, self.repr_days[d]]))
+    def set_var_values(self, values, position=None):
+        """
+        Set the values of the variables of this submodel, e.g. to warm start an optimization from an earlier solution.
+        Fixed variables are not changed.
 
-        else:
-            self.logger.warning(
-                '{}.{} was a different type of variable/parameter than what has been implemented: '
-                '{}'.format(self.name, name, type(obj)))
+        :param values: dict with the variable names as keys and dicts with the values per index as values, see
+            get_var_values
+        :param position: Function mapping a time step of this submodel to the (fractional) time step in values, for
+            variables indexed by time. Values between two time steps are interpolated linearly and rounded for integer
+            variables. Before the first and after the last time step, the first and last values are used. If None, the
+            values are copied index by index.
+        :return:
+        """
+        if self.block is None:
+            return
+
+        for var in self.block.component_objects(Var, descend_into=False):
+            old = values.get(var.local_name)
+            if not old:
+                continue
+
+            layout = None
+            if position is not None and var.is_indexed() and self.repr_days is None:
+                keys = set(var.keys())
+                for time in [self.TIME, self.X_TIME]:
+                    layout = self._time_layout(keys, time)
+                    if layout is not None:
+                        break
+
+            if layout is None:
+                for key, val in old.items():
+                    if val is not None and key in var and not var[key].fixed:
+                        var[key].set_value(val, skip_validation=True)
+                continue
+
+            old_last = max(k if layout == -1 else k[layout] for k in old)
+            for key in var:
+                vardata = var[key]
+                if vardata.fixed:
+                    continue
+                t = key if layout == -1 else key[layout]
+                x = min(max(position(t), 0), old_last)
+                lo = int(np.floor(x))
+                hi = min(lo + 1, old_last)
+                v_lo = old.get(_replace_time(key, layout, lo))
+                v_hi = old.get(_replace_time(key, layout, hi))
+                if v_lo is None or v_hi is None:
+                    continue
+                val = v_lo + (x - lo) * (v_hi - v_lo)
+                if vardata.is_integer():
+                    val = round(val)
+                vardata.set_value(val, skip_validation=True)
+
+    def shift_values(self, shift):
+        """
+        Shift the values of all variables of this submodel that are indexed by time by a number of time steps towards
+        the start of the horizon. The last values are repeated at the end. Used to warm start an optimization that
+        starts shift time steps later than the current solution.
+
+        :param shift: Number of time steps
+        :return:
+        """
+        self.set_var_values(self.get_var_values(), position=lambda t: t + shift)
+
+    def _time_layout(self, keys, time):
+        """
+        Find the position of the time index of a variable, if it is indexed by the given time axis (and possibly a
+        second index, in either order)
+
+        :param keys: Set of indices of the variable
+        :param time: Time axis
+        :return: -1 if time is the only index, 0 or 1 for the position of time in the index tuple, None if the variable
+            is not indexed by this time axis
+        """
+        if keys == set(time):
+            return -1
+
+        if not all(isinstance(k, tuple) and len(k) == 2 for k in keys):
             return None
 
-        timeindex = pd.DatetimeIndex(start=start_time,
-                                     freq=str(
-                                         self.params['time_step'].v()) + 'S',
-                                     periods=len(result))
+        for pos in [0, 1]:
+            others = set(k[1 - pos] for k in keys)
+            if set(k[pos] for k in keys) == set(time) and len(keys) == len(others) * len(time):
+                return pos
+        return None
+
+    def _time_indexed_values(self, values, time):
+        """
+        Convert the values of a variable or parameter to arrays, if it is indexed by the given time axis
+
+        :param values: dict with the indices and values of the variable or parameter
+        :param time: Time axis
+        :return: dict with a suffix for the result name as keys ('' or '.' followed by the second index) and arrays as
+            values. None if the values are not indexed by this time axis.
+        """
+        keys = set(values)
+
+        if self.repr_days is not None:
+            if keys == set(product(time, self.REPR_DAYS)):
+                return {'': self.expand_repr_days(values, time)}
+            return None
+
+        if keys == set(time):
+            return {'': np.array([values[t] for t in time], dtype=np.float64)}
+
+        if not all(isinstance(k, tuple) and len(k) == 2 for k in keys):
+            return None
+
+        # Time and a second index (e.g. the line), in either order
+        for pos in [0, 1]:
+            others = sorted(set(k[1 - pos] for k in keys), key=str)
+            if set(k[pos] for k in keys) == set(time) and len(keys) == len(others) * len(time):
+                return {'.' + str(other): np.array([values[(t, other) if pos == 0 else (other, t)] for t in time],
+                                                   dtype=np.float64)
+                        for other in others}
+        return None
+
+    def expand_repr_days(self, values, time):
+        """
+        Map values indexed by time step and representative day to all days of the year
+
+        :param values: dict with (time step, representative day) as keys
+        :param time: Time steps within a day
+        :return: 1D array with the values for every time step of every day of the year
+        """
+        table = np.array([[values[t, c] for c in self.REPR_DAYS] for t in time], dtype=np.float64)
+        columns = [self.REPR_DAYS.index(self.repr_days[d]) for d in self.DAYS_OF_YEAR]
+        return table[:, columns].T.ravel()
+
+    def get_result(self, name, index, state, start_time):
+        result, resname = self.get_result_values(name, index, state)
+        if result is None:
+            return None
+
+        timeindex = ut.time_index(start_time, self.params['time_step'].v(), len(result))
 
         return pd.Series(data=result, index=timeindex, name=resname)
+
+
+def _replace_time(key, layout, t):
+    """
+    Index of a variable with the time step replaced by t, see Submodel._time_layout
+    """
+    if layout == -1:
+        return t
+    if layout == 0:
+        return t, key[1]
+    return key[0], t
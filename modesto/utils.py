@@ -3,12 +3,26 @@
 Utility functions needed for modesto
 """
 
+import hashlib
 import json
 import os.path
-from collections import OrderedDict
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 
+CACHE_VERSION = 1
+CACHE_DIRNAME = '.modesto_cache'
+_cache_dir = None
+
+ResampleCacheInfo = namedtuple('ResampleCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_resample_cache = OrderedDict()
+_resample_cache_lock = threading.Lock()
+_resample_cache_stats = {'hits': 0, 'misses': 0, 'maxsize': 128}
+
 
 def read_file(path, name, timestamp):
     """
@@ -31,7 +45,7 @@ def read_file(path, name, timestamp):
     return data
 
 
-def read_time_data(path, name, expand=False, expand_year=2014):
+def read_time_data(path, name, expand=False, expand_year=2014, cache=False, mmap=False):
     """
     Read a file that contains time data,
     first column should contain strings representing time in following format:
@@ -42,11 +56,23 @@ def read_time_data(path, name, expand=False, expand_year=2014):
     :param name: name of the file (add extension)
     :param expand: Boolean. Decides if data should wrap around itself such that optimizations at the very beginning or end of the year can be performed. Default False.
     :param expand_year: if expand=True, which year should be padded. All other data is removed. Default 2014.
+    :param cache: If True, the parsed data is stored in a binary cache, which is used instead of the file as long as
+        the file is not modified. Default False.
+    :param mmap: If True and cache is True, the cached data is memory-mapped instead of read into memory. The values
+        of the returned data frame are then read-only. Default False.
     :return: A dataframe
     """
 
-    df = read_file(path, name, timestamp=True)
-    df = df.astype('float')
+    df = None
+    if cache:
+        df = read_cached_time_data(path, name, mmap=mmap)
+
+    if df is None:
+        df = read_file(path, name, timestamp=True)
+        df = df.astype('float')
+
+        if cache:
+            write_cached_time_data(df, path, name)
 
     assert isinstance(expand_year, int), 'Integer is expected for expand_year.'
 
@@ -56,6 +82,130 @@ def read_time_data(path, name, expand=False, expand_year=2014):
     return df
 
 
+def set_cache_dir(cache_dir=None):
+    """
+    Set the directory in which the binary cache of time data files is stored.
+
+    :param cache_dir: Cache directory. If None (default), the cache is stored in a .modesto_cache folder next to the
+        data file, or in the user cache directory if that folder is not writable.
+    :return:
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def _cache_location(fname, writable=False):
+    """
+    Directory in which the cache of a data file is stored
+
+    :param fname: Path of the data file
+    :param writable: If True, only return a location that can be written to
+    :return: Path of the cache directory, None if no suitable location is found
+    """
+    fname = os.path.abspath(fname)
+    key = os.path.basename(fname) + '.' + hashlib.sha1(fname.encode()).hexdigest()[:12]
+
+    if _cache_dir is not None:
+        candidates = [_cache_dir]
+    else:
+        candidates = [os.path.join(os.path.dirname(fname), CACHE_DIRNAME),
+                      os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                                   'modesto')]
+
+    for candidate in candidates:
+        location = os.path.join(candidate, key)
+        if not writable:
+            if os.path.isfile(os.path.join(location, 'meta.json')):
+                return location
+            continue
+        try:
+            os.makedirs(location, exist_ok=True)
+        except OSError:
+            continue
+        if os.access(location, os.W_OK):
+            return location
+
+    return None
+
+
+def read_cached_time_data(path, name, mmap=False):
+    """
+    Read time data from the binary cache of a data file
+
+    :param path: Location of the file
+    :param name: name of the file (add extension)
+    :param mmap: If True, memory-map the values instead of reading them
+    :return: A dataframe, None if there is no valid cache for the file
+    """
+    fname = os.path.join(path, name)
+    if not os.path.isfile(fname):
+        raise IOError(fname + ' does not exist')
+
+    location = _cache_location(fname)
+    if location is None:
+        return None
+
+    try:
+        with open(os.path.join(location, 'meta.json')) as filehandle:
+            meta = json.load(filehandle)
+        stat = os.stat(fname)
+        if meta['version'] != CACHE_VERSION or meta['mtime'] != stat.st_mtime_ns or meta['size'] != stat.st_size:
+            return None
+
+        index = np.load(os.path.join(location, 'index.npy'))
+        values = np.load(os.path.join(location, 'values.npy'), mmap_mode='r' if mmap else None)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Values are stored column by column, the transposed array is used as is by the data frame
+    return pd.DataFrame(values.T,
+                        index=pd.DatetimeIndex(index.view('datetime64[ns]'), name=meta['index_name']),
+                        columns=meta['columns'], copy=False)
+
+
+def write_cached_time_data(df, path, name):
+    """
+    Store time data in the binary cache of a data file. The index is stored as int64 nanoseconds, the values as a
+    float64 array with one contiguous row per column.
+
+    :param df: Data frame with a DatetimeIndex and float columns, as read from the file
+    :param path: Location of the file
+    :param name: name of the file (add extension)
+    :return: True if the cache was written
+    """
+    fname = os.path.join(path, name)
+
+    if not isinstance(df.index, pd.DatetimeIndex) or df.index.tz is not None:
+        return False
+
+    location = _cache_location(fname, writable=True)
+    if location is None:
+        return False
+
+    stat = os.stat(fname)
+    meta = {'version': CACHE_VERSION,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'index_name': df.index.name,
+            'columns': [str(column) for column in df.columns]}
+
+    try:
+        # Write to temporary files first, such that concurrent readers never see a partial cache
+        for key, array in [('index', df.index.values.astype('datetime64[ns]').view('int64')),
+                           ('values', np.ascontiguousarray(df.values.T, dtype=np.float64))]:
+            tmp = os.path.join(location, key + '.tmp.npy')
+            np.save(tmp, array)
+            os.replace(tmp, os.path.join(location, key + '.npy'))
+        tmp = os.path.join(location, 'meta.json.tmp')
+        with open(tmp, 'w') as filehandle:
+            json.dump(meta, filehandle)
+        os.replace(tmp, os.path.join(location, 'meta.json'))
+    except OSError:
+        return False
+
+    return True
+
+
 def read_xlsx_data(filepath, use_sheet=None, index_col=0):
     """
     Read data contained in an excel file
@@ -76,7 +226,9 @@ def read_xlsx_data(filepath, use_sheet=None, index_col=0):
 
 def resample(df, new_sample_time, old_sample_time=None, method='interpolation'):
     """
-    Resamples data
+    Resamples data. Results are kept in a process-wide LRU cache, such that the same data is only resampled once for
+    each new sampling time and method. The returned data frame may be shared and should not be modified in place.
+
     :param old_data: A data frame, containing the time data
     :param old_sample_time: The original sampling time
     :param new_sample_time: The new sampling time to which the data needs to be converted
@@ -89,16 +241,106 @@ def resample(df, new_sample_time, old_sample_time=None, method='interpolation'):
 
     if (new_sample_time == old_sample_time) or (new_sample_time is None):
         return df
+
+    if _resample_cache_stats['maxsize'] == 0:
+        return _resample(df, new_sample_time, old_sample_time, method)
+
+    key = (_fingerprint(df), old_sample_time, new_sample_time, method)
+
+    with _resample_cache_lock:
+        if key in _resample_cache:
+            _resample_cache.move_to_end(key)
+            _resample_cache_stats['hits'] += 1
+            return _resample_cache[key]
+        _resample_cache_stats['misses'] += 1
+
+    resampled = _resample(df, new_sample_time, old_sample_time, method)
+
+    with _resample_cache_lock:
+        _resample_cache[key] = resampled
+        while len(_resample_cache) > _resample_cache_stats['maxsize']:
+            _resample_cache.popitem(last=False)
+
+    return resampled
+
+
+def _resample(df, new_sample_time, old_sample_time, method):
+    """
+    Resample data without using the cache
+
+    :param df: A data frame or series, containing the time data
+    :param new_sample_time: The new sampling time in seconds
+    :param old_sample_time: The original sampling time in seconds
+    :param method: The method resampling to be used
+    :return: The resampled data
+    """
+    rule = pd.Timedelta(seconds=new_sample_time)
+    if method == 'interpolation':
+        return df.resample(rule).interpolate(method='linear')
+    if method == 'pad' or new_sample_time < old_sample_time:
+        return df.resample(rule).ffill()
+    elif method == 'sum':
+        return df.resample(rule).sum()
+    else:
+        return df.resample(rule).mean()
+
+
+def _fingerprint(df):
+    """
+    Hash of the contents, index and labels of a data frame or series, used as resample cache key
+
+    :param df: pd.DataFrame or pd.Series
+    :return: str
+    """
+    if isinstance(df, pd.DataFrame):
+        labels = tuple(df.columns)
     else:
-        if method == 'interpolation':
-            upsampled = df.resample(str(new_sample_time) + 'S')
-            return upsampled.interpolate(method='linear')
-        if method == 'pad' or new_sample_time < old_sample_time:
-            return df.resample(str(new_sample_time) + 'S').pad()
-        elif method == 'sum':
-            return df.resample(str(new_sample_time) + 'S').sum()
-        else:
-            return df.resample(str(new_sample_time) + 'S').mean()
+        labels = df.name
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values)
+    digest.update(repr((type(df).__name__, labels, len(df))).encode())
+    return digest.hexdigest()
+
+
+def resample_cache_info():
+    """
+    Statistics of the resample cache
+
+    :return: ResampleCacheInfo named tuple with the number of hits and misses, the maximum size and the current size
+    """
+    with _resample_cache_lock:
+        return ResampleCacheInfo(_resample_cache_stats['hits'],
+                                 _resample_cache_stats['misses'],
+                                 _resample_cache_stats['maxsize'],
+                                 len(_resample_cache))
+
+
+def clear_resample_cache():
+    """
+    Remove all entries from the resample cache and reset its statistics
+
+    :return:
+    """
+    with _resample_cache_lock:
+        _resample_cache.clear()
+        _resample_cache_stats['hits'] = 0
+        _resample_cache_stats['misses'] = 0
+
+
+def set_resample_cache_size(maxsize):
+    """
+    Change the maximum number of resampled data frames kept in the cache. Least recently used entries are removed
+    first.
+
+    :param maxsize: Maximum number of entries, 0 disables the cache
+    :return:
+    """
+    if maxsize < 0:
+        raise ValueError('The size of the resample cache cannot be negative')
+
+    with _resample_cache_lock:
+        _resample_cache_stats['maxsize'] = maxsize
+        while len(_resample_cache) > maxsize:
+            _resample_cache.popitem(last=False)
 
 
 def read_period_data(path, name, time_step, horizon, start_time, method=None, sep=' '):
@@ -141,6 +383,19 @@ def select_period_data(df, horizon, time_step, start_time, method=None):
     return resample(df=df, new_sample_time=time_step, method=method)
 
 
+@lru_cache(maxsize=64)
+def time_index(start_time, time_step, periods):
+    """
+    Regular time index, shared between all results with the same time axis
+
+    :param start_time: First time stamp (pd.Timestamp)
+    :param time_step: Time between two time stamps in seconds
+    :param periods: Number of time stamps
+    :return: pd.DatetimeIndex
+    """
+    return pd.date_range(start=start_time, freq=pd.Timedelta(seconds=time_step), periods=periods)
+
+
 def expand_df(df, start_year=2014):
     """
     Pad a given data frame with data for one year with a month of data for the previous and next year. The first and last month are repeated respectively.
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Snapshots of the variable values of a modesto model, to warm start later optimizations
+"""
+
+import pickle
+
+import pandas as pd
+
+
+class Snapshot(object):
+    def __init__(self, start_time, time_step, values):
+        """
+        Values of all variables of a model, together with the time axis they belong to. Restoring a snapshot onto a
+        model with another start time shifts the values in time, restoring it onto a model with another time step
+        interpolates them (see Modesto.restore).
+
+        :param start_time: Start time of the model (pd.Timestamp)
+        :param time_step: Time step of the model in seconds
+        :param values: dict with the component names as keys and the variable values of the components as values (see
+            Submodel.get_var_values)
+        """
+        self.start_time = pd.Timestamp(start_time)
+        self.time_step = time_step
+        self.values = values
+
+    def position(self, start_time, time_step):
+        """
+        Map the time steps of another time axis to the time steps of this snapshot
+
+        :param start_time: Start time of the other time axis
+        :param time_step: Time step of the other time axis in seconds
+        :return: Function mapping a time step to the (fractional) time step of this snapshot. None if both time axes
+            are the same.
+        """
+        offset = (pd.Timestamp(start_time) - self.start_time).total_seconds()
+        if offset == 0 and time_step == self.time_step:
+            return None
+        return lambda t: (offset + t * time_step) / self.time_step
+
+    def save(self, fname):
+        """
+        Save the snapshot to a file
+
+        :param fname: File name
+        :return:
+        """
+        with open(fname, 'wb') as f:
+            pickle.dump({'start_time': self.start_time, 'time_step': self.time_step, 'values': self.values}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Load a snapshot from a file
+
+        :param fname: File name
+        :return: Snapshot
+        """
+        with open(fname, 'rb') as f:
+            data = pickle.load(f)
+        return cls(data['start_time'], data['time_step'], data['values'])